@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import TrafficSignal, TrafficLog, DetectionArea, VideoSource, SystemSettings, CongestionEvent, SignalTimingLog, JunctionSignals, TrafficData
+from .models import TrafficSignal, TrafficLog, DetectionArea, VideoSource, SystemSettings, CongestionEvent, SignalTimingLog, JunctionSignals, JunctionLink, TrafficData, TrafficDataRollup
 
 
 # Register your models here.
@@ -11,4 +11,6 @@ admin.site.register(SystemSettings)
 admin.site.register(CongestionEvent)
 admin.site.register(SignalTimingLog)
 admin.site.register(JunctionSignals)
-admin.site.register(TrafficData)
\ No newline at end of file
+admin.site.register(JunctionLink)
+admin.site.register(TrafficData)
+admin.site.register(TrafficDataRollup)
\ No newline at end of file
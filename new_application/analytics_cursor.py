@@ -0,0 +1,118 @@
+import json
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+from django.utils import timezone
+
+from . import analytics_thread
+
+# Sections of the analytics payload that hold current values rather than series
+VALUE_SECTIONS = ('vehicle_distribution', 'avg_confidences', 'congestion_data')
+
+
+def current_values(num_signals=4):
+    congestion = analytics_thread.get_current_congestion_data(num_signals=num_signals)
+    return {
+        'vehicle_distribution': analytics_thread.get_current_traffic_distribution_smoothed(window_seconds=30, num_signals=num_signals),
+        'avg_confidences': analytics_thread.get_current_signal_metadata(num_signals=num_signals),
+        # Keyed by signal index like the list sections, so all three diff the same way
+        'congestion_data': [congestion.get(i) for i in range(num_signals)],
+    }
+
+
+def changed_values(previous, current):
+    """{section: {signal_idx: value}} for every value that differs from `previous` (all of them if None)"""
+    changes = {}
+    for section in VALUE_SECTIONS:
+        old = (previous or {}).get(section) or []
+        changes[section] = {
+            i: value for i, value in enumerate(current[section])
+            if i >= len(old) or old[i] != value
+        }
+    return changes
+
+
+class AnalyticsCursorStore:
+    """Current values last sent to clients, so a poll can return only what changed.
+
+    Entries are keyed by a hash of their content: clients that saw the same state
+    share one entry, and the store stays small however many dashboards poll.
+    A cursor whose entry was evicted (or was issued by another process) still
+    works; the client is then sent every value once.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, values):
+        token = hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+        with self.lock:
+            self.entries[token] = values
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return token
+
+    def get(self, token):
+        with self.lock:
+            values = self.entries.get(token)
+            if values is not None:
+                self.entries.move_to_end(token)
+            return values
+
+
+def format_cursor(sampled_until, token):
+    return f'{int(round(sampled_until.timestamp() * 1000))}.{token}'
+
+
+def parse_cursor(cursor):
+    """(sample time, token) for a cursor from format_cursor, None if it is malformed"""
+    millis, _, token = (cursor or '').partition('.')
+    try:
+        return datetime.datetime.fromtimestamp(int(millis) / 1000, tz=datetime.timezone.utc), token
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def get_analytics_since(cursor, store, duration_minutes=60, num_signals=4):
+    """Dashboard analytics as a delta from `cursor`.
+
+    Without a usable cursor the whole window is returned (`reset`), closed minutes
+    from the rollups. Otherwise only points sampled since the cursor and the
+    current values that changed are returned. Every response carries the cursor
+    for the next poll.
+
+    The cursor is a sample time, and points only become visible once they are
+    settled (see analytics_thread.settled_until): a row that commits late
+    is still returned, where an id cursor could already have moved past it.
+    """
+    start_time = timezone.now() - datetime.timedelta(minutes=duration_minutes)
+    until = analytics_thread.settled_until()
+    parsed = parse_cursor(cursor)
+    values = current_values(num_signals)
+    token = store.put(values)
+
+    if parsed is None:
+        trends, sampled_until = analytics_thread.get_rollup_backed_trends(start_time, until, num_signals=num_signals)
+        return dict(trends, cursor=format_cursor(sampled_until, token), reset=True, **values)
+
+    after, previous_token = parsed
+    trends = analytics_thread.get_traffic_trends_since(after, until, start_time, num_signals=num_signals)
+    return dict(
+        trends, cursor=format_cursor(max(after, until), token), reset=False,
+        changed=changed_values(store.get(previous_token), values)
+    )
+
+
+# Global instance per process
+analytics_cursors = None
+
+def get_analytics_cursors():
+    """Get or create the global analytics cursor store"""
+    global analytics_cursors
+    if analytics_cursors is None:
+        analytics_cursors = AnalyticsCursorStore()
+    return analytics_cursors
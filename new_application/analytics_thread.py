@@ -1,15 +1,15 @@
 import datetime
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Avg, Max
-from django.db import transaction, OperationalError
-import time
+from django.db.models import Avg, OuterRef, Subquery
 
 # Make sure to import your models correctly based on their location
-from .models import TrafficSignal, TrafficData, CongestionEvent 
+from .models import TrafficSignal, TrafficData, TrafficDataRollup, CongestionEvent 
+from .db_utils import run_with_db_retry
+from .congestion import LEVELS, LEVEL_COLORS
 
 
-def get_historical_traffic_trends(duration_minutes=60, num_signals=4):
-    # ... (content of this function as provided in the previous detailed response) ...
+def get_historical_traffic_trends(duration_minutes=60, num_signals=4, iso_timestamps=True):
     end_time = timezone.now()
     start_time = end_time - datetime.timedelta(minutes=duration_minutes)
 
@@ -17,166 +17,216 @@ def get_historical_traffic_trends(duration_minutes=60, num_signals=4):
     temp_vehicle_counts = {i: [] for i in range(num_signals)}
     temp_green_times = {i: [] for i in range(num_signals)}
 
-    MAX_RETRIES = 3
-    RETRY_DELAY = 0.5
-
-    for attempt in range(MAX_RETRIES):
-        try:
-            with transaction.atomic():
-                snapshots = TrafficData.objects.filter(
-                    timestamp__range=(start_time, end_time)
-                ).order_by('timestamp', 'signal__signal_id')
-
-                for s in snapshots:
-                    signal_idx = s.signal.signal_id
-                    if 0 <= signal_idx < num_signals:
-                        all_timestamps_set.add(s.timestamp)
-                        temp_vehicle_counts[signal_idx].append(s.vehicle_count)
-                        temp_green_times[signal_idx].append(s.green_time)
-                break
-        except OperationalError as e:
-            if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                print(f"get_historical_traffic_trends: DB locked (attempt {attempt + 1}). Retrying in {RETRY_DELAY}s.")
-                time.sleep(RETRY_DELAY)
-                RETRY_DELAY *= 1.5
-            else:
-                print(f"get_historical_traffic_trends: Persistent database error after {attempt + 1} attempts: {e}")
-                return {
-                    'timestamps': [],
-                    'vehicle_counts': [[] for _ in range(num_signals)],
-                    'green_times': [[] for _ in range(num_signals)],
-                }
-        except Exception as e:
-            print(f"Error fetching historical traffic trends: {e}")
-            return {
-                'timestamps': [],
-                'vehicle_counts': [[] for _ in range(num_signals)],
-                'green_times': [[] for _ in range(num_signals)],
-            }
+    # Single query over the (timestamp) index; values_list avoids building a model
+    # instance (and lazily fetching its signal) for every row
+    def fetch_snapshots():
+        return list(TrafficData.objects.filter(
+            timestamp__range=(start_time, end_time)
+        ).order_by('timestamp', 'signal__signal_id').values_list(
+            'timestamp', 'signal__signal_id', 'vehicle_count', 'green_time'
+        ))
+
+    try:
+        snapshots = run_with_db_retry('get_historical_traffic_trends', fetch_snapshots)
+    except Exception as e:
+        print(f"Error fetching historical traffic trends: {e}")
+        return {
+            'timestamps': [],
+            'vehicle_counts': [[] for _ in range(num_signals)],
+            'green_times': [[] for _ in range(num_signals)],
+        }
+
+    for timestamp, signal_idx, vehicle_count, green_time in snapshots:
+        if 0 <= signal_idx < num_signals:
+            all_timestamps_set.add(timestamp)
+            temp_vehicle_counts[signal_idx].append(vehicle_count)
+            temp_green_times[signal_idx].append(green_time)
 
     all_timestamps_sorted = sorted(list(all_timestamps_set))
     
     return {
-        'timestamps': [ts.isoformat() for ts in all_timestamps_sorted], # Convert datetime to ISO string for JSON
+        # ISO strings for JSON; the compact wire format encodes the datetimes itself
+        'timestamps': [ts.isoformat() for ts in all_timestamps_sorted] if iso_timestamps else all_timestamps_sorted,
         'vehicle_counts': [temp_vehicle_counts[i] for i in range(num_signals)],
         'green_times': [temp_green_times[i] for i in range(num_signals)],
     }
 
 
+def settled_until():
+    """Newest sample time the analytics cursor may move past (millisecond precision).
+
+    Detection processes insert concurrently and in batches, so rows do not commit
+    in id or sample-time order. A row is only handed out once its sample time is
+    ANALYTICS_COMMIT_LAG_SECONDS old, by which point it is assumed committed.
+    """
+    lag = getattr(settings, 'ANALYTICS_COMMIT_LAG_SECONDS', 10.0)
+    until = timezone.now() - datetime.timedelta(seconds=lag)
+    return until.replace(microsecond=until.microsecond - until.microsecond % 1000)
+
+
+def _collect_trends(points, num_signals):
+    """Trend arrays from (timestamp, signal_idx, vehicle_count, green_time) rows in time order"""
+    timestamps = set()
+    vehicle_counts = [[] for _ in range(num_signals)]
+    green_times = [[] for _ in range(num_signals)]
+    for timestamp, signal_idx, vehicle_count, green_time in points:
+        if 0 <= signal_idx < num_signals:
+            timestamps.add(timestamp)
+            vehicle_counts[signal_idx].append(vehicle_count)
+            green_times[signal_idx].append(green_time)
+    return {
+        'timestamps': [ts.isoformat() for ts in sorted(timestamps)],
+        'vehicle_counts': vehicle_counts,
+        'green_times': green_times,
+    }
+
+
+def get_traffic_trends_since(after, until, start_time, num_signals=4):
+    """Raw points sampled after `after` (None: from the window start) up to and including `until`"""
+    def fetch_points():
+        rows = TrafficData.objects.filter(timestamp__gte=start_time, timestamp__lte=until)
+        if after is not None:
+            rows = rows.filter(timestamp__gt=after)
+        return list(rows.order_by('timestamp', 'signal__signal_id').values_list(
+            'timestamp', 'signal__signal_id', 'vehicle_count', 'green_time'
+        ))
+
+    return _collect_trends(run_with_db_retry('get_traffic_trends_since', fetch_points), num_signals)
+
+
+def get_rollup_backed_trends(start_time, until, num_signals=4):
+    """Trends for the window from `start_time` up to `until`, and the sample time to continue from.
+
+    Minutes already rolled up come from the 1 minute rollups (one averaged point
+    per signal and minute); only the rest of the window is read raw.
+    """
+    resolution = TrafficDataRollup.RESOLUTION_1MIN
+    epoch = int(start_time.timestamp())
+    first_bucket = datetime.datetime.fromtimestamp(epoch - epoch % resolution, tz=datetime.timezone.utc)
+
+    def fetch_buckets():
+        return list(TrafficDataRollup.objects.filter(
+            resolution=resolution, bucket_start__gte=first_bucket
+        ).order_by('bucket_start', 'signal__signal_id').values_list(
+            'bucket_start', 'signal__signal_id', 'vehicle_count_sum', 'samples', 'green_time_sum', 'green_time_samples'
+        ))
+
+    buckets = run_with_db_retry('get_rollup_backed_trends', fetch_buckets)
+    raw_from = start_time
+    if buckets:
+        raw_from = max(start_time, buckets[-1][0] + datetime.timedelta(seconds=resolution))
+
+    # The cursor must also cover rows inside rolled-up minutes, or the next delta would
+    # return them again as raw points
+    until = max(until, raw_from)
+    raw_trends = get_traffic_trends_since(None, until, raw_from, num_signals)
+    trends = _collect_trends([
+        (bucket, signal_idx, round(count_sum / samples, 1) if samples else 0,
+         round(green_sum / green_samples) if green_samples else 0)
+        for bucket, signal_idx, count_sum, samples, green_sum, green_samples in buckets
+    ], num_signals)
+    trends['timestamps'] += raw_trends['timestamps']
+    for i in range(num_signals):
+        trends['vehicle_counts'][i] += raw_trends['vehicle_counts'][i]
+        trends['green_times'][i] += raw_trends['green_times'][i]
+    trends['rolled_up_until'] = raw_from.isoformat() if buckets else None
+    return trends, until
+
+
 def get_current_traffic_distribution_smoothed(window_seconds=30, num_signals=4):
-    # ... (content of this function as provided in the previous detailed response) ...
     end_time = timezone.now()
     start_time = end_time - datetime.timedelta(seconds=window_seconds)
 
     distribution = [0] * num_signals
 
-    MAX_RETRIES = 3
-    RETRY_DELAY = 0.5
-
-    for attempt in range(MAX_RETRIES):
+    def fetch_averages():
+        return list(TrafficData.objects.filter(
+            timestamp__range=(start_time, end_time)
+        ).values_list('signal__signal_id').annotate(
+            avg_vehicle_count=Avg('vehicle_count')
+        ).order_by('signal__signal_id'))
+
+    try:
+        signal_averages = run_with_db_retry('get_current_traffic_distribution_smoothed', fetch_averages)
+        for signal_idx, avg_vehicle_count in signal_averages:
+            if 0 <= signal_idx < num_signals:
+                distribution[signal_idx] = int(avg_vehicle_count or 0)
+    except Exception as e:
+        print(f"Error fetching smoothed traffic distribution: {e}")
+
+    # Fall back to the live count for signals without recent snapshots, in one query
+    missing = [i for i in range(num_signals) if distribution[i] == 0]
+    if missing:
         try:
-            with transaction.atomic():
-                signal_averages = TrafficData.objects.filter(
-                    timestamp__range=(start_time, end_time)
-                ).values('signal__signal_id').annotate(
-                    avg_vehicle_count=Avg('vehicle_count')
-                ).order_by('signal__signal_id')
-
-                for entry in signal_averages:
-                    signal_idx = entry['signal__signal_id']
-                    if 0 <= signal_idx < num_signals:
-                        distribution[signal_idx] = int(entry['avg_vehicle_count'] or 0)
-                break
-        except OperationalError as e:
-            if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                print(f"get_current_traffic_distribution_smoothed: DB locked (attempt {attempt + 1}). Retrying in {RETRY_DELAY}s.")
-                time.sleep(RETRY_DELAY)
-                RETRY_DELAY *= 1.5
-            else:
-                print(f"get_current_traffic_distribution_smoothed: Persistent database error after {attempt + 1} attempts: {e}")
-                break
+            for signal_idx, vehicle_count in TrafficSignal.objects.filter(
+                signal_id__in=missing
+            ).values_list('signal_id', 'vehicle_count'):
+                distribution[signal_idx] = vehicle_count
         except Exception as e:
-            print(f"Error fetching smoothed traffic distribution: {e}")
-            break
-
-    for i in range(num_signals):
-        if distribution[i] == 0:
-            try:
-                latest_signal_data = TrafficSignal.objects.get(signal_id=i)
-                distribution[i] = latest_signal_data.vehicle_count
-            except TrafficSignal.DoesNotExist:
-                distribution[i] = 0
+            print(f"Error fetching live vehicle counts: {e}")
 
     return distribution
 
 
 def get_current_signal_metadata(num_signals=4):
-    # ... (content of this function as provided in the previous detailed response) ...
     avg_confidences = [0.0] * num_signals
-    
-    MAX_RETRIES = 3
-    RETRY_DELAY = 0.5
 
-    for attempt in range(MAX_RETRIES):
-        try:
-            with transaction.atomic():
-                signals = TrafficSignal.objects.all().order_by('signal_id')
-                for signal in signals:
-                    signal_idx = signal.signal_id
-                    if 0 <= signal_idx < num_signals:
-                        avg_confidences[signal_idx] = signal.avg_confidence
-                break
-        except OperationalError as e:
-            if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                print(f"get_current_signal_metadata: DB locked (attempt {attempt + 1}). Retrying in {RETRY_DELAY}s.")
-                time.sleep(RETRY_DELAY)
-                RETRY_DELAY *= 1.5
-            else:
-                print(f"get_current_signal_metadata: Persistent database error after {attempt + 1} attempts: {e}")
-                break
-        except Exception as e:
-            print(f"Error fetching current signal metadata: {e}")
-            break
+    def fetch_confidences():
+        return list(TrafficSignal.objects.filter(
+            signal_id__range=(0, num_signals - 1)
+        ).values_list('signal_id', 'avg_confidence'))
+
+    try:
+        for signal_idx, avg_confidence in run_with_db_retry('get_current_signal_metadata', fetch_confidences):
+            avg_confidences[signal_idx] = avg_confidence
+    except Exception as e:
+        print(f"Error fetching current signal metadata: {e}")
 
     return avg_confidences
 
 
 def get_current_congestion_data(num_signals=4):
-    # ... (content of this function as provided in the previous detailed response) ...
     congestion_data = {}
-    MAX_RETRIES = 3
-    RETRY_DELAY = 0.5
+
+    # Latest event per signal as correlated subqueries on the (signal, timestamp) index,
+    # so all signals are answered by one query instead of one query per signal
+    latest_event = CongestionEvent.objects.filter(signal=OuterRef('pk')).order_by('-timestamp')
+
+    def fetch_latest_events():
+        return list(TrafficSignal.objects.filter(
+            signal_id__range=(0, num_signals - 1)
+        ).annotate(
+            latest_severity=Subquery(latest_event.values('severity')[:1]),
+            latest_score=Subquery(latest_event.values('score')[:1]),
+            latest_color=Subquery(latest_event.values('color')[:1]),
+            latest_resolution=Subquery(latest_event.values('resolution_time')[:1]),
+        ).values_list('signal_id', 'latest_severity', 'latest_score', 'latest_color', 'latest_resolution',
+                      'congestion_score'))
+
+    try:
+        latest_events = run_with_db_retry('get_current_congestion_data', fetch_latest_events)
+    except Exception as e:
+        print(f"Error fetching congestion data: {e}")
+        return congestion_data
 
     for i in range(num_signals):
-        for attempt in range(MAX_RETRIES):
-            try:
-                with transaction.atomic():
-                    latest_event = CongestionEvent.objects.filter(
-                        signal__signal_id=i
-                    ).order_by('-timestamp').first()
-
-                    if latest_event:
-                        congestion_data[i] = {
-                            'level': latest_event.severity,
-                            'score': latest_event.score,
-                            'color': latest_event.color,
-                        }
-                    else:
-                        congestion_data[i] = {
-                            'level': 'UNKNOWN',
-                            'score': 0.0,
-                            'color': '#bdc3c7',
-                        }
-                    break
-            except OperationalError as e:
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    print(f"get_current_congestion_data (Signal {i}): DB locked (attempt {attempt + 1}). Retrying in {RETRY_DELAY}s.")
-                    time.sleep(RETRY_DELAY)
-                    RETRY_DELAY *= 1.5
-                else:
-                    print(f"get_current_congestion_data (Signal {i}): Persistent database error after {attempt + 1} attempts: {e}")
-                    break
-            except Exception as e:
-                print(f"Error fetching congestion data for Signal {i}: {e}")
-                break
-    return congestion_data
\ No newline at end of file
+        congestion_data[i] = {
+            'level': 'UNKNOWN',
+            'score': 0.0,
+            'color': '#bdc3c7',
+        }
+    for signal_idx, severity, score, color, resolution_time, current_score in latest_events:
+        # Events are only written on level changes; a resolved latest event means congestion cleared
+        if severity is not None and resolution_time is not None:
+            congestion_data[signal_idx] = {
+                'level': LEVELS[0],
+                'score': current_score,
+                'color': LEVEL_COLORS[LEVELS[0]],
+            }
+        elif severity is not None:
+            congestion_data[signal_idx] = {
+                'level': severity,
+                'score': score,
+                'color': color,
+            }
+    return congestion_data
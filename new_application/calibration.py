@@ -0,0 +1,43 @@
+import numpy as np
+import cv2
+
+# Width of one traffic lane, used to turn a ground area into lane-metres
+DEFAULT_LANE_WIDTH = 3.5
+
+
+def compute_homography(image_points, ground_points):
+    """3x3 image-to-ground homography (as nested lists) from at least 4 point pairs, None if degenerate.
+
+    `ground_points` are in metres on the road plane, e.g. measured from a site
+    plan or from lane markings of known length.
+    """
+    if len(image_points) < 4 or len(image_points) != len(ground_points):
+        return None
+    source = np.asarray(image_points, dtype=np.float32).reshape(-1, 2)
+    target = np.asarray(ground_points, dtype=np.float32).reshape(-1, 2)
+    homography, _ = cv2.findHomography(source, target)
+    if homography is None or not np.isfinite(homography).all() or abs(np.linalg.det(homography)) < 1e-12:
+        return None
+    return homography.tolist()
+
+
+def to_ground(homography, points):
+    """Ground-plane coordinates (metres) of image points"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+    return cv2.perspectiveTransform(points, np.asarray(homography, dtype=np.float64)).reshape(-1, 2)
+
+
+def ground_area(homography, polygon):
+    """Area in square metres of an image polygon projected onto the road plane"""
+    if not homography or len(polygon) < 3:
+        return 0.0
+    ground = to_ground(homography, polygon)
+    x, y = ground[:, 0], ground[:, 1]
+    return float(abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2)
+
+
+def lane_meters(homography, polygon, lane_width=DEFAULT_LANE_WIDTH):
+    """Total lane length (metres) covered by an image polygon; 0 without calibration"""
+    if not lane_width or lane_width <= 0:
+        return 0.0
+    return round(ground_area(homography, polygon) / lane_width, 2)
@@ -0,0 +1,131 @@
+import math
+import threading
+
+# Levels in increasing order, with the smoothed score at which each one is entered
+LEVELS = ('LOW', 'MODERATE', 'HIGH', 'SEVERE')
+ENTER_SCORES = {'MODERATE': 2.0, 'HIGH': 8.0, 'SEVERE': 20.0}
+LEVEL_COLORS = {'LOW': 'green', 'MODERATE': 'orange', 'HIGH': 'red', 'SEVERE': 'darkred'}
+
+
+# Calibrated scores are weighted vehicles per this many lane-metres
+CALIBRATED_SCORE_LENGTH = 100.0
+
+
+def congestion_score(vehicle_count, traffic_weight, area_size, lane_meters=None):
+    """Instantaneous congestion score of one detection result.
+
+    With a calibrated camera (`lane_meters` > 0) this is a perspective-free
+    density, comparable between cameras; otherwise it falls back to the
+    image-pixel density of `area_size`.
+    """
+    if lane_meters and lane_meters > 0:
+        return (vehicle_count * 0.3 + traffic_weight * 0.7) * CALIBRATED_SCORE_LENGTH / lane_meters
+
+    if area_size is None or area_size <= 0:
+        area_size = 1000  # Default area size to prevent division by zero
+
+    density = vehicle_count / area_size
+    weighted_density = traffic_weight / area_size
+    if area_size > 50000:
+        return (density * 10000) + (vehicle_count * 0.5) + (weighted_density * 0.3)
+    return (density * 0.3 + weighted_density * 0.7) * 1000
+
+
+class SignalCongestion:
+    """Smoothed score and current level of one approach"""
+
+    def __init__(self, signal_id):
+        self.signal_id = signal_id
+        self.score = None
+        self.last_time = None
+        self.level = LEVELS[0]
+        self.level_since = None
+        self.candidate = None  # level the score points to, while it is being held
+        self.candidate_since = None
+        self.event_id = None  # CongestionEvent of the current level, if one was recorded
+
+
+class CongestionEngine:
+    """Per-approach congestion levels from detection results.
+
+    Every sample updates the approach's exponentially smoothed score (time
+    constant `tau` seconds). A level is entered at its ENTER_SCORES threshold and
+    left only once the score drops below `exit_ratio` of it, and either change
+    must hold for `hold_seconds` on that approach's own clock before it counts.
+    `update` reports a transition only when the level actually changes.
+    """
+
+    def __init__(self, tau=10.0, exit_ratio=0.75, hold_seconds=5.0):
+        self.tau = tau
+        self.exit_ratio = exit_ratio
+        self.hold_seconds = hold_seconds
+        self.signals = {}
+        self.lock = threading.Lock()
+
+    def get(self, signal_id):
+        state = self.signals.get(signal_id)
+        if state is None:
+            state = self.signals[signal_id] = SignalCongestion(signal_id)
+        return state
+
+    def target_level(self, state):
+        """Level the smoothed score points to, given the current level (hysteresis)"""
+        index = LEVELS.index(state.level)
+        while index + 1 < len(LEVELS) and state.score >= ENTER_SCORES[LEVELS[index + 1]]:
+            index += 1
+        while index > 0 and state.score < ENTER_SCORES[LEVELS[index]] * self.exit_ratio:
+            index -= 1
+        return LEVELS[index]
+
+    def update(self, signal_id, vehicle_count, traffic_weight, area_size, now, lane_meters=None):
+        """Feed one detection result; returns the approach's level, score and any transition"""
+        raw = congestion_score(vehicle_count, traffic_weight, area_size, lane_meters)
+        with self.lock:
+            state = self.get(signal_id)
+            if state.score is None:
+                state.score, state.level_since = raw, now
+            elif now > state.last_time:
+                alpha = 1.0 - math.exp(-(now - state.last_time) / self.tau)
+                state.score += alpha * (raw - state.score)
+            state.last_time = now
+
+            transition = None
+            target = self.target_level(state)
+            if target == state.level:
+                state.candidate = state.candidate_since = None
+            else:
+                if target != state.candidate:
+                    state.candidate, state.candidate_since = target, now
+                if now - state.candidate_since >= self.hold_seconds:
+                    transition = {
+                        'previous': state.level,
+                        'previous_since': state.level_since,
+                        'previous_event_id': state.event_id,
+                        'duration': now - state.level_since,
+                    }
+                    state.level, state.level_since = target, now
+                    state.candidate = state.candidate_since = None
+                    state.event_id = None
+
+            return {
+                'level': state.level,
+                'score': round(state.score, 2),
+                'color': LEVEL_COLORS[state.level],
+                'transition': transition,
+            }
+
+    def seed(self, signal_id, level, score, now, level_since=None, event_id=None):
+        """Resume an approach from its persisted level, e.g. after a worker restart"""
+        with self.lock:
+            state = self.get(signal_id)
+            state.level = level if level in LEVELS else LEVELS[0]
+            state.score = score
+            state.last_time = now
+            state.level_since = now if level_since is None else level_since
+            state.candidate = state.candidate_since = None
+            state.event_id = event_id
+
+    def set_event(self, signal_id, event_id):
+        """Remember the CongestionEvent recorded for the approach's current level"""
+        with self.lock:
+            self.get(signal_id).event_id = event_id
@@ -0,0 +1,152 @@
+import math
+import threading
+import numpy as np
+
+
+class SignalHistory:
+    """Fixed-size ring buffer of detection samples for one signal, with running EWMAs"""
+
+    def __init__(self, signal_id, capacity=600, short_tau=60.0, long_tau=600.0):
+        self.signal_id = signal_id
+        self.capacity = capacity
+        self.short_tau = short_tau  # seconds; follows the current level
+        self.long_tau = long_tau  # seconds; baseline the current level is compared with
+        self.timestamps = np.zeros(capacity)
+        self.counts = np.zeros(capacity, dtype=np.float32)
+        self.weights = np.zeros(capacity, dtype=np.float32)
+        self.size = 0
+        self.pos = 0
+        self.ewma_weight = 0.0
+        self.baseline_weight = 0.0
+        self.arrivals = 0.0  # vehicles that appeared in the area since the first sample
+        self.first_time = None
+        self.last_time = None
+        self.last_count = None
+
+    def update(self, timestamp, vehicle_count, traffic_weight):
+        """Add one detection sample"""
+        if self.last_time is None:
+            self.ewma_weight = self.baseline_weight = float(traffic_weight)
+            self.first_time = timestamp
+        else:
+            dt = timestamp - self.last_time
+            if dt <= 0:
+                return False
+            # Time-aware smoothing: irregular sample spacing gets the right weight
+            short_alpha = 1.0 - math.exp(-dt / self.short_tau)
+            long_alpha = 1.0 - math.exp(-dt / self.long_tau)
+            self.ewma_weight += short_alpha * (traffic_weight - self.ewma_weight)
+            self.baseline_weight += long_alpha * (traffic_weight - self.baseline_weight)
+            # Vehicles in the area are an occupancy, so arrivals are counted from increases
+            if vehicle_count > self.last_count:
+                self.arrivals += vehicle_count - self.last_count
+
+        self.timestamps[self.pos] = timestamp
+        self.counts[self.pos] = vehicle_count
+        self.weights[self.pos] = traffic_weight
+        self.pos = (self.pos + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.last_time = timestamp
+        self.last_count = vehicle_count
+        return True
+
+    def window(self):
+        """Buffered samples, oldest first, as (timestamps, counts, weights)"""
+        if self.size < self.capacity:
+            return self.timestamps[:self.size], self.counts[:self.size], self.weights[:self.size]
+        order = np.r_[self.pos:self.capacity, 0:self.pos]
+        return self.timestamps[order], self.counts[order], self.weights[order]
+
+    def arrival_rate(self):
+        """Vehicles per minute entering the detection area, over the buffered window"""
+        if self.size < 2:
+            return 0.0
+        timestamps, counts, _ = self.window()
+        span = timestamps[-1] - timestamps[0]
+        if span <= 0:
+            return 0.0
+        increases = np.clip(np.diff(counts), 0, None).sum()
+        return float(increases * 60.0 / span)
+
+    def stats(self):
+        if self.size == 0:
+            return {'signal_id': self.signal_id, 'samples': 0}
+        _, counts, weights = self.window()
+        weight_p50, weight_p90 = np.percentile(weights, [50, 90])
+        count_p50, count_p90 = np.percentile(counts, [50, 90])
+        return {
+            'signal_id': self.signal_id,
+            'samples': self.size,
+            'ewma_weight': round(self.ewma_weight, 2),
+            'baseline_weight': round(self.baseline_weight, 2),
+            'weight_p50': round(float(weight_p50), 2),
+            'weight_p90': round(float(weight_p90), 2),
+            'count_p50': round(float(count_p50), 1),
+            'count_p90': round(float(count_p90), 1),
+            'arrival_rate_per_min': round(self.arrival_rate(), 2),
+        }
+
+
+class ControllerRegistry:
+    """Long-lived per-signal traffic history owned by the control worker.
+
+    Samples come from the detection results the control loop already reads each
+    tick (vehicle_count/traffic_weight on the signal rows), thinned to one per
+    `sample_interval`, so keeping the history costs no extra queries.
+    """
+
+    def __init__(self, sample_interval=1.0, capacity=600, min_trend_samples=30):
+        self.sample_interval = sample_interval
+        self.capacity = capacity
+        self.min_trend_samples = min_trend_samples
+        self.histories = {}
+        self.lock = threading.Lock()
+
+    def get(self, signal_id):
+        history = self.histories.get(signal_id)
+        if history is None:
+            history = self.histories[signal_id] = SignalHistory(signal_id, self.capacity)
+        return history
+
+    def update(self, signal_id, timestamp, vehicle_count, traffic_weight):
+        with self.lock:
+            return self.get(signal_id).update(timestamp, vehicle_count, traffic_weight)
+
+    def observe(self, signals, timestamp):
+        """Record the current detection values of each signal, at most once per sample_interval"""
+        with self.lock:
+            for signal in signals:
+                history = self.get(signal.signal_id)
+                if history.last_time is None or timestamp - history.last_time >= self.sample_interval:
+                    history.update(timestamp, signal.vehicle_count, signal.traffic_weight)
+
+    def warm_load(self, samples):
+        """Seed the histories from (signal_id, timestamp, vehicle_count, traffic_weight) rows, oldest first"""
+        loaded = 0
+        with self.lock:
+            for signal_id, timestamp, vehicle_count, traffic_weight in samples:
+                history = self.get(signal_id)
+                if history.last_time is None or timestamp - history.last_time >= self.sample_interval:
+                    loaded += history.update(timestamp, vehicle_count, traffic_weight)
+        return loaded
+
+    def trend_baselines(self, signal_ids):
+        """Long-run traffic weight per signal for trend detection; NaN until enough samples exist"""
+        with self.lock:
+            baselines = []
+            for signal_id in signal_ids:
+                history = self.histories.get(signal_id)
+                if history is None or history.size < self.min_trend_samples:
+                    baselines.append(math.nan)
+                else:
+                    baselines.append(history.baseline_weight)
+            return np.array(baselines, dtype=float)
+
+    def arrival_totals(self):
+        """Cumulative arrivals per signal, for rate estimators that difference them"""
+        with self.lock:
+            return {signal_id: history.arrivals for signal_id, history in self.histories.items()}
+
+    def stats(self):
+        with self.lock:
+            return {signal_id: history.stats() for signal_id, history in sorted(self.histories.items())}
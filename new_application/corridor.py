@@ -0,0 +1,331 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+import numpy as np
+from django.db import OperationalError
+from django.utils import timezone
+
+from .models import JunctionSignals, JunctionLink, TrafficData
+from .db_utils import refresh_worker_connection, release_worker_connection
+
+
+def webster_cycle(lost_time, flow_ratio_sum, min_cycle=40.0, max_cycle=150.0):
+    """Webster's optimum cycle length C = (1.5 L + 5) / (1 - Y), for arrays of junctions"""
+    lost_time = np.asarray(lost_time, dtype=float)
+    flow_ratio_sum = np.asarray(flow_ratio_sum, dtype=float)
+    spare = 1.0 - flow_ratio_sum
+    cycle = np.divide(1.5 * lost_time + 5.0, spare, out=np.full_like(lost_time, max_cycle), where=spare > 0.05)
+    return np.clip(cycle, min_cycle, max_cycle)
+
+
+def webster_splits(cycle_length, lost_time, flow_ratios, min_green, max_green):
+    """Effective green per phase in proportion to its flow ratio"""
+    flow_ratios = np.asarray(flow_ratios, dtype=float)
+    total = flow_ratios.sum()
+    shares = flow_ratios / total if total > 0 else np.full(len(flow_ratios), 1.0 / len(flow_ratios))
+    green = (cycle_length - lost_time) * shares
+    return np.clip(np.round(green), min_green, max_green).astype(np.int64)
+
+
+def corridor_offsets(junction_ids, links, cycle_length, root):
+    """Offsets (seconds, modulo the cycle) so a platoon leaving one junction at the start of its
+    cycle reaches the next one at the start of that junction's cycle.
+
+    `links` are (from_junction, to_junction, travel_time). Offsets are propagated
+    outwards from `root` along a breadth-first tree; links that would close a loop
+    are left to the junctions already fixed.
+    """
+    adjacency = {junction_id: [] for junction_id in junction_ids}
+    for from_id, to_id, travel_time in links:
+        if from_id in adjacency and to_id in adjacency:
+            adjacency[from_id].append((to_id, travel_time))
+            adjacency[to_id].append((from_id, -travel_time))
+
+    offsets = {root: 0.0}
+    queue = deque([root])
+    while queue:
+        junction_id = queue.popleft()
+        for neighbour, travel_time in adjacency[junction_id]:
+            if neighbour not in offsets:
+                offsets[neighbour] = (offsets[junction_id] + travel_time) % cycle_length
+                queue.append(neighbour)
+    return offsets
+
+
+def count_changes(timestamps, counts, start, bin_seconds, num_bins, direction):
+    """Vehicles entering (direction=1) or leaving (direction=-1) a detection area per time bin"""
+    changes = np.clip(direction * np.diff(counts), 0, None)
+    bins = ((timestamps[1:] - start) // bin_seconds).astype(np.int64)
+    valid = (bins >= 0) & (bins < num_bins)
+    series = np.zeros(num_bins)
+    np.add.at(series, bins[valid], changes[valid])
+    return series
+
+
+def estimate_travel_time(departures, arrivals, bin_seconds, min_lag=0.0, max_lag=300.0, min_correlation=0.2):
+    """Lag (seconds) at which downstream arrivals best follow upstream departures, or None.
+
+    Both inputs are per-bin counts on the same time grid; the lag is the peak of
+    their normalised cross-correlation within [min_lag, max_lag].
+    """
+    departures = np.asarray(departures, dtype=float) - np.mean(departures)
+    arrivals = np.asarray(arrivals, dtype=float) - np.mean(arrivals)
+    norm = np.sqrt((departures ** 2).sum() * (arrivals ** 2).sum())
+    if norm == 0:
+        return None
+
+    lags = np.arange(int(min_lag // bin_seconds), int(max_lag // bin_seconds) + 1)
+    lags = lags[lags < len(departures)]
+    if len(lags) == 0:
+        return None
+    # correlation[k] = sum departures[t] * arrivals[t + k]
+    full = np.correlate(arrivals, departures, mode='full')
+    correlation = full[len(departures) - 1 + lags] / norm
+    best = int(np.argmax(correlation))
+    if correlation[best] < min_correlation:
+        return None
+    return float(lags[best] * bin_seconds)
+
+
+def align_cycle(green, min_green, max_green, lost_time, cycle_length, offset=None, start_time=None, max_adjust=0.2):
+    """Fit one cycle's green times to the corridor cycle length.
+
+    With an offset, the cycle starting at `start_time` is also lengthened or
+    shortened (by at most `max_adjust` of the cycle) so the next cycle starts on
+    the junction's offset, which brings a drifting junction back into the wave
+    over a few cycles.
+    """
+    green = np.asarray(green, dtype=float)
+    min_green = np.asarray(min_green, dtype=float)
+    max_green = np.asarray(max_green, dtype=float)
+    target = cycle_length
+    if offset is not None and start_time is not None:
+        error = (start_time - offset) % cycle_length
+        if error > cycle_length / 2:
+            error -= cycle_length
+        # Started late: shorten this cycle; started early: lengthen it
+        target -= float(np.clip(error, -max_adjust * cycle_length, max_adjust * cycle_length))
+
+    available = target - float(np.sum(lost_time))
+    if green.sum() > 0:
+        green = green * available / green.sum()
+    green = np.clip(green, min_green, max_green)
+    # Clipping moves the total; give the difference to phases that still have room
+    for _ in range(3):
+        short = available - green.sum()
+        room = (max_green - green) if short > 0 else (green - min_green)
+        if abs(short) < 0.5 or room.sum() <= 0:
+            break
+        green = np.clip(green + np.sign(short) * room * min(1.0, abs(short) / room.sum()), min_green, max_green)
+    return np.round(green).astype(np.int64)
+
+
+class CorridorCoordinator:
+    """Plans common cycle lengths, splits and offsets for groups of linked junctions.
+
+    Junctions connected by JunctionLink rows form a corridor. Each junction's
+    Webster cycle is computed from measured arrival rates; the corridor runs the
+    longest of them, and offsets follow the (measured) travel times between
+    junctions so platoons meet consecutive greens. Offsets are relative to unix
+    time 0, so every process agrees on when a cycle should start.
+    """
+
+    def __init__(self, replan_interval=300.0, window_seconds=900.0, bin_seconds=2.0,
+                 min_cycle=40.0, max_cycle=150.0, saturation_flow=0.5, travel_time_smoothing=0.3):
+        self.replan_interval = replan_interval
+        self.window_seconds = window_seconds
+        self.bin_seconds = bin_seconds
+        self.min_cycle = min_cycle
+        self.max_cycle = max_cycle
+        self.saturation_flow = saturation_flow
+        self.travel_time_smoothing = travel_time_smoothing
+        self.latest_plan = {}  # junction_id -> plan dict
+        # Optional callable returning {signal_id: vehicles/second} that beats measured rates
+        self.rate_provider = None
+        self.lock = threading.Lock()
+        self.running = False
+        self.replan_thread = None
+        self.stop_event = threading.Event()
+
+    def _load_series(self, since):
+        """Detection samples per signal_id as (unix timestamps, vehicle counts) arrays"""
+        rows = TrafficData.objects.filter(timestamp__gte=since).order_by(
+            'signal__signal_id', 'timestamp'
+        ).values_list('signal__signal_id', 'timestamp', 'vehicle_count')
+        grouped = {}
+        for signal_id, timestamp, vehicle_count in rows:
+            grouped.setdefault(signal_id, ([], []))
+            grouped[signal_id][0].append(timestamp.timestamp())
+            grouped[signal_id][1].append(vehicle_count)
+        return {signal_id: (np.array(ts), np.array(counts, dtype=float)) for signal_id, (ts, counts) in grouped.items()}
+
+    def _arrival_rate(self, series):
+        timestamps, counts = series
+        span = timestamps[-1] - timestamps[0] if len(timestamps) > 1 else 0
+        if span <= 0:
+            return 0.0
+        return float(np.clip(np.diff(counts), 0, None).sum() / span)
+
+    def measure_travel_times(self, links, series, now):
+        """Update measured_travel_time of links with detectors at both ends; returns links changed"""
+        start = now - self.window_seconds
+        num_bins = int(self.window_seconds // self.bin_seconds)
+        changed = []
+        for link in links:
+            if link.from_signal_id is None or link.to_signal_id is None:
+                continue
+            upstream = series.get(link.from_signal.signal_id)
+            downstream = series.get(link.to_signal.signal_id)
+            if upstream is None or downstream is None or len(upstream[0]) < 2 or len(downstream[0]) < 2:
+                continue
+            departures = count_changes(*upstream, start, self.bin_seconds, num_bins, direction=-1)
+            arrivals = count_changes(*downstream, start, self.bin_seconds, num_bins, direction=1)
+            measured = estimate_travel_time(departures, arrivals, self.bin_seconds,
+                                            min_lag=0.3 * link.free_flow_travel_time,
+                                            max_lag=3.0 * link.free_flow_travel_time)
+            if measured is None:
+                continue
+            if link.measured_travel_time is not None:
+                measured += (1 - self.travel_time_smoothing) * (link.measured_travel_time - measured)
+            link.measured_travel_time = round(measured, 1)
+            link.measured_at = timezone.now()
+            changed.append(link)
+        return changed
+
+    def replan(self, now=None, arrival_rates=None):
+        """Recompute and store the coordination plan of every corridor.
+
+        `arrival_rates` ({signal_id: vehicles/second}) overrides the rates measured
+        from TrafficData, e.g. with the control worker's forecasts.
+        """
+        now = now if now is not None else time.time()
+        if arrival_rates is None and self.rate_provider is not None:
+            arrival_rates = self.rate_provider()
+        arrival_rates = arrival_rates or {}
+        junctions = [j for j in JunctionSignals.objects.prefetch_related('signals') if j.signals.all()]
+        links = list(JunctionLink.objects.select_related('from_signal', 'to_signal'))
+        series = self._load_series(datetime.fromtimestamp(now - self.window_seconds, tz=dt_timezone.utc))
+
+        changed_links = self.measure_travel_times(links, series, now)
+        if changed_links:
+            JunctionLink.objects.bulk_update(changed_links, ['measured_travel_time', 'measured_at'])
+
+        # Per-junction flow ratios and lost time, then Webster cycles for all junctions at once
+        phases = {}
+        for junction in junctions:
+            signals = sorted(junction.signals.all(), key=lambda s: s.signal_id)
+            rates = [arrival_rates.get(s.signal_id, self._arrival_rate(series[s.signal_id]) if s.signal_id in series else 0.0)
+                     for s in signals]
+            phases[junction.id] = (signals, np.array(rates) / self.saturation_flow)
+        junction_ids = [j.id for j in junctions]
+        lost_time = np.array([sum(s.yellow_time + s.all_red_time for s in phases[j][0]) for j in junction_ids], dtype=float)
+        flow_ratio_sum = np.array([phases[j][1].sum() for j in junction_ids])
+        cycles = dict(zip(junction_ids, webster_cycle(lost_time, flow_ratio_sum, self.min_cycle, self.max_cycle)))
+        lost_by_junction = dict(zip(junction_ids, lost_time))
+        flow_by_junction = dict(zip(junction_ids, flow_ratio_sum))
+
+        # Corridors are the connected groups of linked junctions
+        link_tuples = [(l.from_junction_id, l.to_junction_id, l.travel_time) for l in links
+                       if l.from_junction_id in cycles and l.to_junction_id in cycles]
+        parent = {j: j for j in junction_ids}
+        def find(j):
+            while parent[j] != j:
+                parent[j] = parent[parent[j]]
+                j = parent[j]
+            return j
+        for from_id, to_id, _ in link_tuples:
+            parent[find(from_id)] = find(to_id)
+        corridors = {}
+        for j in junction_ids:
+            corridors.setdefault(find(j), []).append(j)
+
+        # The phase platoons arrive on is the one each junction's cycle (and offset) starts with
+        coordinated_signal = {}
+        for link in links:
+            if link.to_signal_id is not None:
+                coordinated_signal.setdefault(link.to_junction_id, link.to_signal.signal_id)
+        for link in links:
+            if link.from_signal_id is not None:
+                coordinated_signal.setdefault(link.from_junction_id, link.from_signal.signal_id)
+
+        plan = {}
+        now_aware = timezone.now()
+        for members in corridors.values():
+            if len(members) < 2:
+                continue  # Isolated junctions keep their own adaptive timing
+            cycle_length = float(max(cycles[j] for j in members))
+            root = max(members, key=lambda j: flow_by_junction[j])  # Most critical junction anchors the wave
+            member_links = [t for t in link_tuples if t[0] in members]
+            offsets = corridor_offsets(members, member_links, cycle_length, root)
+            for j in members:
+                signals, flow_ratios = phases[j]
+                splits = webster_splits(
+                    cycle_length, lost_by_junction[j], flow_ratios,
+                    [s.min_green_time for s in signals], [s.max_green_time for s in signals]
+                )
+                plan[j] = {
+                    'cycle_length': round(cycle_length, 1),
+                    'offset': round(offsets[j], 1),
+                    'coordinated_signal': coordinated_signal.get(j, signals[0].signal_id),
+                    'splits': {s.signal_id: int(g) for s, g in zip(signals, splits)},
+                }
+
+        for junction in junctions:
+            junction_plan = plan.get(junction.id)
+            junction.cycle_length = junction_plan['cycle_length'] if junction_plan else None
+            junction.offset = junction_plan['offset'] if junction_plan else 0.0
+            junction.plan_updated_at = now_aware
+        if junctions:
+            JunctionSignals.objects.bulk_update(junctions, ['cycle_length', 'offset', 'plan_updated_at'])
+
+        with self.lock:
+            self.latest_plan = plan
+        return plan
+
+    def plan_for(self, junction_id):
+        """Current plan of one junction, or None when it is not coordinated"""
+        with self.lock:
+            return self.latest_plan.get(junction_id)
+
+    def _replan_loop(self):
+        while True:
+            try:
+                refresh_worker_connection()
+                plan = self.replan()
+                if plan:
+                    print(f"CorridorCoordinator: Planned {len(plan)} coordinated junctions")
+            except OperationalError as e:
+                print(f"CorridorCoordinator: Re-plan skipped, database busy: {e}")
+            except Exception as e:
+                print(f"CorridorCoordinator: Error during re-plan: {type(e).__name__} - {e}")
+            if self.stop_event.wait(self.replan_interval):
+                break
+        release_worker_connection()
+
+    def start(self):
+        """Start periodic re-planning"""
+        if not self.running:
+            self.running = True
+            self.stop_event.clear()
+            self.replan_thread = threading.Thread(target=self._replan_loop, daemon=True)
+            self.replan_thread.start()
+            print("CorridorCoordinator: Re-plan thread started")
+
+    def stop(self):
+        self.running = False
+        self.stop_event.set()
+        if self.replan_thread:
+            self.replan_thread.join(timeout=5.0)
+        print("CorridorCoordinator: Stopped")
+
+
+# Global instance used by the control worker
+corridor_coordinator = None
+
+def get_corridor_coordinator():
+    """Get or create the global corridor coordinator instance"""
+    global corridor_coordinator
+    if corridor_coordinator is None:
+        corridor_coordinator = CorridorCoordinator()
+    return corridor_coordinator
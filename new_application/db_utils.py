@@ -0,0 +1,91 @@
+import time
+import threading
+from django.db import transaction, OperationalError, close_old_connections, connection
+
+
+def is_lock_error(error):
+    """True for the transient lock errors SQLite raises under concurrent writers"""
+    return "database is locked" in str(error) or "database table is locked" in str(error)
+
+
+def run_with_db_retry(label, query_func, max_retries=3, retry_delay=0.5):
+    """Run a query, retrying while the database reports it is locked"""
+    for attempt in range(max_retries):
+        try:
+            return query_func()
+        except OperationalError as e:
+            if is_lock_error(e) and attempt < max_retries - 1:
+                print(f"{label}: DB locked (attempt {attempt + 1}). Retrying in {retry_delay}s.")
+                time.sleep(retry_delay)
+                retry_delay *= 1.5
+            else:
+                print(f"{label}: Persistent database error after {attempt + 1} attempts: {e}")
+                raise
+
+
+def refresh_worker_connection():
+    """Drop this thread's connection if it is past CONN_MAX_AGE or unusable.
+
+    Django only does this around HTTP requests, so long-running worker loops
+    must call it themselves to honour persistent-connection settings.
+    """
+    close_old_connections()
+
+
+def release_worker_connection():
+    """Close this thread's dedicated connection when a worker loop exits"""
+    try:
+        connection.close()
+    except Exception as e:
+        print(f"Error closing worker database connection: {e}")
+
+
+class BatchWriter:
+    """Buffers model instances and writes them with one bulk insert per model in a single transaction"""
+
+    def __init__(self, name, flush_size=50, flush_interval=2.0):
+        self.name = name
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.last_flush_time = time.time()
+
+    def add(self, instance):
+        """Queue an unsaved model instance; flushes when the batch is full or old enough"""
+        with self.lock:
+            self.pending.append(instance)
+            should_flush = (len(self.pending) >= self.flush_size or
+                            time.time() - self.last_flush_time >= self.flush_interval)
+        if should_flush:
+            self.flush()
+
+    def pending_count(self):
+        with self.lock:
+            return len(self.pending)
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of rows written"""
+        with self.lock:
+            instances = self.pending
+            self.pending = []
+            self.last_flush_time = time.time()
+
+        if not instances:
+            return 0
+
+        by_model = {}
+        for instance in instances:
+            by_model.setdefault(type(instance), []).append(instance)
+
+        try:
+            with transaction.atomic():
+                for model, rows in by_model.items():
+                    model.objects.bulk_create(rows, batch_size=500)
+            return len(instances)
+        except OperationalError as e:
+            # Keep the rows for the next flush rather than dropping them
+            print(f"BatchWriter[{self.name}]: Flush of {len(instances)} rows failed ({e}). Will retry.")
+            with self.lock:
+                self.pending = instances + self.pending
+            return 0
@@ -38,6 +38,9 @@ class EnhancedVehicleDetector:
         self.last_detection_time = 0
         self.avg_inference_time = 0
 
+        # Boxes counted in the last detect_vehicles_in_area call, for tracking across frames
+        self.last_detections = []
+
         self.load_yolo_model()
 
     def load_yolo_model(self):
@@ -61,6 +64,7 @@ class EnhancedVehicleDetector:
             return False
 
     def detect_vehicles_in_area(self, frame, area_points, draw_area=True):
+        self.last_detections = []
         if frame is None:
             return 0, 0, None, {k: 0 for k in self.vehicle_classes}, 0.0
 
@@ -132,6 +136,11 @@ class EnhancedVehicleDetector:
                                             class_name = self.new_vehicle_classes[class_id]
                                             traffic_weight += self.vehicle_weights.get(class_name, 1.0)
                                             vehicle_counts[class_name] += 1
+                                            self.last_detections.append({
+                                                'class': class_name, 'center': (x, y),
+                                                'box': (float(x1), float(y1), float(x2), float(y2)),
+                                                'confidence': confidence
+                                            })
 
                                             # Draw bounding box with different colors based on vehicle type
                                             color = {
@@ -213,6 +222,10 @@ class EnhancedVehicleDetector:
 
             # Update vehicle type count
             vehicle_type_counts[class_name] += 1
+            self.last_detections.append({
+                'class': class_name, 'center': (x + w // 2, y + h // 2),
+                'box': (x, y, x + w, y + h), 'confidence': confidence
+            })
 
             # Add to total weight
             total_weight += self.vehicle_weights.get(class_name, 1.0)
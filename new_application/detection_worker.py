@@ -3,8 +3,9 @@ import time
 import cv2
 import numpy as np
 import json
+import queue
 import threading
-from datetime import datetime
+from datetime import datetime, timezone as dt_timezone
 import django
 from collections import deque
 import redis
@@ -19,8 +20,22 @@ else:
 
 import django.conf
 from django.conf import settings
-from .models import TrafficSignal, DetectionArea, VideoSource, TrafficLog, SystemSettings, CongestionEvent, TrafficData
+from .models import TrafficSignal, DetectionArea, DetectionZone, VideoSource, SystemSettings, CongestionEvent
 from .detecter import EnhancedVehicleDetector
+from .timeseries import get_timeseries_store
+from .db_utils import refresh_worker_connection, release_worker_connection
+from .event_log import get_event_log
+from .congestion import CongestionEngine, LEVELS
+from .state_publisher import StatePublisher, SOURCE_DETECTION
+from .preemption import get_emergency_bus
+from .emergency_confirmation import EmergencyConfirmer
+from .state_cache import parse_reload_message, RELOAD_ALL, AREA_CHANGED, SOURCE_CHANGED
+from .stream_ingest import LiveSource, is_stream_url
+from .latency import FrameStamp, LatencyTracker, pack_frame
+from .wire_format import detection_details
+from .zones import ZoneMask
+from .calibration import lane_meters
+from .worker_runner import worker_name
 
 # Setup Redis connection (singleton)
 redis_client = redis.StrictRedis(
@@ -33,21 +48,50 @@ redis_client = redis.StrictRedis(
 class DetectionWorker:
     """Background worker for video processing and YOLO detection"""
     
-    def __init__(self):
+    def __init__(self, signal_ids=None):
+        # Signals this worker reads cameras for; several workers can each take a subset
+        self.signal_ids = sorted(signal_ids) if signal_ids is not None else list(range(4))
+        self.name = worker_name('detection', signal_ids)
         self.detector = EnhancedVehicleDetector()
         self.video_caps = [None] * 4
         self.current_frames = [None] * 4
         self.running = False
         self.detection_thread = None
+        self.timeseries = get_timeseries_store()
+        # Per-frame events go to buffered log files; TrafficData already holds the counts in the DB
+        self.event_log = get_event_log(self.name)
+        # Detection results are pushed to the dashboard as per-signal deltas
+        self.publisher = StatePublisher(worker_name(SOURCE_DETECTION, signal_ids), redis_client)
+        # Emergency vehicles are announced to the controller directly, not through the signal row
+        self.emergency_bus = get_emergency_bus()
+        self.emergency_present = [False] * 4
+        # Single-frame emergency classifications are confirmed over several frames per approach
+        self.emergency_confirmers = [EmergencyConfirmer() for _ in range(4)]
 
          # Setup Redis PubSub for control messages
         self.redis_control_pubsub = redis_client.pubsub() # Add this line
         self.CONTROL_CHANNEL = 'control_channel_detection_worker' 
+        # Reload requests from the listener thread, applied by the capture loop between frames
+        self.pending_reloads = queue.Queue()
+        # signal_idx -> (area_points, area_size, lane_meters), loaded once and refreshed on area_changed
+        self.detection_areas = {}
+        # signal_idx -> zone definitions in bit order, and the ZoneMask built from them for
+        # the frame size last seen; rebuilt only when the zones or the frame size change
+        self.detection_zones = {}
+        self.zone_masks = {}
+        # Video source health (0-1) written to the signal rows so the controller can fall
+        # back to fixed timing for an approach it cannot see
+        self.source_health = [None] * 4
+        self.health_interval = 2.0
+        self.last_health_update = 0.0
+        # Every frame read gets a sequence number and capture time that travel with its results
+        self.frame_seqs = [0] * 4
+        self.latency = LatencyTracker(self.name)
         
         # Load system settings
         self.settings, _ = SystemSettings.objects.get_or_create(id=1)
-        self.last_congestion_analysis_time = time.time()
-        self.congestion_analysis_interval = 5.0
+        # Smoothed, hysteretic congestion level per approach; events only on level changes
+        self.congestion = CongestionEngine()
 
          # --- ADD THESE NEW ATTRIBUTES ---
         self.frame_counters = [0] * 4 # To track frames for each of the 4 signals
@@ -61,7 +105,7 @@ class DetectionWorker:
         """Initialize detection areas and video sources from database"""
         try:
             # Ensure all signals exist
-            for i in range(4):
+            for i in self.signal_ids:
                 signal, created = TrafficSignal.objects.get_or_create(
                     signal_id=i,
                     defaults={
@@ -96,6 +140,7 @@ class DetectionWorker:
                 if created:
                     print(f"Created new signal {chr(65+i)}")
             
+            self.load_detection_areas()
             print("System initialization completed")
             
         except Exception as e:
@@ -104,14 +149,21 @@ class DetectionWorker:
     def initialize_video_captures(self):
         """Initialize OpenCV video captures for each signal"""
         # Inside DetectionWorker.initialize_video_captures
-        for i in range(4):
+        for i in self.signal_ids:
             try:
+                if self.video_caps[i]:
+                    self.video_caps[i].release()  # also stops a live source's reader thread
+                    self.video_caps[i] = None
                 signal = TrafficSignal.objects.get(signal_id=i)
                 video_source = signal.video_source
 
                 print(f"Attempting to open video for Signal {chr(65+i)}: {video_source.video_path}")
 
-                if video_source.is_active and os.path.exists(video_source.video_path):
+                if video_source.is_active and is_stream_url(video_source.video_path):
+                    # Connects (and reconnects) on its own thread; dimensions are saved with the first frame
+                    self.video_caps[i] = LiveSource(video_source.video_path)
+                    print(f"Signal {chr(65+i)}: Connecting to live stream {video_source.video_path}")
+                elif video_source.is_active and os.path.exists(video_source.video_path):
                     self.video_caps[i] = cv2.VideoCapture(video_source.video_path)
                     if not self.video_caps[i].isOpened():
                         print(f"ERROR: Signal {chr(65+i)}: Failed to open video source: {video_source.video_path}")
@@ -140,16 +192,126 @@ class DetectionWorker:
             except Exception as e:
                 print(f"CRITICAL ERROR during video capture initialization for Signal {chr(65+i)}: {type(e).__name__} - {e}")
     
+    def load_detection_areas(self, signal_ids=None):
+        """Cache the detection polygons so frames do not read them from the database"""
+        signal_ids = list(self.signal_ids if signal_ids is None else signal_ids)
+        calibrations = {}
+        rows = DetectionArea.objects.filter(signal__signal_id__in=signal_ids).values_list(
+            'signal__signal_id', 'area_points', 'area_size', 'homography', 'lane_width', 'lane_meters'
+        )
+        for signal_idx, area_points, area_size, homography, lane_width, area_lane_meters in rows:
+            self.detection_areas[signal_idx] = (area_points, area_size, area_lane_meters)
+            calibrations[signal_idx] = (homography, lane_width)
+
+        # Zone lengths are projected once here, not per frame
+        zones = {signal_idx: [] for signal_idx in signal_ids}
+        for signal_idx, name, zone_type, polygon in DetectionZone.objects.filter(
+            signal__signal_id__in=signal_ids
+        ).order_by('position').values_list('signal__signal_id', 'name', 'zone_type', 'polygon'):
+            homography, lane_width = calibrations.get(signal_idx, (None, 0))
+            zones[signal_idx].append({
+                'name': name, 'zone_type': zone_type, 'points': polygon,
+                'lane_meters': lane_meters(homography, polygon, lane_width) if homography else 0.0,
+            })
+        for signal_idx in signal_ids:
+            self.detection_zones[signal_idx] = zones[signal_idx]
+            self.zone_masks.pop(signal_idx, None)
+
+    def zone_mask(self, signal_idx, frame):
+        """ZoneMask of the signal's zones for this frame's size, None if it has no zones"""
+        zones = self.detection_zones.get(signal_idx)
+        if not zones:
+            return None
+        height, width = frame.shape[:2]
+        mask = self.zone_masks.get(signal_idx)
+        if mask is None or (mask.width, mask.height) != (width, height):
+            mask = self.zone_masks[signal_idx] = ZoneMask(zones, width, height)
+        return mask
+
     def _redis_control_listener_thread_func(self):
         print(f"DetectionWorker: Subscribing to Redis control channel: {self.CONTROL_CHANNEL}")
         self.redis_control_pubsub.subscribe(self.CONTROL_CHANNEL)
         
         for message in self.redis_control_pubsub.listen():
-            if message['type'] == 'message':
+            if message['type'] != 'message':
+                continue
+            # One malformed message must not kill the listener and with it every later reload
+            try:
                 decoded_message = message['data'].decode('utf-8')
+                reload = parse_reload_message(decoded_message)
+            except Exception as e:
+                print(f"⚠️ DetectionWorker: Ignoring malformed control message {message['data']!r}: {e}")
+                continue
+            if reload is not None:
                 print(f"DetectionWorker: Received control message: {decoded_message}")
-                if decoded_message == 'reload_config':
-                    self.reload_config_from_db()
+                # Applied by the capture loop, never while it is reading or detecting
+                self.pending_reloads.put(reload)
+
+    def apply_pending_reloads(self):
+        """Apply queued reload requests; called by the capture loop between frames"""
+        requests = set()
+        while True:
+            try:
+                requests.add(self.pending_reloads.get_nowait())
+            except queue.Empty:
+                break
+        if not requests:
+            return
+        if any(kind == RELOAD_ALL for kind, _ in requests):
+            self.reload_config_from_db()
+            return
+        for kind, signal_idx in sorted(requests, key=lambda r: (r[0], -1 if r[1] is None else r[1])):
+            if signal_idx is not None and signal_idx not in self.signal_ids:
+                continue  # another worker's camera
+            signal_ids = self.signal_ids if signal_idx is None else [signal_idx]
+            if kind == AREA_CHANGED:
+                self.load_detection_areas(signal_ids)
+                for i in signal_ids:
+                    # Tracks and votes from the old polygon no longer apply
+                    self.emergency_confirmers[i].reset()
+                print(f"DetectionWorker: Reloaded detection area for {self.describe_signals(signal_idx)}")
+            elif kind == SOURCE_CHANGED:
+                for i in signal_ids:
+                    self.reinitialize_video_capture(i)
+                    self.frame_counters[i] = 0
+                    self.emergency_confirmers[i].reset()
+                print(f"DetectionWorker: Reopened video source for {self.describe_signals(signal_idx)}")
+
+    def record_source_dimensions(self, signal_idx, frame):
+        """Store a live stream's frame size, which is only known once it delivers a frame"""
+        height, width = frame.shape[:2]
+        updated = VideoSource.objects.filter(signal__signal_id=signal_idx).exclude(
+            width=width, height=height
+        ).update(width=width, height=height)
+        if updated:
+            print(f"Updated Signal {chr(65+signal_idx)} VideoSource dimensions to {width}x{height}")
+
+    def update_source_health(self):
+        """Write each approach's source health to its signal row when it has changed noticeably"""
+        now = time.time()
+        if now - self.last_health_update < self.health_interval:
+            return
+        self.last_health_update = now
+        for i in self.signal_ids:
+            cap = self.video_caps[i]
+            if isinstance(cap, LiveSource):
+                health = cap.health()
+            else:
+                health = 1.0 if cap is not None and cap.isOpened() else 0.0
+            previous = self.source_health[i]
+            if previous is None or abs(health - previous) >= 0.05 or (health == 0.0) != (previous == 0.0):
+                TrafficSignal.objects.filter(signal_id=i).update(source_health=health)
+                self.source_health[i] = health
+
+    def stamp_frame(self, signal_idx, mono=None, wall=None):
+        """Next sequence number for this signal's frames, with the frame's capture time (now by default)"""
+        self.frame_seqs[signal_idx] += 1
+        if mono is None:
+            return FrameStamp.now(self.frame_seqs[signal_idx])
+        return FrameStamp(self.frame_seqs[signal_idx], mono, wall)
+
+    def describe_signals(self, signal_idx):
+        return 'all signals' if signal_idx is None else f"Signal {chr(65 + signal_idx)}"
     
     def capture_and_detect_frames(self):
         """Main detection loop - continuously captures frames and performs detection"""
@@ -157,19 +319,43 @@ class DetectionWorker:
         
         while self.running:
             try:
-                for i in range(4):
+                refresh_worker_connection()
+                self.apply_pending_reloads()
+                self.update_source_health()
+                for i in self.signal_ids:
                     cap = self.video_caps[i]
-                    if cap and cap.isOpened():
+                    if isinstance(cap, LiveSource):
+                        # Live streams reconnect themselves; no frame just means none is buffered yet
+                        ret, frame = cap.read()
+                        if ret and frame is not None:
+                            stamp = self.stamp_frame(i, cap.last_stamp.mono, cap.last_stamp.wall)
+                            self.latency.since_capture('buffer', stamp)
+                            if self.frame_counters[i] == 0:
+                                self.record_source_dimensions(i, frame)
+                            self.current_frames[i] = frame.copy()
+                            confirmer = self.emergency_confirmers[i]
+                            if (self.frame_counters[i] % (self.frame_skip_count + 1) == 0
+                                    or confirmer.confirmed or confirmer.pending):
+                                self.process_signal_detection(i, frame.copy(), stamp)
+                            self.frame_counters[i] += 1
+                    elif cap and cap.isOpened():
+                        read_started = time.monotonic()
                         ret, frame = cap.read()
                         if ret and frame is not None:
+                            stamp = self.stamp_frame(i)
+                            self.latency.record('decode', stamp.mono - read_started)
                             print(f"Signal {chr(65+i)}: Successfully read frame. Shape: {frame.shape}, Dtype: {frame.dtype}")
                             self.current_frames[i] = frame.copy()
-                            # Perform detection for this signal's area
-                            if self.frame_counters[i] % (self.frame_skip_count + 1) == 0:
+                            # Perform detection for this signal's area; every frame while an emergency
+                            # vehicle is being confirmed or is in view, so the vote and its departure are prompt
+                            confirmer = self.emergency_confirmers[i]
+                            if (self.frame_counters[i] % (self.frame_skip_count + 1) == 0
+                                    or confirmer.confirmed or confirmer.pending):
                                 print(f"Signal {chr(65+i)}: PROCESSING frame {self.frame_counters[i]}.")
-                                self.process_signal_detection(i, frame.copy())
+                                self.process_signal_detection(i, frame.copy(), stamp)
                             else:
                                 print(f"Signal {chr(65+i)}: SKIPPING frame {self.frame_counters[i]}.")
+                            self.frame_counters[i] += 1
                         else:
                             # Loop video if end reache
                             print(f"Signal {chr(65+i)}: Read failed (ret={ret}, frame is None={frame is None}). Attempting to loop video.")
@@ -178,7 +364,7 @@ class DetectionWorker:
                             if ret and frame is not None:
                                 print(f"Signal {chr(65+i)}: Successfully read frame after loop. Shape: {frame.shape}")
                                 self.current_frames[i] = frame.copy()
-                                self.process_signal_detection(i, frame.copy())
+                                self.process_signal_detection(i, frame.copy(), self.stamp_frame(i))
                             else:
                                 print(f"ERROR: Signal {chr(65+i)}: Still failed to read frame after looping. Cap status: {cap.isOpened()}")
                     else:
@@ -192,50 +378,80 @@ class DetectionWorker:
             except Exception as e:
                 print(f"Error in detection loop: {e}")
                 time.sleep(1.0)  # Wait longer on error
-    # calculating congestion levels
-    def calculate_congestion_level(self, vehicle_count, traffic_weight, area_size):
-        if area_size <= 0:
-            area_size = 1000 # Default area size to prevent division by zero
 
-        density = vehicle_count / area_size
-        weighted_density = traffic_weight / area_size
-        
-        if area_size > 50000: # Adjust threshold as needed
-            congestion_score = (density * 10000) + (vehicle_count * 0.5) + (weighted_density * 0.3)
-        else:
-            congestion_score = (density * 0.3 + weighted_density * 0.7) * 1000
-        
-        if congestion_score < 2:
-            congestion_level = 'LOW'
-            color = 'green'
-        elif congestion_score < 8:
-            congestion_level = 'MODERATE'
-            color = 'orange'
-        elif congestion_score < 20:
-            congestion_level = 'HIGH'
-            color = 'red'
-        else:
-            congestion_level = 'SEVERE'
-            color = 'darkred'
-        
-        return congestion_level, congestion_score, color
+        release_worker_connection()
+    def restore_congestion_state(self):
+        """Seed the congestion engine from the signal rows, so a restart continues the open events.
+
+        The newest unresolved event matching the signal's stored level stays open;
+        any other unresolved event is left over from an earlier run and is closed.
+        """
+        now = time.time()
+        for signal in TrafficSignal.objects.filter(signal_id__in=self.signal_ids):
+            open_events = CongestionEvent.objects.filter(signal=signal, resolution_time__isnull=True).order_by('-timestamp', '-id')
+            current = None
+            for event in open_events:
+                if current is None and event.severity == signal.congestion_level and event.severity != LEVELS[0]:
+                    current = event
+                    continue
+                CongestionEvent.objects.filter(id=event.id).update(
+                    resolution_time=max(0, int(round(now - event.timestamp.timestamp())))
+                )
+            self.congestion.seed(
+                signal.signal_id, signal.congestion_level, signal.congestion_score, now,
+                level_since=current.timestamp.timestamp() if current else None,
+                event_id=current.id if current else None
+            )
+
+    def record_congestion_transition(self, signal, congestion):
+        """Close the CongestionEvent of the level that ended and open one for the new level (unless LOW)"""
+        transition = congestion['transition']
+        if transition['previous_event_id'] is not None:
+            CongestionEvent.objects.filter(id=transition['previous_event_id'], resolution_time__isnull=True).update(
+                resolution_time=int(round(transition['duration']))
+            )
+        rising = LEVELS.index(congestion['level']) > LEVELS.index(transition['previous'])
+        print(f"Signal {chr(65 + signal.signal_id)}: Congestion {transition['previous']} -> {congestion['level']} "
+              f"(score {congestion['score']})")
+        if congestion['level'] != LEVELS[0]:
+            event = CongestionEvent.objects.create(
+                signal=signal,
+                severity=congestion['level'],
+                score=congestion['score'],
+                color=congestion['color'],
+                cause="High traffic density detected by AI" if rising else "Traffic density easing",
+            )
+            self.congestion.set_event(signal.signal_id, event.id)
 
     
-    def process_signal_detection(self, signal_idx, frame):
-        """Process detection for a specific signal"""
+    def process_signal_detection(self, signal_idx, frame, stamp=None):
+        """Process detection for a specific signal; `stamp` identifies the frame and its capture time"""
         try:
+            stamp = stamp or self.stamp_frame(signal_idx)
+            captured_at = stamp.wall
             signal_char = chr(65 + signal_idx)
             print(f"--- Signal {signal_char}: Starting process_signal_detection ---")
             signal = TrafficSignal.objects.get(signal_id=signal_idx)
-            detection_area = signal.detection_area
+            if signal_idx not in self.detection_areas:
+                self.load_detection_areas([signal_idx])
+            area_points, area_size, area_lane_meters = self.detection_areas.get(signal_idx, (None, 0, 0))
             
-            if not detection_area.area_points:
+            if not area_points:
                 print(f"WARNING: Signal {signal_char}: No detection area points defined. Skipping detection.")
                 return
             
             # Run YOLO detection
+            inference_started = time.monotonic()
             vehicle_count, traffic_weight, processed_frame, vehicle_type_counts, avg_confidence = \
-                self.detector.detect_vehicles_in_area(frame, detection_area.area_points, draw_area=True)
+                self.detector.detect_vehicles_in_area(frame, area_points, draw_area=True)
+            self.latency.record('inference', time.monotonic() - inference_started)
+            self.latency.since_capture('capture_to_inference', stamp)
+
+            # Every zone of the approach in one pass over the detections
+            mask = self.zone_mask(signal_idx, frame)
+            zone_counts = mask.count(self.detector.last_detections, self.detector.vehicle_weights) if mask else {}
+            if mask and processed_frame is not None:
+                mask.draw(processed_frame)
             
             print(f"Signal {chr(65+signal_idx)}: Raw Detection Output - Count={vehicle_count}, Weight={traffic_weight}, Types={vehicle_type_counts}")
             
@@ -243,76 +459,86 @@ class DetectionWorker:
             signal.vehicle_count = vehicle_count
             signal.traffic_weight = traffic_weight
             signal.vehicle_type_counts = vehicle_type_counts
+            signal.zone_counts = zone_counts
             signal.avg_confidence = avg_confidence
             signal.last_update_time = datetime.now()
+            signal.last_capture_time = datetime.fromtimestamp(captured_at, tz=dt_timezone.utc)
+            signal.last_frame_seq = stamp.seq
             
-            # Check for emergency vehicles
-            emergency_count = vehicle_type_counts.get('emergency_vehicles', 0)
-            if emergency_count > 0:
+            # Emergency vehicles only count once confirmed over several frames and, where the
+            # approach direction is configured, heading towards the stop line
+            confirmer = self.emergency_confirmers[signal_idx]
+            confirmer.configure(signal)
+            emergency = confirmer.update(self.detector.last_detections, captured_at)
+            emergency_count = emergency['emergency_count'] if emergency['confirmed'] else 0
+            if emergency['pending']:
+                print(f"Signal {signal_char}: Emergency vehicle pending confirmation "
+                      f"({emergency['votes']}/{confirmer.confirm_frames} frames, {emergency['direction']})")
+
+            # Confirmations and releases go straight to the controller
+            if emergency['confirmed'] != self.emergency_present[signal_idx]:
+                self.emergency_present[signal_idx] = emergency['confirmed']
+                detected_at = emergency['first_detected_at'] if emergency['confirmed'] else captured_at
+                self.emergency_bus.publish(signal_idx, emergency['confirmed'], detected_at=detected_at,
+                                           emergency_count=emergency_count, direction=emergency['direction'])
+            if emergency['confirmed']:
+                if not signal.has_emergency_vehicle:
+                    signal.emergency_vehicle_detected_time = datetime.fromtimestamp(emergency['first_detected_at'], tz=dt_timezone.utc)
+                    signal.emergency_vehicle_wait_time = 0.0
                 signal.has_emergency_vehicle = True
-                signal.emergency_vehicle_detected_time = datetime.now()
-                signal.emergency_vehicle_wait_time = 0.0
             else:
                 signal.has_emergency_vehicle = False
+
+            # Calibrated cameras are scored per lane-metre, so scores compare across camera angles
+            congestion = self.congestion.update(signal_idx, vehicle_count, traffic_weight, area_size, captured_at,
+                                                lane_meters=area_lane_meters)
+            signal.congestion_level = congestion['level']
+            signal.congestion_score = congestion['score']
             
-            signal.save()
+            # Only write the detection fields; a full save would overwrite the state and
+            # remaining_time the control thread wrote since this row was loaded
+            persist_started = time.monotonic()
+            signal.save(update_fields=[
+                'vehicle_count', 'traffic_weight', 'vehicle_type_counts', 'zone_counts', 'avg_confidence',
+                'has_emergency_vehicle', 'emergency_vehicle_detected_time', 'emergency_vehicle_wait_time',
+                'congestion_level', 'congestion_score',
+                'last_update_time', 'last_capture_time', 'last_frame_seq'
+            ])
+            self.latency.record('persist', time.monotonic() - persist_started)
+            self.latency.since_capture('capture_to_persist', stamp)
 
             #------------***THIS IS THE Addition of TrafficData***------------#
-            TrafficData.objects.create( # <--- This is a CREATE NEW RECORD operation for TrafficDataSnapshot
-                signal=signal,
-                vehicle_count=vehicle_count,
-                traffic_weight=traffic_weight,
-                green_time=signal.calculated_green_time,
-                auto_count=vehicle_type_counts.get('auto', 0),
-                bike_count=vehicle_type_counts.get('bike', 0),
-                bus_count=vehicle_type_counts.get('bus', 0),
-                car_count=vehicle_type_counts.get('car', 0),
-                emergency_vehicles_count=vehicle_type_counts.get('emergency_vehicles', 0),
-                truck_count=vehicle_type_counts.get('truck', 0),
-                vehicle_type_counts_json=vehicle_type_counts
+            # Appended to the time-series store, which batches inserts and handles rollups/retention
+            self.timeseries.append(
+                signal,
+                vehicle_count,
+                traffic_weight,
+                signal.calculated_green_time,
+                vehicle_type_counts,
+                capture_time=signal.last_capture_time
             )
 
-            # --- CONGESTION ANALYSIS INTEGRATION (Calculated periodically, creates CongestionEvent) ---#
-            current_time = time.time()
-            if current_time - self.last_congestion_analysis_time >= self.congestion_analysis_interval:
-                self.last_congestion_analysis_time = current_time # Reset timer for next analysis
-                print(f"Performing congestion analysis for Signal {signal_char}...")
-                
-                # Get area_size from the detection_area object
-                area_size_for_analysis = detection_area.area_size 
-                if area_size_for_analysis is None or area_size_for_analysis <= 0:
-                    area_size_for_analysis = 1000 # Fallback default
-
-                congestion_level, congestion_score, color = self.calculate_congestion_level(
-                    signal.vehicle_count, # Use latest total_vehicle_count
-                    signal.traffic_weight,     # Use latest traffic_weight
-                    area_size_for_analysis
-                )
+            # CongestionEvents are only written when the approach's level changes
+            if congestion['transition']:
+                self.record_congestion_transition(signal, congestion)
 
-                # Update the TrafficSignal's congestion_level and congestion_score fields
-                signal.update_congestion_data(congestion_level, congestion_score)
-
-                CongestionEvent.objects.create(
-                    signal=signal,
-                    severity=congestion_level, # Map to 'severity' field
-                    score=congestion_score,
-                    color=color,
-                    cause="High traffic density detected by AI", # Default cause
-                    resolution_time=None # No resolution logic yet
-                )
-            print(f"CongestionEvent created for Signal {signal_char}.")
-            #------------Congestion_Analysis_Ends here--------------------------------------------------#
+            self.publisher.publish_delta(signal_idx, {
+                'vehicle_count': vehicle_count,
+                'traffic_weight': traffic_weight,
+                'avg_confidence': avg_confidence,
+                'vehicle_type_counts': vehicle_type_counts,
+                'zone_counts': zone_counts,
+                'has_emergency_vehicle': signal.has_emergency_vehicle,
+                'congestion_level': signal.congestion_level,
+                'congestion_score': signal.congestion_score,
+            })
             
             # Log detection update
-            TrafficLog.objects.create(
-                signal=signal,
-                event_type='DETECTION_UPDATE',
-                details={
-                    'vehicle_count': vehicle_count,
-                    'traffic_weight': traffic_weight,
-                    'vehicle_type_counts': vehicle_type_counts,
-                    'avg_confidence': avg_confidence
-                }
+            self.event_log.write(
+                'DETECTION_UPDATE', signal_idx,
+                # Class-indexed counts and short keys: this is the most frequent event
+                dict(detection_details(vehicle_count, traffic_weight, vehicle_type_counts, avg_confidence), seq=stamp.seq),
+                timestamp=captured_at
             )
             # Store processed frame for MJPEG streaming
             if processed_frame is not None:
@@ -321,9 +547,12 @@ class DetectionWorker:
                     success, buffer = cv2.imencode('.jpg', processed_frame, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
                     if success and buffer is not None:
                         frame_bytes = buffer.tobytes()
-                        # Publish to Redis channel
+                        # Publish to Redis channel, with the frame's sequence number and capture time
                         channel = f'frame_channel_{signal_idx}'
-                        redis_client.publish(channel, frame_bytes)
+                        publish_started = time.monotonic()
+                        redis_client.publish(channel, pack_frame(stamp, frame_bytes))
+                        self.latency.record('publish', time.monotonic() - publish_started)
+                        self.latency.since_capture('capture_to_publish', stamp)
                         print(f"Signal {chr(65+signal_idx)}: Frame PUBLISHED to Redis channel {channel}. Size: {len(frame_bytes)} bytes.")
                     else:
                         print(f"ERROR: Signal {chr(65+signal_idx)}: cv2.imencode failed (success={success}, buffer is None={buffer is None}).")
@@ -335,6 +564,7 @@ class DetectionWorker:
             # Log emergency vehicle detection
             if emergency_count > 0:
                 print(f"🚑 Emergency vehicle detected at Signal {chr(65+signal_idx)}: Count = {emergency_count}")
+            self.latency.publish(redis_client)
                 
         except Exception as e:
             print(f"CRITICAL ERROR processing detection for Signal {signal_idx}: {type(e).__name__} - {e}")
@@ -359,7 +589,10 @@ class DetectionWorker:
             signal = TrafficSignal.objects.get(signal_id=signal_idx)
             video_source = signal.video_source
             
-            if video_source.is_active and video_source.video_path:
+            if video_source.is_active and is_stream_url(video_source.video_path):
+                self.video_caps[signal_idx] = LiveSource(video_source.video_path)
+                print(f"Signal {chr(65+signal_idx)}: Reconnecting to live stream {video_source.video_path}")
+            elif video_source.is_active and video_source.video_path:
                 self.video_caps[signal_idx] = cv2.VideoCapture(video_source.video_path)
                 if self.video_caps[signal_idx].isOpened():
                     # --- NEW: Get and save dimensions upon reinitialization ---
@@ -392,7 +625,9 @@ class DetectionWorker:
         """Start the detection worker"""
         if not self.running:
             self.running = True
+            self.restore_congestion_state()
             self.initialize_video_captures()
+            self.timeseries.start()
             
             self.detection_thread = threading.Thread(target=self.capture_and_detect_frames, daemon=True)
             self.detection_thread.start()
@@ -403,6 +638,13 @@ class DetectionWorker:
             
             print("Detection worker started")
     
+    def supervised_threads(self):
+        """Thread attributes and their targets, for restarting threads that died"""
+        return {
+            'detection_thread': self.capture_and_detect_frames,
+            'control_listener_thread': self._redis_control_listener_thread_func,
+        }
+
     def stop(self):
         """Stop the detection worker"""
         self.running = False
@@ -423,6 +665,10 @@ class DetectionWorker:
             self.detection_thread.join(timeout=5.0)
         if self.control_listener_thread: # Add this
             self.control_listener_thread.join(timeout=5.0) # Add this
+
+        # Flush buffered TrafficData rows and events
+        self.timeseries.stop()
+        self.event_log.close()
             
         print("Detection worker stopped")
     
@@ -455,6 +701,7 @@ def stop_detection_worker():
         detection_worker = None
 
 def main():
+    """Run the worker standalone; `manage.py run_detection` adds supervision and signal pinning"""
     worker = DetectionWorker()
     worker.start()
     try:
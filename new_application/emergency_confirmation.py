@@ -0,0 +1,154 @@
+import math
+from collections import deque
+
+EMERGENCY_CLASS = 'emergency_vehicles'
+
+# Approach directions, as the image direction traffic moves in towards the stop line
+DIRECTION_ANY = 'any'
+APPROACH_VECTORS = {
+    'down': (0.0, 1.0),
+    'up': (0.0, -1.0),
+    'left': (-1.0, 0.0),
+    'right': (1.0, 0.0),
+}
+APPROACH_DIRECTION_CHOICES = [
+    (DIRECTION_ANY, 'Any'),
+    ('down', 'Down the frame'),
+    ('up', 'Up the frame'),
+    ('left', 'Right to left'),
+    ('right', 'Left to right'),
+]
+
+# Track headings relative to the approach
+APPROACHING = 'approaching'
+DEPARTING = 'departing'
+CROSSING = 'crossing'
+STATIONARY = 'stationary'
+UNKNOWN = 'unknown'
+
+
+class EmergencyConfirmer:
+    """Temporal confirmation of emergency vehicle detections for one approach.
+
+    A single frame classifying a box as an emergency vehicle is not trusted:
+    the approach is confirmed once `confirm_frames` of the last `window_frames`
+    processed frames voted for it, and released after `release_frames`
+    consecutive frames without a vote. The emergency box is followed from frame
+    to frame by nearest centre; when an approach direction is configured, a
+    vehicle whose track is leaving the junction (or crossing it) does not vote.
+    """
+
+    def __init__(self, confirm_frames=3, window_frames=5, release_frames=5,
+                 approach_direction=DIRECTION_ANY, max_jump=150.0, min_motion=8.0, track_length=8):
+        self.confirm_frames = confirm_frames
+        self.window_frames = window_frames
+        self.release_frames = release_frames
+        self.approach_direction = approach_direction
+        self.max_jump = max_jump  # pixels a box centre may move between processed frames
+        self.min_motion = min_motion  # pixels of track displacement below which it is stationary
+        self.votes = deque(maxlen=window_frames)
+        self.track = deque(maxlen=track_length)  # (timestamp, x, y) of the followed emergency box
+        self.missed = 0  # consecutive frames without a vote
+        self.confirmed = False
+        self.first_vote_at = None
+        self.direction = UNKNOWN
+        self.count = 0
+
+    def configure(self, signal):
+        """Take the per-signal tuning from a TrafficSignal row"""
+        confirm = max(int(getattr(signal, 'emergency_confirm_frames', self.confirm_frames)), 1)
+        window = max(int(getattr(signal, 'emergency_window_frames', self.window_frames)), confirm)
+        self.confirm_frames = confirm
+        self.release_frames = max(int(getattr(signal, 'emergency_release_frames', self.release_frames)), 1)
+        self.approach_direction = getattr(signal, 'emergency_approach_direction', self.approach_direction) or DIRECTION_ANY
+        if window != self.window_frames:
+            self.window_frames = window
+            self.votes = deque(self.votes, maxlen=window)
+
+    def reset(self):
+        self.votes.clear()
+        self.track.clear()
+        self.missed = 0
+        self.confirmed = False
+        self.first_vote_at = None
+        self.direction = UNKNOWN
+        self.count = 0
+
+    @property
+    def pending(self):
+        """True while votes are being collected but the approach is not yet confirmed"""
+        return not self.confirmed and any(self.votes)
+
+    def _follow(self, boxes, timestamp):
+        """Extend the track with the emergency box nearest its last point, or start a new one"""
+        if not boxes:
+            return
+        if self.track:
+            _, last_x, last_y = self.track[-1]
+            nearest = min(boxes, key=lambda box: math.hypot(box['center'][0] - last_x, box['center'][1] - last_y))
+            if math.hypot(nearest['center'][0] - last_x, nearest['center'][1] - last_y) <= self.max_jump:
+                self.track.append((timestamp, *nearest['center']))
+                return
+            self.track.clear()
+        best = max(boxes, key=lambda box: box.get('confidence', 0.0))
+        self.track.append((timestamp, *best['center']))
+
+    def heading(self):
+        """Direction of the followed vehicle relative to the configured approach"""
+        if len(self.track) < 2:
+            return UNKNOWN
+        dx = self.track[-1][1] - self.track[0][1]
+        dy = self.track[-1][2] - self.track[0][2]
+        distance = math.hypot(dx, dy)
+        if distance < self.min_motion:
+            return STATIONARY
+        approach = APPROACH_VECTORS.get(self.approach_direction)
+        if approach is None:
+            return APPROACHING
+        cosine = (dx * approach[0] + dy * approach[1]) / distance
+        if cosine >= 0.5:
+            return APPROACHING
+        if cosine <= -0.5:
+            return DEPARTING
+        return CROSSING
+
+    def update(self, detections, timestamp):
+        """Feed one processed frame's detections (dicts with 'class' and 'center'); returns the state"""
+        boxes = [d for d in detections if d.get('class') == EMERGENCY_CLASS]
+        if boxes:
+            self._follow(boxes, timestamp)
+        elif self.missed + 1 >= self.release_frames:
+            self.track.clear()
+
+        self.direction = self.heading() if boxes else UNKNOWN
+        # A queued vehicle (stationary) or one seen only once so far still counts
+        vote = bool(boxes) and self.direction not in (DEPARTING, CROSSING)
+        self.votes.append(vote)
+        was_confirmed = self.confirmed
+
+        if vote:
+            self.missed = 0
+            self.count = len(boxes)
+            if self.first_vote_at is None:
+                self.first_vote_at = timestamp
+            if sum(self.votes) >= self.confirm_frames:
+                self.confirmed = True
+        else:
+            self.missed += 1
+            if self.confirmed and self.missed >= self.release_frames:
+                # Released: a returning vehicle has to be confirmed afresh
+                self.confirmed = False
+                self.votes.clear()
+            if not any(self.votes):
+                self.first_vote_at = None
+                self.count = 0
+
+        return {
+            'confirmed': self.confirmed,
+            'changed': self.confirmed != was_confirmed,
+            'pending': self.pending,
+            'votes': sum(self.votes),
+            'direction': self.direction,
+            'emergency_count': self.count if self.confirmed or vote else 0,
+            'first_detected_at': self.first_vote_at,
+        }
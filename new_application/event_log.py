@@ -0,0 +1,186 @@
+import os
+import re
+import json
+import time
+import glob
+import threading
+from django.conf import settings
+
+# Events rare and important enough to also keep as TrafficLog rows; everything else only goes to files
+AUDIT_EVENT_TYPES = {'STATE_CHANGE', 'EMERGENCY_OVERRIDE', 'EMERGENCY_EXTEND', 'TIMING_ADJUSTMENT'}
+
+ACTIVE_SUFFIX = '.jsonl'
+LOG_FILE_PATTERN = re.compile(r'^(?P<stream>.+?)(-\d{8}T\d{6}-\d{2})?\.jsonl$')
+
+
+def event_log_dir():
+    return getattr(settings, 'EVENT_LOG_DIR', os.path.join(settings.BASE_DIR, 'Logs', 'events'))
+
+
+class EventLog:
+    """Buffered, append-only JSON-lines event log with size-based rotation.
+
+    Each process writes its own stream (`<stream>.jsonl`), so lines never interleave.
+    Lines are buffered and written in batches, and a background thread writes out
+    buffered lines once they are `flush_interval` old even if no further event
+    arrives; a full file is renamed to `<stream>-<time>-<n>.jsonl` and only the
+    newest `max_files` rotated files are kept.
+    """
+
+    def __init__(self, stream, directory=None, max_bytes=32 * 1024 * 1024, max_files=50,
+                 flush_size=200, flush_interval=2.0):
+        self.stream = stream
+        self.directory = directory or event_log_dir()
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.last_flush_time = time.time()
+        self.written = 0
+        self.stopping = threading.Event()
+        self.flush_thread = None
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, self.stream + ACTIVE_SUFFIX)
+
+    def write(self, event_type, signal_id, details, timestamp=None):
+        """Queue one event; flushes when the batch is full or old enough"""
+        line = json.dumps({
+            'ts': round(timestamp if timestamp is not None else time.time(), 3),
+            'type': event_type,
+            'signal': signal_id,
+            'details': details,
+        }, separators=(',', ':'), default=str)
+        with self.lock:
+            self.pending.append(line)
+            should_flush = (len(self.pending) >= self.flush_size or
+                            time.time() - self.last_flush_time >= self.flush_interval)
+            if self.flush_thread is None:
+                self.flush_thread = threading.Thread(target=self._flush_loop, args=(self.stopping,), daemon=True,
+                                                     name=f"event-log-{self.stream}")
+                self.flush_thread.start()
+        if should_flush:
+            self.flush()
+
+    def _flush_loop(self, stopping):
+        """Flush buffered lines that have waited flush_interval, for streams with few events"""
+        while not stopping.wait(self.flush_interval / 2):
+            with self.lock:
+                due = self.pending and time.time() - self.last_flush_time >= self.flush_interval
+            if not due:
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"EventLog[{self.stream}]: Background flush failed: {e}")
+
+    def flush(self):
+        """Append everything buffered so far; returns the number of events written"""
+        with self.lock:
+            lines = self.pending
+            self.pending = []
+            self.last_flush_time = time.time()
+        if not lines:
+            return 0
+
+        with self.write_lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as log_file:
+                    log_file.write('\n'.join(lines) + '\n')
+                    size = log_file.tell()
+            except OSError as e:
+                # Keep the events for the next flush rather than dropping them
+                print(f"EventLog[{self.stream}]: Write of {len(lines)} events failed ({e}). Will retry.")
+                with self.lock:
+                    self.pending = lines + self.pending
+                return 0
+            self.written += len(lines)
+            if size >= self.max_bytes:
+                self.rotate()
+        return len(lines)
+
+    def rotate(self):
+        """Move the active file aside and drop the oldest rotated files beyond max_files"""
+        if not os.path.exists(self.path):
+            return
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+        counter = 0
+        target = os.path.join(self.directory, f'{self.stream}-{stamp}-00{ACTIVE_SUFFIX}')
+        while os.path.exists(target):
+            counter += 1
+            target = os.path.join(self.directory, f'{self.stream}-{stamp}-{counter:02d}{ACTIVE_SUFFIX}')
+        os.replace(self.path, target)
+        for old in rotated_files(self.directory, self.stream)[:-self.max_files]:
+            os.remove(old)
+
+    def close(self):
+        """Stop the background flush and write what is buffered; a later write starts it again"""
+        with self.lock:
+            flush_thread, self.flush_thread = self.flush_thread, None
+            stopping, self.stopping = self.stopping, threading.Event()
+        stopping.set()
+        if flush_thread is not None and flush_thread is not threading.current_thread():
+            flush_thread.join(timeout=self.flush_interval)
+        self.flush()
+
+
+def rotated_files(directory, stream):
+    """Rotated files of one stream, oldest first (the names sort by rotation time)"""
+    return sorted(
+        path for path in glob.glob(os.path.join(glob.escape(directory), f'{glob.escape(stream)}-*{ACTIVE_SUFFIX}'))
+        if LOG_FILE_PATTERN.match(os.path.basename(path)).group('stream') == stream
+    )
+
+
+def log_files(directory=None, streams=None):
+    """Every event log file in `directory`, rotated ones before the active one for each stream"""
+    directory = directory or event_log_dir()
+    if streams is None:
+        streams = sorted({
+            LOG_FILE_PATTERN.match(os.path.basename(path)).group('stream')
+            for path in glob.glob(os.path.join(glob.escape(directory), '*' + ACTIVE_SUFFIX))
+        })
+    files = []
+    for stream in streams:
+        files += rotated_files(directory, stream)
+        active = os.path.join(directory, stream + ACTIVE_SUFFIX)
+        if os.path.exists(active):
+            files.append(active)
+    return files
+
+
+def read_events(directory=None, streams=None, event_types=None, signal_id=None, since=None, until=None):
+    """Yield events from the log files matching the filters (times are unix seconds)"""
+    for path in log_files(directory, streams):
+        with open(path, encoding='utf-8') as log_file:
+            for line in log_file:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                if since is not None and event['ts'] < since:
+                    continue
+                if until is not None and event['ts'] >= until:
+                    continue
+                if event_types and event['type'] not in event_types:
+                    continue
+                if signal_id is not None and event['signal'] != signal_id:
+                    continue
+                yield event
+
+
+# One log per stream and process
+event_logs = {}
+event_logs_lock = threading.Lock()
+
+def get_event_log(stream):
+    """Get or create this process's event log for `stream` ('detection', 'control', ...)"""
+    with event_logs_lock:
+        if stream not in event_logs:
+            event_logs[stream] = EventLog(stream)
+        return event_logs[stream]
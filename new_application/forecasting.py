@@ -0,0 +1,154 @@
+import math
+import threading
+import numpy as np
+
+
+def arrival_series(histories, step_seconds):
+    """Per-step arrival rates (vehicles/second) from SignalHistory ring buffers.
+
+    Returns (signal_ids, rates) where rates has one row per signal on a common time
+    grid, with NaN for steps a signal has no samples in.
+    """
+    windows = {}
+    for signal_id, history in histories.items():
+        if history.size >= 2:
+            windows[signal_id] = history.window()
+    if not windows:
+        return [], np.zeros((0, 0))
+
+    start = min(timestamps[0] for timestamps, _, _ in windows.values())
+    end = max(timestamps[-1] for timestamps, _, _ in windows.values())
+    num_steps = int((end - start) // step_seconds)
+    signal_ids = sorted(windows)
+    rates = np.full((len(signal_ids), num_steps), np.nan)
+    if num_steps == 0:
+        return signal_ids, rates
+
+    for row, signal_id in enumerate(signal_ids):
+        timestamps, counts, _ = windows[signal_id]
+        steps = ((timestamps[1:] - start) // step_seconds).astype(np.int64)
+        increases = np.clip(np.diff(counts), 0, None)
+        complete = steps < num_steps  # the last, partial step is left to live updates
+        arrivals = np.zeros(num_steps)
+        seen = np.zeros(num_steps, dtype=bool)
+        np.add.at(arrivals, steps[complete], increases[complete])
+        seen[steps[complete]] = True
+        rates[row, seen] = arrivals[seen] / step_seconds
+    return signal_ids, rates
+
+
+class ArrivalForecaster:
+    """Short-horizon arrival forecasts per approach using Holt's linear exponential smoothing.
+
+    Level and trend for every approach live in flat NumPy arrays and are updated
+    together once per `step_seconds`, so forecasting a whole network is a few
+    vector operations per step.
+    """
+
+    def __init__(self, step_seconds=30.0, alpha=0.3, beta=0.1, min_steps=10, capacity=16):
+        self.step_seconds = step_seconds
+        self.alpha = alpha
+        self.beta = beta
+        self.min_steps = min_steps
+        self.index = {}  # signal_id -> row
+        self.level = np.zeros(capacity)
+        self.trend = np.zeros(capacity)
+        self.steps = np.zeros(capacity, dtype=np.int64)
+        self.last_totals = np.full(capacity, np.nan)
+        self.last_step_time = None
+        self.lock = threading.Lock()
+
+    def _rows(self, signal_ids):
+        rows = []
+        for signal_id in signal_ids:
+            row = self.index.get(signal_id)
+            if row is None:
+                if len(self.index) == len(self.level):
+                    extra = len(self.level)
+                    self.level = np.concatenate([self.level, np.zeros(extra)])
+                    self.trend = np.concatenate([self.trend, np.zeros(extra)])
+                    self.steps = np.concatenate([self.steps, np.zeros(extra, dtype=np.int64)])
+                    self.last_totals = np.concatenate([self.last_totals, np.full(extra, np.nan)])
+                row = self.index[signal_id] = len(self.index)
+            rows.append(row)
+        return np.array(rows, dtype=np.int64)
+
+    def _smooth(self, rows, rates):
+        """One Holt step for the given rows; NaN rates leave their row unchanged"""
+        known = ~np.isnan(rates)
+        rows, rates = rows[known], rates[known]
+        first = self.steps[rows] == 0
+        level, trend = self.level[rows], self.trend[rows]
+
+        new_level = self.alpha * rates + (1 - self.alpha) * (level + trend)
+        new_trend = self.beta * (new_level - level) + (1 - self.beta) * trend
+        self.level[rows] = np.where(first, rates, new_level)
+        self.trend[rows] = np.where(first, 0.0, new_trend)
+        self.steps[rows] += 1
+
+    def fit(self, signal_ids, rates):
+        """Train on a (signals x steps) matrix of past arrival rates, oldest step first"""
+        with self.lock:
+            rows = self._rows(signal_ids)
+            for step in range(rates.shape[1]):
+                self._smooth(rows, rates[:, step])
+
+    def observe(self, arrival_totals, now):
+        """Incremental update from cumulative arrival counters ({signal_id: vehicles}), once per step"""
+        with self.lock:
+            if self.last_step_time is not None and now - self.last_step_time < self.step_seconds:
+                return False
+            signal_ids = list(arrival_totals)
+            rows = self._rows(signal_ids)
+            totals = np.array([arrival_totals[signal_id] for signal_id in signal_ids], dtype=float)
+            if self.last_step_time is None:
+                self.last_step_time = now
+                self.last_totals[rows] = totals
+                return False
+            elapsed = now - self.last_step_time
+
+            # Approaches seen for the first time only start their counter this step
+            rates = (totals - self.last_totals[rows]) / elapsed
+            self._smooth(rows, np.maximum(rates, 0.0))
+            self.last_totals[rows] = totals
+            self.last_step_time = now
+            return True
+
+    def ready(self, signal_ids):
+        """True when every approach has enough history for its forecast to be trusted"""
+        with self.lock:
+            return all(signal_id in self.index and self.steps[self.index[signal_id]] >= self.min_steps
+                       for signal_id in signal_ids)
+
+    def forecast_rates(self, signal_ids, horizon_seconds):
+        """Average arrival rate (vehicles/second) expected over the next `horizon_seconds`"""
+        with self.lock:
+            rows = self._rows(signal_ids)
+            # Mean of the linear forecast over the horizon is its value half way through
+            steps_ahead = 0.5 * horizon_seconds / self.step_seconds
+            return np.maximum(self.level[rows] + self.trend[rows] * steps_ahead, 0.0)
+
+
+def plan_cycle(queues, rates, min_green, max_green, lost_time, saturation_flow=0.5):
+    """Green time per phase for one cycle served in the given order.
+
+    Each phase gets enough green to discharge its current queue plus the vehicles
+    forecast to arrive while it waits and while it is green:
+        green_i = (queue_i + rate_i * wait_i) / (saturation_flow - rate_i)
+    clipped to [min_green, max_green]. Inputs are (junctions x phases) arrays or
+    1-D arrays for a single junction; all junctions are planned together.
+    """
+    queues, rates = np.atleast_2d(queues).astype(float), np.atleast_2d(rates).astype(float)
+    min_green, max_green = np.atleast_2d(min_green).astype(float), np.atleast_2d(max_green).astype(float)
+    lost_time = np.atleast_2d(lost_time).astype(float)
+
+    green = np.zeros_like(queues)
+    wait = np.zeros(queues.shape[0])
+    for phase in range(queues.shape[1]):
+        rate = rates[:, phase]
+        spare = saturation_flow - rate
+        needed = np.divide(queues[:, phase] + rate * wait, spare,
+                           out=np.full_like(rate, math.inf), where=spare > 0)
+        green[:, phase] = np.clip(np.ceil(needed), min_green[:, phase], max_green[:, phase])
+        wait += green[:, phase] + lost_time[:, phase]
+    return green.astype(np.int64)
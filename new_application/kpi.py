@@ -0,0 +1,156 @@
+import math
+import threading
+
+
+class ApproachKPIs:
+    """Running performance figures for one approach.
+
+    Sums decay exponentially with time constant `tau`, so the figures describe the
+    last few cycles rather than the whole uptime, and every update is O(1).
+    """
+
+    def __init__(self, signal_id, tau=900.0, cycle_alpha=0.3):
+        self.signal_id = signal_id
+        self.tau = tau
+        self.cycle_alpha = cycle_alpha
+        self.state = None
+        self.last_time = None
+        self.last_count = None
+        self.decayed_at = None
+        self.vehicle_seconds = 0.0  # vehicles in the detection area, integrated over time
+        self.arrivals = 0.0
+        self.departures = 0.0  # vehicles that left the area while green
+        self.green_seconds = 0.0
+        self.wasted_green_seconds = 0.0  # green with nobody in the area
+        self.green_started = None
+        self.cycle = None  # EWMA of time between consecutive green onsets
+        self.last_cycle = None
+        self.greens = 0
+
+    def _decay(self, now):
+        if self.decayed_at is not None and now > self.decayed_at:
+            factor = math.exp(-(now - self.decayed_at) / self.tau)
+            self.vehicle_seconds *= factor
+            self.arrivals *= factor
+            self.departures *= factor
+            self.green_seconds *= factor
+            self.wasted_green_seconds *= factor
+        self.decayed_at = now
+
+    def observe(self, count, now, state=None):
+        """A detection count for this approach; the interval since the last one is charged to the current phase"""
+        if self.state is None:
+            self.state = state
+        if self.last_time is not None and now > self.last_time:
+            dt = now - self.last_time
+            self._decay(now)
+            self.vehicle_seconds += (self.last_count + count) / 2.0 * dt
+            if count > self.last_count:
+                self.arrivals += count - self.last_count
+            if self.state == 'GREEN':
+                self.green_seconds += dt
+                if self.last_count == 0:
+                    self.wasted_green_seconds += dt
+                if count < self.last_count:
+                    self.departures += self.last_count - count
+        elif self.last_time is None:
+            self.decayed_at = now
+        self.last_time = now
+        self.last_count = count
+
+    def phase(self, state, now):
+        """A phase change of this approach; returns the completed cycle length on a new green"""
+        completed = None
+        if state == 'GREEN' and self.state != 'GREEN':
+            if self.green_started is not None:
+                completed = self.last_cycle = now - self.green_started
+                self.cycle = completed if self.cycle is None else \
+                    self.cycle + self.cycle_alpha * (completed - self.cycle)
+            self.green_started = now
+            self.greens += 1
+        self.state = state
+        return completed
+
+    def summary(self):
+        return {
+            'signal_id': self.signal_id,
+            'avg_delay_seconds': round(self.vehicle_seconds / self.arrivals, 1) if self.arrivals > 0 else 0.0,
+            'green_utilization': round(1.0 - self.wasted_green_seconds / self.green_seconds, 3) if self.green_seconds > 0 else None,
+            'wasted_green_seconds': round(self.wasted_green_seconds, 1),
+            'throughput_per_green_second': round(self.departures / self.green_seconds, 3) if self.green_seconds > 0 else None,
+            'cycle_length': round(self.cycle, 1) if self.cycle is not None else None,
+            'last_cycle_length': round(self.last_cycle, 1) if self.last_cycle is not None else None,
+            'greens': self.greens,
+        }
+
+
+class KPIEngine:
+    """Online cycle-level KPIs for the dashboard.
+
+    Fed by the control worker: phase changes as they are logged, detection counts
+    from the signal rows it reads every tick, and emergency greens from preemption.
+    Each event updates one approach in O(1); `summary()` is what gets published
+    with the live state.
+    """
+
+    def __init__(self, tau=900.0, cycle_alpha=0.3):
+        self.tau = tau
+        self.cycle_alpha = cycle_alpha
+        self.approaches = {}
+        self.cycle = None  # network cycle length, EWMA over every approach's cycles
+        self.emergency_count = 0
+        self.emergency_response = None  # EWMA of detection-to-green seconds
+        self.emergency_last = None
+        self.emergency_max = 0.0
+        self.lock = threading.Lock()
+
+    def get(self, signal_id):
+        approach = self.approaches.get(signal_id)
+        if approach is None:
+            approach = self.approaches[signal_id] = ApproachKPIs(signal_id, self.tau, self.cycle_alpha)
+        return approach
+
+    def observe_counts(self, signals, now):
+        """Record the detection counts on the signal rows loaded this tick"""
+        with self.lock:
+            for signal in signals:
+                self.get(signal.signal_id).observe(signal.vehicle_count, now, signal.current_state)
+
+    def phase_change(self, signal_id, state, now):
+        with self.lock:
+            completed = self.get(signal_id).phase(state, now)
+            if completed is not None:
+                self.cycle = completed if self.cycle is None else \
+                    self.cycle + self.cycle_alpha * (completed - self.cycle)
+
+    def emergency_served(self, signal_id, latency):
+        """An emergency approach turned green `latency` seconds after the vehicle was detected"""
+        with self.lock:
+            self.emergency_count += 1
+            self.emergency_last = latency
+            self.emergency_max = max(self.emergency_max, latency)
+            self.emergency_response = latency if self.emergency_response is None else \
+                self.emergency_response + self.cycle_alpha * (latency - self.emergency_response)
+
+    def summary(self):
+        with self.lock:
+            approaches = list(self.approaches.values())
+            green = sum(a.green_seconds for a in approaches)
+            wasted = sum(a.wasted_green_seconds for a in approaches)
+            arrivals = sum(a.arrivals for a in approaches)
+            departures = sum(a.departures for a in approaches)
+            return {
+                # Share of green time given to approaches that had vehicles waiting
+                'system_efficiency': round(100.0 * (1.0 - wasted / green), 1) if green > 0 else 0.0,
+                'cycle_time': round(self.cycle, 1) if self.cycle is not None else 0.0,
+                'avg_delay_seconds': round(sum(a.vehicle_seconds for a in approaches) / arrivals, 1) if arrivals > 0 else 0.0,
+                'throughput_per_green_second': round(departures / green, 3) if green > 0 else 0.0,
+                'wasted_green_seconds': round(wasted, 1),
+                'emergency_response': {
+                    'count': self.emergency_count,
+                    'avg_seconds': round(self.emergency_response, 2) if self.emergency_response is not None else None,
+                    'last_seconds': round(self.emergency_last, 2) if self.emergency_last is not None else None,
+                    'max_seconds': round(self.emergency_max, 2),
+                },
+                'approaches': {a.signal_id: a.summary() for a in sorted(approaches, key=lambda a: a.signal_id)},
+            }
@@ -0,0 +1,159 @@
+import json
+import time
+import struct
+import bisect
+import threading
+import redis
+
+# Histogram bucket upper edges in milliseconds; the last bucket is open-ended
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# Frames on the Redis frame channels carry this header in front of the JPEG bytes
+FRAME_MAGIC = b'TFv1'
+FRAME_HEADER = struct.Struct('>4sQdd')  # magic, seq, monotonic capture time, wall capture time
+LATENCY_KEY = 'latency_stats:{source}'
+
+
+class FrameStamp:
+    """Identity and capture time of one frame, carried with it through the pipeline.
+
+    `mono` is time.monotonic() at capture and is what in-process and same-host hops
+    are measured against; `wall` is kept for the database and for display.
+    """
+    __slots__ = ('seq', 'mono', 'wall')
+
+    def __init__(self, seq, mono, wall):
+        self.seq = seq
+        self.mono = mono
+        self.wall = wall
+
+    @classmethod
+    def now(cls, seq):
+        return cls(seq, time.monotonic(), time.time())
+
+    def age(self):
+        return time.monotonic() - self.mono
+
+
+def pack_frame(stamp, jpeg_bytes):
+    return FRAME_HEADER.pack(FRAME_MAGIC, stamp.seq, stamp.mono, stamp.wall) + jpeg_bytes
+
+
+def unpack_frame(data):
+    """(stamp, jpeg_bytes); stamp is None for bare JPEG frames from older publishers"""
+    if data[:4] != FRAME_MAGIC or len(data) < FRAME_HEADER.size:
+        return None, data
+    _, seq, mono, wall = FRAME_HEADER.unpack_from(data)
+    return FrameStamp(seq, mono, wall), data[FRAME_HEADER.size:]
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; recording is O(log buckets), percentiles are bucket upper edges"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = None
+
+    def record(self, seconds):
+        ms = max(seconds, 0.0) * 1000.0
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.last_ms = ms
+
+    def percentile(self, q):
+        if self.count == 0:
+            return None
+        target = q / 100.0 * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target and bucket_count:
+                return float(BUCKETS_MS[index]) if index < len(BUCKETS_MS) else round(self.max_ms, 1)
+        return round(self.max_ms, 1)
+
+    def stats(self):
+        if self.count == 0:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 1),
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max_ms, 1),
+            'last_ms': round(self.last_ms, 1),
+            'buckets_ms': dict(zip([str(edge) for edge in BUCKETS_MS] + ['inf'], self.counts)),
+        }
+
+
+class LatencyTracker:
+    """Per-hop latency histograms for one process (detection, control or web).
+
+    Hop names ending in a stage ('decode', 'inference', ...) time that stage alone;
+    'capture_to_*' hops time from the frame's capture to that point.
+    """
+
+    def __init__(self, source, publish_interval=5.0):
+        self.source = source
+        self.publish_interval = publish_interval
+        self.last_publish = 0.0
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, hop, seconds):
+        with self.lock:
+            histogram = self.histograms.get(hop)
+            if histogram is None:
+                histogram = self.histograms[hop] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def since_capture(self, hop, stamp):
+        """Record the time from `stamp`'s capture to now"""
+        if stamp is not None:
+            self.record(hop, stamp.age())
+
+    def stats(self):
+        with self.lock:
+            return {hop: histogram.stats() for hop, histogram in sorted(self.histograms.items())}
+
+    def publish(self, redis_client, force=False):
+        """Store this process's histograms in Redis for the latency endpoint, at most every publish_interval"""
+        now = time.monotonic()
+        if redis_client is None or (not force and now - self.last_publish < self.publish_interval):
+            return False
+        self.last_publish = now
+        try:
+            redis_client.set(LATENCY_KEY.format(source=self.source), json.dumps({
+                'updated_at': time.time(), 'hops': self.stats()
+            }), ex=300)
+            return True
+        except redis.exceptions.RedisError as e:
+            print(f"LatencyTracker[{self.source}]: Could not publish stats: {e}")
+            return False
+
+
+def load_published(redis_client, sources=None):
+    """Latency stats other processes stored in Redis, by source (every source that published if None)"""
+    published = {}
+    if sources is None:
+        prefix = LATENCY_KEY.format(source='')
+        try:
+            keys = [key.decode('utf-8') if isinstance(key, bytes) else key for key in redis_client.scan_iter(match=prefix + '*')]
+        except redis.exceptions.RedisError as e:
+            print(f"Could not list latency stats: {e}")
+            return published
+        sources = sorted(key[len(prefix):] for key in keys)
+    for source in sources:
+        try:
+            raw = redis_client.get(LATENCY_KEY.format(source=source))
+        except redis.exceptions.RedisError as e:
+            print(f"Could not read latency stats for {source}: {e}")
+            continue
+        if raw is not None:
+            published[source] = json.loads(raw)
+    return published
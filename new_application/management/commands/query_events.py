@@ -0,0 +1,61 @@
+import json
+import time
+import datetime
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+
+from new_application.event_log import read_events
+from new_application.wire_format import read_detection_details
+
+RELATIVE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_time(value):
+    """Unix time from '15m' / '2h' / '1d' (ago) or an ISO datetime (UTC if no offset)"""
+    if value is None:
+        return None
+    if value[-1:] in RELATIVE_UNITS and value[:-1].replace('.', '', 1).isdigit():
+        return time.time() - float(value[:-1]) * RELATIVE_UNITS[value[-1]]
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid time '{value}': use an ISO datetime or a relative time like 15m, 2h, 1d")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+class Command(BaseCommand):
+    help = "Search the detection/control event log files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stream', action='append', help="Only these streams (detection, control, or a pinned worker's e.g. detection-0-1); repeatable")
+        parser.add_argument('--type', action='append', dest='types', help="Only these event types; repeatable")
+        parser.add_argument('--signal', type=int, help="Only events of this signal id")
+        parser.add_argument('--since', help="Start time: ISO datetime or relative (15m, 2h, 1d)")
+        parser.add_argument('--until', help="End time: ISO datetime or relative")
+        parser.add_argument('--limit', type=int, default=0, help="Print at most this many events")
+        parser.add_argument('--count', action='store_true', help="Print event counts per type instead of events")
+        parser.add_argument('--dir', help="Event log directory (default: EVENT_LOG_DIR)")
+
+    def handle(self, *args, **options):
+        events = read_events(
+            directory=options['dir'], streams=options['stream'], event_types=set(options['types'] or []),
+            signal_id=options['signal'], since=parse_time(options['since']), until=parse_time(options['until'])
+        )
+
+        if options['count']:
+            counts = Counter(event['type'] for event in events)
+            for event_type, count in counts.most_common():
+                self.stdout.write(f"{count:>10}  {event_type}")
+            return
+
+        for printed, event in enumerate(events):
+            if options['limit'] and printed >= options['limit']:
+                break
+            moment = datetime.datetime.fromtimestamp(event['ts'], tz=datetime.timezone.utc)
+            details = event['details']
+            if event['type'] == 'DETECTION_UPDATE' and isinstance(details, dict):
+                details = read_detection_details(details)  # compact {v,n,w,q,c} form to named counts
+            self.stdout.write(f"{moment.isoformat(timespec='milliseconds')} {event['type']:<18} "
+                              f"signal={event['signal']} {json.dumps(details, separators=(',', ':'))}")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from new_application.worker_runner import WorkerSupervisor, resolve_signal_ids
+
+
+class Command(BaseCommand):
+    help = "Run the traffic control worker in this process, supervised, until SIGTERM/SIGINT"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--signals', action='append', help="Only cycle these signals (A,B or 0,1); repeatable")
+        parser.add_argument('--junction', action='append', type=int, dest='junctions',
+                            help="Only cycle the signals of this junction id; repeatable")
+        parser.add_argument('--check-interval', type=float, default=2.0, help="Seconds between thread checks")
+        parser.add_argument('--max-restarts', type=int, default=5,
+                            help="Thread restarts allowed per minute before the process exits")
+
+    def handle(self, *args, **options):
+        try:
+            signal_ids = resolve_signal_ids(options['signals'], options['junctions'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if signal_ids is not None and not signal_ids:
+            raise CommandError("No signals match the given --signals/--junction")
+
+        from new_application.traffic_control_worker import TrafficControlWorker
+        worker = TrafficControlWorker(signal_ids=signal_ids)
+        supervisor = WorkerSupervisor(worker, worker.name, check_interval=options['check_interval'],
+                                      max_restarts=options['max_restarts'])
+        if not supervisor.run():
+            raise CommandError(f"{worker.name}: worker thread kept crashing")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from new_application.worker_runner import WorkerSupervisor, resolve_signal_ids
+
+
+class Command(BaseCommand):
+    help = "Run the detection worker in this process, supervised, until SIGTERM/SIGINT"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--signals', action='append', help="Only these signals (A,B or 0,1); repeatable")
+        parser.add_argument('--junction', action='append', type=int, dest='junctions',
+                            help="Only the signals of this junction id; repeatable")
+        parser.add_argument('--check-interval', type=float, default=2.0, help="Seconds between thread checks")
+        parser.add_argument('--max-restarts', type=int, default=5,
+                            help="Thread restarts allowed per minute before the process exits")
+
+    def handle(self, *args, **options):
+        try:
+            signal_ids = resolve_signal_ids(options['signals'], options['junctions'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if signal_ids is not None:
+            if not signal_ids:
+                raise CommandError("No signals match the given --signals/--junction")
+            if any(not 0 <= signal_id < 4 for signal_id in signal_ids):
+                raise CommandError(f"Detection supports signals 0-3 (A-D), got {signal_ids}")
+
+        # Imported here so the YOLO model only loads when the command actually runs
+        from new_application.detection_worker import DetectionWorker
+        worker = DetectionWorker(signal_ids=signal_ids)
+        supervisor = WorkerSupervisor(worker, worker.name, check_interval=options['check_interval'],
+                                      max_restarts=options['max_restarts'])
+        if not supervisor.run():
+            raise CommandError(f"{worker.name}: worker threads kept crashing")
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_application', '0006_trafficdata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='systemsettings',
+            name='raw_data_retention_hours',
+            field=models.IntegerField(default=24, help_text='Hours to keep per-frame TrafficData before only rollups remain'),
+        ),
+        migrations.AddField(
+            model_name='systemsettings',
+            name='rollup_1min_retention_days',
+            field=models.IntegerField(default=7, help_text='Days to keep 1 minute rollups (15 minute rollups follow log_retention_days)'),
+        ),
+        migrations.AlterField(
+            model_name='trafficdata',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='TrafficDataRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.IntegerField(choices=[(60, '1 minute'), (900, '15 minutes')], help_text='Bucket width in seconds')),
+                ('bucket_start', models.DateTimeField()),
+                ('partition_day', models.DateField(help_text='UTC day of bucket_start, used to purge whole partitions')),
+                ('samples', models.IntegerField(default=0)),
+                ('vehicle_count_sum', models.IntegerField(default=0)),
+                ('vehicle_count_max', models.IntegerField(default=0)),
+                ('traffic_weight_sum', models.FloatField(default=0.0)),
+                ('green_time_sum', models.IntegerField(default=0)),
+                ('green_time_samples', models.IntegerField(default=0)),
+                ('auto_count_sum', models.IntegerField(default=0)),
+                ('bike_count_sum', models.IntegerField(default=0)),
+                ('bus_count_sum', models.IntegerField(default=0)),
+                ('car_count_sum', models.IntegerField(default=0)),
+                ('emergency_vehicles_count_sum', models.IntegerField(default=0)),
+                ('truck_count_sum', models.IntegerField(default=0)),
+                ('signal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='data_rollups', to='new_application.trafficsignal')),
+            ],
+            options={
+                'db_table': 'traffic_data_rollups',
+                'ordering': ['-bucket_start'],
+                'indexes': [models.Index(fields=['resolution', 'partition_day'], name='rollup_partition_idx')],
+                'constraints': [models.UniqueConstraint(fields=('signal', 'resolution', 'bucket_start'), name='unique_rollup_bucket')],
+            },
+        ),
+    ]
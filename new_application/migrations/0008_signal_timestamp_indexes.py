@@ -0,0 +1,37 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_application', '0007_trafficdatarollup_retention'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='congestionevent',
+            index=models.Index(fields=['signal', 'timestamp'], name='congestion_signal_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='signaltiminglog',
+            index=models.Index(fields=['signal', 'timestamp'], name='timing_logs_signal_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trafficdata',
+            index=models.Index(fields=['signal', 'timestamp'], name='traffic_data_signal_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trafficdata',
+            index=models.Index(fields=['timestamp'], name='traffic_data_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trafficlog',
+            index=models.Index(fields=['signal', 'timestamp'], name='traffic_logs_signal_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trafficlog',
+            index=models.Index(fields=['timestamp'], name='traffic_logs_ts_idx'),
+        ),
+    ]
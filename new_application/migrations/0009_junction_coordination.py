@@ -0,0 +1,46 @@
+# Generated by Django 5.1.5 on 2026-10-19 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_application', '0008_signal_timestamp_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='junctionsignals',
+            name='cycle_length',
+            field=models.FloatField(blank=True, help_text='Common cycle length in seconds (null when not coordinated)', null=True),
+        ),
+        migrations.AddField(
+            model_name='junctionsignals',
+            name='offset',
+            field=models.FloatField(default=0.0, help_text="Seconds after the corridor reference time at which this junction's cycle starts"),
+        ),
+        migrations.AddField(
+            model_name='junctionsignals',
+            name='plan_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='JunctionLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('free_flow_travel_time', models.FloatField(help_text='Configured travel time in seconds')),
+                ('measured_travel_time', models.FloatField(blank=True, help_text='Travel time measured from detections (seconds)', null=True)),
+                ('measured_at', models.DateTimeField(blank=True, null=True)),
+                ('from_junction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outgoing_links', to='new_application.junctionsignals')),
+                ('from_signal', models.ForeignKey(blank=True, help_text='Upstream approach whose green releases platoons onto this link', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='departing_links', to='new_application.trafficsignal')),
+                ('to_junction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='incoming_links', to='new_application.junctionsignals')),
+                ('to_signal', models.ForeignKey(blank=True, help_text='Downstream approach the platoons arrive at', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='arriving_links', to='new_application.trafficsignal')),
+            ],
+            options={
+                'db_table': 'junction_links',
+                'constraints': [models.UniqueConstraint(fields=('from_junction', 'to_junction'), name='unique_junction_link')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.5 on 2026-10-19 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_application', '0009_junction_coordination'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trafficsignal',
+            name='emergency_approach_direction',
+            field=models.CharField(choices=[('any', 'Any'), ('down', 'Down the frame'), ('up', 'Up the frame'), ('left', 'Right to left'), ('right', 'Left to right')], default='any', help_text='Image direction of vehicles approaching the stop line', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='trafficsignal',
+            name='emergency_confirm_frames',
+            field=models.IntegerField(default=3, help_text='Frames that must show the vehicle (N)'),
+        ),
+        migrations.AddField(
+            model_name='trafficsignal',
+            name='emergency_release_frames',
+            field=models.IntegerField(default=5, help_text='Consecutive empty frames before release'),
+        ),
+        migrations.AddField(
+            model_name='trafficsignal',
+            name='emergency_window_frames',
+            field=models.IntegerField(default=5, help_text='Frames the vote is taken over (M)'),
+        ),
+    ]
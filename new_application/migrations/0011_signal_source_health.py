@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-19 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_application', '0010_emergency_confirmation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trafficsignal',
+            name='source_health',
+            field=models.FloatField(default=1.0, help_text='Video source health (0-1); low values fall back to fixed timing'),
+        ),
+    ]
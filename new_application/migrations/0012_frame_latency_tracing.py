@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-19 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_application', '0011_signal_source_health'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trafficdata',
+            name='capture_time',
+            field=models.DateTimeField(blank=True, help_text='When the frame behind this snapshot was captured', null=True),
+        ),
+        migrations.AddField(
+            model_name='trafficsignal',
+            name='last_capture_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trafficsignal',
+            name='last_frame_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-19 20:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_application', '0012_frame_latency_tracing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trafficsignal',
+            name='zone_counts',
+            field=models.JSONField(default=dict, help_text='Latest counts per detection zone, keyed by zone name'),
+        ),
+        migrations.CreateModel(
+            name='DetectionZone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('zone_type', models.CharField(choices=[('LANE', 'Lane'), ('STOP_LINE', 'Stop line'), ('QUEUE_TAIL', 'Queue tail'), ('OTHER', 'Other')], default='LANE', max_length=20)),
+                ('polygon', models.JSONField(help_text='List of [x, y] frame coordinates, at least 3 points')),
+                ('area_size', models.FloatField(default=0.0)),
+                ('position', models.PositiveSmallIntegerField(default=0, help_text='Order of the zone within its approach')),
+                ('signal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detection_zones', to='new_application.trafficsignal')),
+            ],
+            options={
+                'db_table': 'detection_zones',
+                'ordering': ['signal', 'position'],
+                'constraints': [models.UniqueConstraint(fields=('signal', 'name'), name='unique_zone_name_per_signal')],
+            },
+        ),
+    ]
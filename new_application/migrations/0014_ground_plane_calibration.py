@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-19 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_application', '0013_detection_zones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionarea',
+            name='homography',
+            field=models.JSONField(blank=True, help_text='3x3 image-to-ground (metres) homography', null=True),
+        ),
+        migrations.AddField(
+            model_name='detectionarea',
+            name='lane_meters',
+            field=models.FloatField(default=0.0, help_text='Lane length covered by the area, 0 if uncalibrated'),
+        ),
+        migrations.AddField(
+            model_name='detectionarea',
+            name='lane_width',
+            field=models.FloatField(default=3.5, help_text='Lane width in metres'),
+        ),
+    ]
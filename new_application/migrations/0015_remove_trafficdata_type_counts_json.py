@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-19 21:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('new_application', '0014_ground_plane_calibration'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='trafficdata',
+            name='vehicle_type_counts_json',
+        ),
+    ]
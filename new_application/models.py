@@ -1,13 +1,50 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 import json
 from datetime import datetime
 import cv2
 import os
+from .emergency_confirmation import DIRECTION_ANY, APPROACH_DIRECTION_CHOICES
+from .zones import ZONE_LANE, ZONE_TYPE_CHOICES
+from .calibration import DEFAULT_LANE_WIDTH
 
 class JunctionSignals(models.Model):
     junction_name = models.CharField(max_length= 255)
 
+    # Coordination plan written by the corridor coordinator
+    cycle_length = models.FloatField(null=True, blank=True, help_text="Common cycle length in seconds (null when not coordinated)")
+    offset = models.FloatField(default=0.0, help_text="Seconds after the corridor reference time at which this junction's cycle starts")
+    plan_updated_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.junction_name
+
+class JunctionLink(models.Model):
+    """Road section between neighbouring junctions that platoons travel along"""
+    from_junction = models.ForeignKey(JunctionSignals, on_delete=models.CASCADE, related_name='outgoing_links')
+    to_junction = models.ForeignKey(JunctionSignals, on_delete=models.CASCADE, related_name='incoming_links')
+    from_signal = models.ForeignKey('TrafficSignal', on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='departing_links', help_text="Upstream approach whose green releases platoons onto this link")
+    to_signal = models.ForeignKey('TrafficSignal', on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='arriving_links', help_text="Downstream approach the platoons arrive at")
+    free_flow_travel_time = models.FloatField(help_text="Configured travel time in seconds")
+    measured_travel_time = models.FloatField(null=True, blank=True, help_text="Travel time measured from detections (seconds)")
+    measured_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'junction_links'
+        constraints = [
+            models.UniqueConstraint(fields=['from_junction', 'to_junction'], name='unique_junction_link'),
+        ]
+
+    @property
+    def travel_time(self):
+        return self.measured_travel_time if self.measured_travel_time is not None else self.free_flow_travel_time
+
+    def __str__(self):
+        return f"{self.from_junction} -> {self.to_junction} ({self.travel_time:.0f}s)"
+
 class TrafficSignal(models.Model):
     """Model representing a traffic signal with its current state and configuration"""
     junction = models.ForeignKey(JunctionSignals, on_delete=models.CASCADE, related_name= 'signals', null= True)
@@ -25,9 +62,11 @@ class TrafficSignal(models.Model):
     vehicle_count = models.IntegerField(default=0)
     traffic_weight = models.FloatField(default=0.0)
     avg_confidence = models.FloatField(default=0.0)
+    source_health = models.FloatField(default=1.0, help_text="Video source health (0-1); low values fall back to fixed timing")
     
     # Vehicle type counts (stored as JSON)
     vehicle_type_counts = models.JSONField(default=dict, help_text="Counts for each vehicle type")
+    zone_counts = models.JSONField(default=dict, help_text="Latest counts per detection zone, keyed by zone name")
     
     # Signal timing configuration
     min_green_time = models.IntegerField(default=10)
@@ -53,9 +92,18 @@ class TrafficSignal(models.Model):
     has_emergency_vehicle = models.BooleanField(default=False)
     emergency_vehicle_detected_time = models.DateTimeField(null=True, blank=True)
     emergency_vehicle_wait_time = models.FloatField(default=0.0)
+    # Emergency confirmation: N of M processed frames must agree before preemption
+    emergency_confirm_frames = models.IntegerField(default=3, help_text="Frames that must show the vehicle (N)")
+    emergency_window_frames = models.IntegerField(default=5, help_text="Frames the vote is taken over (M)")
+    emergency_release_frames = models.IntegerField(default=5, help_text="Consecutive empty frames before release")
+    emergency_approach_direction = models.CharField(max_length=10, default=DIRECTION_ANY, choices=APPROACH_DIRECTION_CHOICES,
+                                                    help_text="Image direction of vehicles approaching the stop line")
     
     # Timestamps
     last_update_time = models.DateTimeField(auto_now=True)
+    # Capture time and sequence number of the frame the detection fields came from
+    last_capture_time = models.DateTimeField(null=True, blank=True)
+    last_frame_seq = models.BigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -83,11 +131,13 @@ class TrafficSignal(models.Model):
 
 class TrafficData(models.Model):
     signal = models.ForeignKey(TrafficSignal, on_delete=models.CASCADE, related_name='data_snapshots')
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set by the writer (not auto_now_add) so buffered rows keep their capture time
+    timestamp = models.DateTimeField(default=timezone.now)
     
     vehicle_count = models.IntegerField(default=0, help_text="Total vehicles detected")
     traffic_weight = models.FloatField(default=0.0, help_text="Calculated traffic weight/density")
     green_time = models.IntegerField(null=True, blank=True, help_text="Green time of the signal at the moment of this snapshot")
+    capture_time = models.DateTimeField(null=True, blank=True, help_text="When the frame behind this snapshot was captured")
     
     # Individual vehicle type counts
     auto_count = models.IntegerField(default=0)
@@ -96,17 +146,72 @@ class TrafficData(models.Model):
     car_count = models.IntegerField(default=0)
     emergency_vehicles_count = models.IntegerField(default=0)
     truck_count = models.IntegerField(default=0)
-    vehicle_type_counts_json = models.JSONField(default=dict, help_text="JSON representation of all vehicle type counts")
 
     class Meta:
         db_table = 'traffic_data' # Keep the same table name for continuity if desired
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['signal', 'timestamp'], name='traffic_data_signal_ts_idx'),
+            models.Index(fields=['timestamp'], name='traffic_data_ts_idx'),
+        ]
         verbose_name = "Traffic Data Snapshot"
         verbose_name_plural = "Traffic Data Snapshots"
 
     def __str__(self):
         return f"Snapshot for Signal {self.signal.signal_id} at {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
 
+class TrafficDataRollup(models.Model):
+    """Downsampled TrafficData buckets (1 min and 15 min), partitioned by day for retention"""
+    RESOLUTION_1MIN = 60
+    RESOLUTION_15MIN = 900
+
+    signal = models.ForeignKey(TrafficSignal, on_delete=models.CASCADE, related_name='data_rollups')
+    resolution = models.IntegerField(choices=[
+        (RESOLUTION_1MIN, '1 minute'),
+        (RESOLUTION_15MIN, '15 minutes')
+    ], help_text="Bucket width in seconds")
+    bucket_start = models.DateTimeField()
+    partition_day = models.DateField(help_text="UTC day of bucket_start, used to purge whole partitions")
+
+    # Sums are stored (not averages) so buckets can be re-aggregated into coarser ones
+    samples = models.IntegerField(default=0)
+    vehicle_count_sum = models.IntegerField(default=0)
+    vehicle_count_max = models.IntegerField(default=0)
+    traffic_weight_sum = models.FloatField(default=0.0)
+    green_time_sum = models.IntegerField(default=0)
+    green_time_samples = models.IntegerField(default=0)
+    auto_count_sum = models.IntegerField(default=0)
+    bike_count_sum = models.IntegerField(default=0)
+    bus_count_sum = models.IntegerField(default=0)
+    car_count_sum = models.IntegerField(default=0)
+    emergency_vehicles_count_sum = models.IntegerField(default=0)
+    truck_count_sum = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'traffic_data_rollups'
+        ordering = ['-bucket_start']
+        constraints = [
+            models.UniqueConstraint(fields=['signal', 'resolution', 'bucket_start'], name='unique_rollup_bucket')
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'partition_day'], name='rollup_partition_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.resolution}s rollup for Signal {self.signal.signal_id} at {self.bucket_start.strftime('%Y-%m-%d %H:%M')}"
+
+    @property
+    def vehicle_count_avg(self):
+        return self.vehicle_count_sum / self.samples if self.samples else 0.0
+
+    @property
+    def traffic_weight_avg(self):
+        return self.traffic_weight_sum / self.samples if self.samples else 0.0
+
+    @property
+    def green_time_avg(self):
+        return self.green_time_sum / self.green_time_samples if self.green_time_samples else None
+
 class TrafficLog(models.Model):
     """Model for logging traffic signal events and state changes"""
     signal = models.ForeignKey(TrafficSignal, on_delete=models.CASCADE, related_name='logs')
@@ -126,6 +231,10 @@ class TrafficLog(models.Model):
     class Meta:
         db_table = 'traffic_logs'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['signal', 'timestamp'], name='traffic_logs_signal_ts_idx'),
+            models.Index(fields=['timestamp'], name='traffic_logs_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.signal} - {self.event_type} at {self.timestamp}"
@@ -135,6 +244,10 @@ class DetectionArea(models.Model):
     signal = models.OneToOneField(TrafficSignal, on_delete=models.CASCADE, related_name='detection_area')
     area_points = models.JSONField(help_text="List of [x, y] coordinates defining the detection area")
     area_size = models.FloatField(default=0.0, help_text="Calculated area size")
+    # Ground-plane calibration; without it congestion falls back to pixel density
+    homography = models.JSONField(null=True, blank=True, help_text="3x3 image-to-ground (metres) homography")
+    lane_width = models.FloatField(default=DEFAULT_LANE_WIDTH, help_text="Lane width in metres")
+    lane_meters = models.FloatField(default=0.0, help_text="Lane length covered by the area, 0 if uncalibrated")
     
     class Meta:
         db_table = 'detection_areas'
@@ -142,6 +255,25 @@ class DetectionArea(models.Model):
     def __str__(self):
         return f"Detection Area for Signal {self.signal}"
 
+class DetectionZone(models.Model):
+    """Named sub-area of an approach (lane, stop line, queue tail); zones may overlap"""
+    signal = models.ForeignKey(TrafficSignal, on_delete=models.CASCADE, related_name='detection_zones')
+    name = models.CharField(max_length=50)
+    zone_type = models.CharField(max_length=20, default=ZONE_LANE, choices=ZONE_TYPE_CHOICES)
+    polygon = models.JSONField(help_text="List of [x, y] frame coordinates, at least 3 points")
+    area_size = models.FloatField(default=0.0)
+    position = models.PositiveSmallIntegerField(default=0, help_text="Order of the zone within its approach")
+    
+    class Meta:
+        db_table = 'detection_zones'
+        ordering = ['signal', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['signal', 'name'], name='unique_zone_name_per_signal')
+        ]
+    
+    def __str__(self):
+        return f"{self.get_zone_type_display()} zone '{self.name}' of Signal {self.signal}"
+
 class VideoSource(models.Model):
     """Model for storing video source configurations"""
     signal = models.OneToOneField(TrafficSignal, on_delete=models.CASCADE, related_name='video_source')
@@ -163,6 +295,8 @@ class SystemSettings(models.Model):
     detection_interval = models.FloatField(default=0.1, help_text="Detection loop interval in seconds")
     control_interval = models.FloatField(default=0.1, help_text="Control loop interval in seconds")
     log_retention_days = models.IntegerField(default=30, help_text="Days to retain logs")
+    raw_data_retention_hours = models.IntegerField(default=24, help_text="Hours to keep per-frame TrafficData before only rollups remain")
+    rollup_1min_retention_days = models.IntegerField(default=7, help_text="Days to keep 1 minute rollups (15 minute rollups follow log_retention_days)")
     
     # YOLO model settings
     yolo_model_path = models.CharField(max_length=500, default="my_model (2).pt")
@@ -194,6 +328,9 @@ class CongestionEvent(models.Model):
     class Meta:
         db_table = 'congestion_events'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['signal', 'timestamp'], name='congestion_signal_ts_idx'),
+        ]
     
     def __str__(self):
         return f"Congestion Event at Signal {self.signal} - {self.severity}"
@@ -210,6 +347,9 @@ class SignalTimingLog(models.Model):
     class Meta:
         db_table = 'signal_timing_logs'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['signal', 'timestamp'], name='timing_logs_signal_ts_idx'),
+        ]
     
     def __str__(self):
         return f"Timing Log for Signal {self.signal} - {self.reason}"
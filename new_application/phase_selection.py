@@ -0,0 +1,79 @@
+ORDER_PRESSURE = 'pressure'
+ORDER_CYCLIC = 'cyclic'
+
+
+class PhaseSelector:
+    """Chooses which approach gets the next green.
+
+    Approaches with no detected vehicles are skipped (unless their video source is
+    unhealthy, when the count means nothing). Among those with demand the next
+    green goes to the highest pressure (traffic weight plus a charge per
+    second already spent waiting), or to the next one in cyclic order with
+    ORDER_CYCLIC. Fairness limits always win: an approach with demand that has
+    been red for `max_red` seconds is served first, and any approach, empty or
+    not, is served after `max_skip` seconds so a missed detection cannot starve it.
+    """
+
+    def __init__(self, order=ORDER_PRESSURE, max_red=120.0, max_skip=300.0, wait_weight=0.1, demand_threshold=0,
+                 min_source_health=0.5):
+        self.order = order
+        self.max_red = max_red
+        self.max_skip = max_skip
+        self.wait_weight = wait_weight  # traffic weight units per second of waiting
+        self.demand_threshold = demand_threshold
+        self.min_source_health = min_source_health  # below this the detection counts are not trusted
+        self.red_since = {}  # signal_id -> time its last green ended
+        self.skips = 0
+
+    def source_ok(self, signal):
+        return getattr(signal, 'source_health', 1.0) >= self.min_source_health
+
+    def has_demand(self, signal):
+        # An approach whose camera is down may have traffic nobody can see, so it is never skipped
+        return signal.vehicle_count > self.demand_threshold or signal.has_emergency_vehicle or \
+            not self.source_ok(signal)
+
+    def waited(self, signal_id, now):
+        return now - self.red_since.setdefault(signal_id, now)
+
+    def mark_green_end(self, signal_id, now):
+        self.red_since[signal_id] = now
+
+    def cyclic_order(self, signal_ids, current_id):
+        """Signal ids after `current_id` in round-robin order, ending with `current_id`"""
+        signal_ids = sorted(signal_ids)
+        start = signal_ids.index(current_id) + 1 if current_id in signal_ids else 0
+        return signal_ids[start:] + signal_ids[:start]
+
+    def select_next(self, signals, current_id, now, skip=True):
+        """Signal id to turn green after `current_id`; `signals` is {signal_id: signal}"""
+        order = self.cyclic_order(signals, current_id)
+        candidates = [signal_id for signal_id in order if signal_id != current_id] or order
+        if not skip:
+            return candidates[0]
+
+        waits = {signal_id: self.waited(signal_id, now) for signal_id in candidates}
+
+        # Fairness limits first, most overdue first
+        overdue = [signal_id for signal_id in candidates
+                   if (waits[signal_id] >= self.max_red and self.has_demand(signals[signal_id]))
+                   or waits[signal_id] >= self.max_skip]
+        if overdue:
+            return max(overdue, key=lambda signal_id: waits[signal_id])
+
+        demanded = [signal_id for signal_id in candidates if self.has_demand(signals[signal_id])]
+        if not demanded:
+            # Only the current approach has traffic: serve it again rather than idle in all-red
+            if current_id in signals and self.has_demand(signals[current_id]):
+                self.skips += len(candidates)
+                return current_id
+            return candidates[0]  # Nobody waiting anywhere: keep the normal rotation
+
+        if self.order == ORDER_CYCLIC:
+            choice = demanded[0]
+        else:
+            choice = max(demanded, key=lambda signal_id: (
+                signals[signal_id].traffic_weight + self.wait_weight * waits[signal_id], waits[signal_id]
+            ))
+        self.skips += candidates.index(choice) if self.order == ORDER_CYCLIC else len(candidates) - len(demanded)
+        return choice
@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+import redis
+from redis.retry import Retry
+from redis.backoff import NoBackoff
+from django.conf import settings
+
+EMERGENCY_CHANNEL = 'emergency_events'
+
+# Identifies this process so events it published are not delivered twice
+PROCESS_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+# Preemption states
+IDLE = 'IDLE'
+CLEARING = 'CLEARING'  # conflicting approach is in its (full) yellow
+ALL_RED = 'ALL_RED'
+SERVING = 'SERVING'  # emergency approach is green
+
+
+class EmergencyEventBus:
+    """Delivers emergency detections to the controller without going through the database.
+
+    Subscribers in the same process are called directly; the event is also
+    published on Redis for controllers running in other processes.
+    """
+
+    def __init__(self, redis_client=None, dedupe_size=1024):
+        self.redis = redis_client
+        self.subscribers = []
+        self.seen = OrderedDict()
+        self.dedupe_size = dedupe_size
+        self.lock = threading.Lock()
+        self.listener_thread = None
+
+    def subscribe(self, callback):
+        """Call `callback(event)` for every emergency event, local or remote"""
+        with self.lock:
+            self.subscribers.append(callback)
+        if self.redis is not None and self.listener_thread is None:
+            self.listener_thread = threading.Thread(target=self._listen, daemon=True)
+            self.listener_thread.start()
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    def publish(self, signal_id, active, detected_at=None, emergency_count=0, direction=None):
+        """Raise (active=True) or clear (active=False) an emergency on an approach"""
+        event = {
+            'id': uuid.uuid4().hex,
+            'origin': PROCESS_ID,
+            'signal_id': signal_id,
+            'active': active,
+            'emergency_count': emergency_count,
+            'direction': direction,
+            'detected_at': detected_at if detected_at is not None else time.time(),
+            'published_at': time.time(),
+        }
+        self._deliver(event)
+        if self.redis is not None:
+            try:
+                self.redis.publish(EMERGENCY_CHANNEL, json.dumps(event))
+            except redis.exceptions.RedisError as e:
+                print(f"EmergencyEventBus: Could not publish to Redis: {e}")
+        return event
+
+    def _deliver(self, event):
+        with self.lock:
+            if event['id'] in self.seen:
+                return
+            self.seen[event['id']] = True
+            while len(self.seen) > self.dedupe_size:
+                self.seen.popitem(last=False)
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"EmergencyEventBus: Subscriber error: {e}")
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(EMERGENCY_CHANNEL)
+                for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    event = json.loads(message['data'])
+                    if event.get('origin') != PROCESS_ID:
+                        self._deliver(event)
+            except (redis.exceptions.RedisError, ValueError) as e:
+                print(f"EmergencyEventBus: Redis listener error: {e}. Reconnecting in 5s.")
+                time.sleep(5.0)
+
+
+class PreemptionController:
+    """Emergency preemption as an explicit state machine driven by bus events.
+
+    IDLE -> CLEARING (the conflicting green runs its full yellow) -> ALL_RED ->
+    SERVING (emergency approach green while the vehicle is present, between
+    min_hold and max_hold seconds) -> back to the normal cycle, resuming the
+    interrupted approach. Latency is measured from the frame the emergency
+    vehicle was detected in to the start of preemption (reaction) and to the
+    emergency green.
+    """
+
+    def __init__(self, state_fields, clock=time.time, min_hold=5.0, max_hold=60.0, resume_threshold=8.0):
+        self.state_fields = state_fields  # signal fields the control worker owns
+        self.clock = clock
+        self.min_hold = min_hold
+        self.max_hold = max_hold
+        self.resume_threshold = resume_threshold  # interrupted greens with more left than this are resumed
+        self.events = queue.Queue()
+        self.wake = threading.Event()
+        self.requests = {}  # signal_id -> active event
+        self.state = IDLE
+        self.target = None
+        self.request = None
+        self.served_since = None
+        self.interrupted = None  # (signal_id, remaining green)
+        self.resume = None  # handed to the normal cycle when preemption ends
+        self.reaction_latencies = deque(maxlen=500)
+        self.green_latencies = deque(maxlen=500)
+        self.preemptions = 0
+
+    def submit(self, event):
+        """Queue an event and wake the control loop; safe to call from any thread"""
+        self.events.put(event)
+        self.wake.set()
+
+    def drain(self):
+        """Apply queued events to the set of active emergency requests"""
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if event.get('active'):
+                current = self.requests.get(event['signal_id'])
+                # Keep the first detection time so latency covers the whole wait
+                if current is None or event['detected_at'] < current['detected_at']:
+                    self.requests[event['signal_id']] = event
+                else:
+                    current['emergency_count'] = event.get('emergency_count', current['emergency_count'])
+            else:
+                self.requests.pop(event['signal_id'], None)
+
+    def observe_rows(self, signals):
+        """Fallback to the has_emergency_vehicle flags on the rows the control loop already loaded,
+        for detections from a process the bus could not reach"""
+        for signal_id, signal in signals.items():
+            if signal.has_emergency_vehicle and signal_id not in self.requests:
+                detected = getattr(signal, 'emergency_vehicle_detected_time', None)
+                self.requests[signal_id] = {
+                    'signal_id': signal_id, 'active': True,
+                    'emergency_count': signal.vehicle_type_counts.get('emergency_vehicles', 1),
+                    'detected_at': detected.timestamp() if detected else self.clock(),
+                    'fallback': True,
+                }
+            elif not signal.has_emergency_vehicle and self.requests.get(signal_id, {}).get('fallback'):
+                del self.requests[signal_id]
+
+    def hold_time(self, signal, request):
+        count = max(request.get('emergency_count', 1), 1)
+        return min(count * 2 + 10, signal.max_green_time)
+
+    def reset(self):
+        self.state = IDLE
+        self.target = None
+        self.request = None
+        self.served_since = None
+
+    def step(self, worker, signals):
+        """Advance the state machine; returns True while preemption owns the signals"""
+        now = self.clock()
+        active = signals.get(worker.current_system_signal)
+        if active is None:
+            return False
+
+        if self.state == IDLE:
+            if not self.requests:
+                return False
+            self.request = min(self.requests.values(), key=lambda r: r['detected_at'])
+            self.target = self.request['signal_id']
+            if self.target not in signals:
+                self.requests.pop(self.target, None)
+                self.reset()
+                return False
+            self.preemptions += 1
+            self.reaction_latencies.append(now - self.request['detected_at'])
+            print(f"🚑 Preemption for Signal {chr(65 + self.target)} started "
+                  f"{(now - self.request['detected_at']) * 1000:.0f} ms after detection")
+
+            if active.signal_id == self.target and active.current_state == 'GREEN':
+                self._start_serving(worker, active, now, already_green=True)
+            elif active.current_state == 'GREEN':
+                remaining = active.remaining_time
+                self.interrupted = (active.signal_id, remaining) if remaining > self.resume_threshold else None
+                active.current_state = 'YELLOW'
+                active.remaining_time = active.yellow_time
+                worker.store.save(active, self.state_fields)
+                worker.log_event(active, 'EMERGENCY_OVERRIDE', {
+                    'from_signal': chr(65 + active.signal_id), 'to_state': 'YELLOW',
+                    'reason': 'emergency_elsewhere', 'emergency_signal': chr(65 + self.target)
+                })
+                print(f"🚑 Forcing Signal {chr(65 + active.signal_id)} to YELLOW for {active.yellow_time}s")
+                self.state = CLEARING
+            elif active.current_state == 'YELLOW':
+                self.state = CLEARING
+            else:
+                self.state = ALL_RED
+            return True
+
+        if self.state == CLEARING:
+            if active.remaining_time <= 0:
+                active.current_state = 'RED'
+                active.remaining_time = active.all_red_time
+                worker.store.save(active, self.state_fields)
+                worker.log_event(active, 'EMERGENCY_OVERRIDE', {
+                    'from_signal': chr(65 + active.signal_id), 'to_state': 'RED', 'reason': 'emergency_yellow_to_red'
+                })
+                self.state = ALL_RED
+            return True
+
+        if self.state == ALL_RED:
+            if active.remaining_time <= 0 or active.signal_id == self.target:
+                target = signals[self.target]
+                if active.signal_id != self.target:
+                    worker.current_system_signal = self.target
+                self._start_serving(worker, target, now)
+            return True
+
+        if self.state == SERVING:
+            target = signals[self.target]
+            still_present = self.target in self.requests
+            served_for = now - self.served_since
+            if still_present and served_for < self.max_hold:
+                if target.remaining_time < self.min_hold:
+                    target.remaining_time = self.min_hold
+                    worker.store.save(target, ['remaining_time'])
+                return True
+
+            # Vehicle gone (or max hold reached): hand back to the normal cycle
+            self.requests.pop(self.target, None)
+            self.resume = self.interrupted
+            self.interrupted = None
+            print(f"🚑 Preemption for Signal {chr(65 + self.target)} ended after {served_for:.1f}s")
+            self.reset()
+            return bool(self.requests)
+        return False
+
+    def _start_serving(self, worker, target, now, already_green=False):
+        hold = self.hold_time(target, self.request)
+        target.current_state = 'GREEN'
+        target.remaining_time = max(target.remaining_time, hold) if already_green else hold
+        worker.store.save(target, self.state_fields)
+        worker.log_event(target, 'EMERGENCY_EXTEND' if already_green else 'STATE_CHANGE', {
+            'old_state': 'GREEN' if already_green else 'RED', 'new_state': 'GREEN',
+            'reason': 'emergency_force_green', 'green_time': target.remaining_time
+        })
+        latency = now - self.request['detected_at']
+        self.green_latencies.append(latency)
+        worker.kpis.emergency_served(target.signal_id, latency)
+        print(f"🚑 Signal {chr(65 + target.signal_id)} GREEN for emergency {latency:.2f}s after detection")
+        self.served_since = now
+        self.state = SERVING
+
+    def stats(self):
+        """Preemption counts and latency percentiles (milliseconds)"""
+        def summary(values):
+            if not values:
+                return None
+            p50, p95 = np.percentile(np.array(values) * 1000.0, [50, 95])
+            return {'p50_ms': round(float(p50), 1), 'p95_ms': round(float(p95), 1),
+                    'max_ms': round(max(values) * 1000.0, 1), 'last_ms': round(values[-1] * 1000.0, 1)}
+        return {
+            'state': self.state,
+            'target': self.target,
+            'active_requests': sorted(self.requests),
+            'preemptions': self.preemptions,
+            'reaction_latency': summary(list(self.reaction_latencies)),
+            'green_latency': summary(list(self.green_latencies)),
+        }
+
+
+# Global instance per process
+emergency_bus = None
+
+def get_emergency_bus():
+    """Get or create the global emergency event bus"""
+    global emergency_bus
+    if emergency_bus is None:
+        emergency_bus = EmergencyEventBus(redis.StrictRedis(
+            host=getattr(settings, 'REDIS_HOST', 'localhost'),
+            port=getattr(settings, 'REDIS_PORT', 6379),
+            db=getattr(settings, 'REDIS_DB', 0),
+            socket_connect_timeout=0.5,
+            retry=Retry(NoBackoff(), 0)
+        ))
+    return emergency_bus
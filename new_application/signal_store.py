@@ -0,0 +1,187 @@
+from contextlib import nullcontext, contextmanager
+from django.db import transaction
+from datetime import datetime, timezone as dt_timezone
+from .models import TrafficSignal, TrafficData, TrafficLog, SignalTimingLog, SystemSettings
+from .event_log import get_event_log, AUDIT_EVENT_TYPES
+
+# Defaults for a newly created signal, shared by the workers and the simulator
+SIGNAL_DEFAULTS = {
+    'current_state': 'RED',
+    'min_green_time': 10,
+    'max_green_time': 45,
+    'default_green_time': 15,
+    'yellow_time': 3,
+    'all_red_time': 2,
+    'vehicle_type_counts': {
+        'auto': 0, 'bike': 0, 'bus': 0,
+        'car': 0, 'emergency_vehicles': 0, 'truck': 0
+    }
+}
+
+
+class DatabaseSignalStore:
+    """Signal state persistence for the live control worker (Django ORM)"""
+
+    def __init__(self, event_log=None, signal_ids=None):
+        self.event_log = event_log or get_event_log('control')
+        self.pending_logs = None  # audit rows of the open atomic() block
+        # Only these signals when the worker is pinned to some of them; all otherwise
+        self.signal_ids = list(signal_ids) if signal_ids is not None else None
+
+    def signals(self):
+        if self.signal_ids is None:
+            return TrafficSignal.objects.all()
+        return TrafficSignal.objects.filter(signal_id__in=self.signal_ids)
+
+    def load_settings(self):
+        settings, _ = SystemSettings.objects.get_or_create(id=1)
+        return settings
+
+    def initialize_signals(self, signal_ids):
+        """Make sure a TrafficSignal row exists for every controlled signal"""
+        for signal_id in signal_ids:
+            signal, created = TrafficSignal.objects.get_or_create(
+                signal_id=signal_id,
+                defaults=dict(SIGNAL_DEFAULTS, vehicle_type_counts=dict(SIGNAL_DEFAULTS['vehicle_type_counts']))
+            )
+            if created:
+                print(f"Created new signal {chr(65+signal_id)}")
+
+    def get(self, signal_id):
+        return TrafficSignal.objects.get(signal_id=signal_id)
+
+    def all(self):
+        return {s.signal_id: s for s in self.signals()}
+
+    def save(self, signal, fields):
+        signal.save(update_fields=fields)
+
+    def log_event(self, signal, event_type, details):
+        """Every event goes to the event log; audit events are also kept as TrafficLog rows"""
+        self.event_log.write(event_type, signal.signal_id, details)
+        if event_type not in AUDIT_EVENT_TYPES:
+            return
+        row = TrafficLog(signal=signal, event_type=event_type, details=details)
+        if self.pending_logs is not None:
+            self.pending_logs.append(row)
+        else:
+            row.save()
+
+    def log_timing(self, signal, green_time, yellow_time, red_time, reason):
+        SignalTimingLog.objects.create(
+            signal=signal,
+            green_time=green_time,
+            yellow_time=yellow_time,
+            red_time=red_time,
+            reason=reason
+        )
+
+    def recent_traffic(self, since):
+        """(signal_id, unix time, vehicle_count, traffic_weight) rows recorded after `since`, oldest first"""
+        rows = TrafficData.objects.filter(
+            timestamp__gte=datetime.fromtimestamp(since, tz=dt_timezone.utc)
+        )
+        if self.signal_ids is not None:
+            rows = rows.filter(signal__signal_id__in=self.signal_ids)
+        rows = rows.order_by('timestamp').values_list('signal__signal_id', 'timestamp', 'vehicle_count', 'traffic_weight')
+        return [(signal_id, timestamp.timestamp(), count, weight) for signal_id, timestamp, count, weight in rows]
+
+    @contextmanager
+    def atomic(self):
+        """Transaction for one tick; its audit rows are written with a single insert at the end"""
+        outermost = self.pending_logs is None
+        with transaction.atomic():
+            if outermost:
+                self.pending_logs = []
+            try:
+                yield
+                if outermost and self.pending_logs:
+                    TrafficLog.objects.bulk_create(self.pending_logs)
+            finally:
+                if outermost:
+                    self.pending_logs = None
+
+    def close(self):
+        """Write out buffered events"""
+        self.event_log.flush()
+
+
+class SimulatedSignal:
+    """In-memory stand-in for a TrafficSignal row"""
+
+    def __init__(self, signal_id, **overrides):
+        self.signal_id = signal_id
+        for field, value in SIGNAL_DEFAULTS.items():
+            setattr(self, field, dict(value) if isinstance(value, dict) else value)
+        self.remaining_time = 0.0
+        self.vehicle_count = 0
+        self.traffic_weight = 0.0
+        self.avg_confidence = 0.0
+        self.calculated_green_time = self.default_green_time
+        self.pending_green_time = 0
+        self.congestion_level = 'LOW'
+        self.congestion_score = 0.0
+        self.zone_counts = {}
+        self.has_emergency_vehicle = False
+        self.source_health = 1.0
+        for field, value in overrides.items():
+            setattr(self, field, value)
+
+
+class SimulatedSettings:
+    """In-memory stand-in for the SystemSettings row"""
+
+    def __init__(self, control_interval=0.1, detection_interval=0.1):
+        self.emergency_mode_active = False
+        self.control_interval = control_interval
+        self.detection_interval = detection_interval
+
+    def save(self):
+        pass
+
+
+class InMemorySignalStore:
+    """Signal state kept in memory, so the controller can run without a database (simulation, tests)"""
+
+    def __init__(self, signal_ids=range(4), signal_overrides=None, keep_events=False):
+        signal_overrides = signal_overrides or {}
+        self.signals = {i: SimulatedSignal(i, **signal_overrides.get(i, {})) for i in signal_ids}
+        self.settings = SimulatedSettings()
+        self.keep_events = keep_events
+        self.events = []
+        self.event_counts = {}
+        self.timings = []
+
+    def load_settings(self):
+        return self.settings
+
+    def initialize_signals(self, signal_ids):
+        for signal_id in signal_ids:
+            self.signals.setdefault(signal_id, SimulatedSignal(signal_id))
+
+    def get(self, signal_id):
+        return self.signals[signal_id]
+
+    def all(self):
+        return dict(self.signals)
+
+    def save(self, signal, fields):
+        pass
+
+    def log_event(self, signal, event_type, details):
+        self.event_counts[event_type] = self.event_counts.get(event_type, 0) + 1
+        if self.keep_events:
+            self.events.append((signal.signal_id, event_type, details))
+
+    def log_timing(self, signal, green_time, yellow_time, red_time, reason):
+        if self.keep_events:
+            self.timings.append((signal.signal_id, green_time, yellow_time, red_time, reason))
+
+    def recent_traffic(self, since):
+        return []
+
+    def atomic(self):
+        return nullcontext()
+
+    def close(self):
+        pass
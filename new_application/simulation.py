@@ -0,0 +1,294 @@
+import os
+import io
+import time
+import contextlib
+import multiprocessing
+from datetime import datetime, timedelta
+import numpy as np
+
+# Configure Django environment
+if __name__ == "__main__":
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'traffic_system.settings')
+    django.setup()
+
+
+def _ensure_django():
+    """Simulation runs in pool workers too; on spawn-based platforms (Windows) they start without Django"""
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'traffic_system.settings')
+        django.setup()
+
+
+class VirtualClock:
+    """Time source for the controller that only moves when the simulation advances it"""
+
+    def __init__(self, start=0.0):
+        self.now = float(start)
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class PoissonArrivals:
+    """Synthetic arrivals: per-approach Poisson streams with an optional hourly demand profile"""
+
+    def __init__(self, rates, hourly_profile=None, seed=None):
+        self.rates = np.asarray(rates, dtype=float)  # vehicles/second per approach
+        self.hourly_profile = np.asarray(hourly_profile, dtype=float) if hourly_profile is not None else None
+        self.rng = np.random.default_rng(seed)
+
+    def rates_at(self, t):
+        if self.hourly_profile is None:
+            return self.rates
+        hour = int(t // 3600) % len(self.hourly_profile)
+        return self.rates * self.hourly_profile[hour]
+
+    def sample(self, t, dt):
+        """Vehicles arriving at every approach during [t, t + dt)"""
+        return self.rng.poisson(self.rates_at(t) * dt)
+
+
+class ReplayArrivals:
+    """Arrivals replayed from recorded per-approach counts.
+
+    TrafficData stores how many vehicles were in the detection area, not how many
+    arrived, so a recorded count is turned into an arrival rate by assuming each
+    vehicle spends `dwell_seconds` in the area. The recording loops when the
+    simulation runs longer than it.
+    """
+
+    def __init__(self, samples, num_signals=4, dwell_seconds=30.0, bucket_seconds=60, seed=None):
+        # samples: iterable of (seconds_from_start, signal_id, vehicle_count)
+        samples = list(samples)
+        self.bucket_seconds = bucket_seconds
+        self.dwell_seconds = dwell_seconds
+        duration = max((offset for offset, _, _ in samples), default=0.0)
+        num_buckets = max(1, int(duration // bucket_seconds) + 1)
+
+        totals = np.zeros((num_buckets, num_signals))
+        counts = np.zeros((num_buckets, num_signals))
+        for offset, signal_id, vehicle_count in samples:
+            if 0 <= signal_id < num_signals:
+                bucket = int(offset // bucket_seconds)
+                totals[bucket, signal_id] += vehicle_count
+                counts[bucket, signal_id] += 1
+        self.bucket_counts = np.divide(totals, counts, out=np.zeros_like(totals), where=counts > 0)
+        self.bucket_rates = self.bucket_counts / dwell_seconds
+        self.rng = np.random.default_rng(seed)
+
+    def samples(self):
+        """The mean count of every bucket as (seconds_from_start, signal_id, vehicle_count) samples"""
+        return [
+            (bucket * self.bucket_seconds, signal_id, float(count))
+            for bucket, row in enumerate(self.bucket_counts)
+            for signal_id, count in enumerate(row)
+        ]
+
+    @classmethod
+    def from_traffic_data(cls, start, end, num_signals=4, **kwargs):
+        """Build a replay from historical TrafficData (or, when raw rows were purged, 1 minute rollups)"""
+        _ensure_django()
+        from .models import TrafficData, TrafficDataRollup
+
+        samples = [
+            ((timestamp - start).total_seconds(), signal_id, vehicle_count)
+            for timestamp, signal_id, vehicle_count in TrafficData.objects.filter(
+                timestamp__range=(start, end)
+            ).order_by('timestamp').values_list('timestamp', 'signal__signal_id', 'vehicle_count')
+        ]
+        if not samples:
+            samples = [
+                ((bucket_start - start).total_seconds(), signal_id, count_sum / samples_in_bucket)
+                for bucket_start, signal_id, count_sum, samples_in_bucket in TrafficDataRollup.objects.filter(
+                    resolution=TrafficDataRollup.RESOLUTION_1MIN, bucket_start__range=(start, end), samples__gt=0
+                ).order_by('bucket_start').values_list('bucket_start', 'signal__signal_id', 'vehicle_count_sum', 'samples')
+            ]
+        return cls(samples, num_signals=num_signals, **kwargs)
+
+    def sample(self, t, dt):
+        bucket = int(t // self.bucket_seconds) % len(self.bucket_rates)
+        return self.rng.poisson(self.bucket_rates[bucket] * dt)
+
+
+class TrafficSimulation:
+    """Discrete-event simulation of one junction driven by the real TrafficControlWorker logic.
+
+    The controller runs against an InMemorySignalStore and a VirtualClock. Time jumps
+    straight to the next controller event (end of the current green/yellow/red), capped
+    at `max_step` so demand is still sampled regularly. Queues are a point-queue model:
+    vehicles arrive from the arrival stream and discharge at `saturation_flow` while the
+    approach is GREEN. The controller sees queue lengths as vehicle_count/traffic_weight,
+    the same fields the detection worker writes.
+    """
+
+    def __init__(self, arrivals, num_signals=4, saturation_flow=0.5, vehicle_weight=1.2,
+                 max_step=5.0, start_time=None, signal_overrides=None):
+        self.arrivals = arrivals
+        self.num_signals = num_signals
+        self.saturation_flow = saturation_flow  # vehicles/second discharged on green
+        self.vehicle_weight = vehicle_weight  # average traffic weight per queued vehicle
+        self.max_step = max_step
+        self.start_time = start_time if start_time is not None else datetime(2025, 1, 6).timestamp()
+        self.signal_overrides = signal_overrides or {}
+
+    def build_controller(self, clock):
+        from .signal_store import InMemorySignalStore
+        from .traffic_control_worker import TrafficControlWorker
+
+        store = InMemorySignalStore(range(self.num_signals), self.signal_overrides)
+        controller = TrafficControlWorker(store=store, clock=clock, live_outputs=False)
+        controller.verbose = False
+        return controller
+
+    def run(self, hours):
+        """Simulate `hours` of operation and return performance figures"""
+        clock = VirtualClock(self.start_time)
+        queues = np.zeros(self.num_signals)
+        arrived = np.zeros(self.num_signals)
+        served = np.zeros(self.num_signals)
+        queue_seconds = np.zeros(self.num_signals)
+        max_queue = np.zeros(self.num_signals)
+        green_starts = 0
+        green_seconds = np.zeros(self.num_signals)
+        wasted_green_seconds = np.zeros(self.num_signals)
+        ticks = 0
+
+        wall_start = time.perf_counter()
+        # Controller output (state transitions) is not useful at thousands of cycles per second
+        with contextlib.redirect_stdout(io.StringIO()) as sink:
+            controller = self.build_controller(clock)
+            signals = controller.store.signals
+            controller.run_initial_detection_for_signal(0)
+
+            end = clock.now + hours * 3600.0
+            while clock.now < end:
+                active = signals[controller.current_system_signal]
+                dt = min(max(active.remaining_time, 0.0), self.max_step, end - clock.now)
+
+                if dt > 0:
+                    new_arrivals = self.arrivals.sample(clock.now - self.start_time, dt)
+                    start_queues = queues.copy()
+                    queues += new_arrivals
+                    arrived += new_arrivals
+                    for signal_id, signal in signals.items():
+                        if signal.current_state == 'GREEN':
+                            green_seconds[signal_id] += dt
+                            departures = min(queues[signal_id], self.saturation_flow * dt)
+                            if departures < self.saturation_flow * dt:
+                                wasted_green_seconds[signal_id] += dt - departures / self.saturation_flow
+                            queues[signal_id] -= departures
+                            served[signal_id] += departures
+                    queue_seconds += (start_queues + queues) / 2.0 * dt
+                    np.maximum(max_queue, queues, out=max_queue)
+                    clock.advance(dt)
+
+                # Publish the queues the way detection would, then let the controller act
+                for signal_id, signal in signals.items():
+                    signal.vehicle_count = int(queues[signal_id])
+                    signal.traffic_weight = round(queues[signal_id] * self.vehicle_weight, 2)
+
+                previous_signal = controller.current_system_signal
+                controller.tick(dt)
+                ticks += 1
+                if controller.current_system_signal != previous_signal:
+                    green_starts += 1
+
+                # Keep the output buffer from growing over long runs
+                if ticks % 10000 == 0:
+                    sink.seek(0)
+                    sink.truncate()
+
+        wall_seconds = time.perf_counter() - wall_start
+        total_arrived = float(arrived.sum())
+        return {
+            'simulated_hours': hours,
+            'wall_seconds': round(wall_seconds, 3),
+            'speedup': round(hours * 3600.0 / wall_seconds, 1) if wall_seconds > 0 else None,
+            'controller_ticks': ticks,
+            'phase_changes': green_starts,
+            'vehicles_arrived': int(total_arrived),
+            'vehicles_served': int(served.sum()),
+            'throughput_per_hour': round(float(served.sum()) / hours, 1) if hours else 0.0,
+            'avg_delay_seconds': round(float(queue_seconds.sum()) / total_arrived, 2) if total_arrived else 0.0,
+            'residual_queue': [int(q) for q in queues],
+            'max_queue': [int(q) for q in max_queue],
+            'green_seconds': [round(float(g), 1) for g in green_seconds],
+            'wasted_green_seconds': [round(float(w), 1) for w in wasted_green_seconds],
+            'events': dict(controller.store.event_counts),
+            'kpis': controller.kpis.summary(),
+        }
+
+
+def run_scenario(scenario):
+    """Run one scenario dict: {'hours', 'rates' | 'replay', 'seed', ...}; top-level so it can be pickled"""
+    _ensure_django()
+    scenario = dict(scenario)
+    hours = scenario.pop('hours', 1.0)
+    name = scenario.pop('name', None)
+    seed = scenario.pop('seed', None)
+    if 'replay' in scenario:
+        arrivals = ReplayArrivals(scenario.pop('replay'), seed=seed, **scenario.pop('replay_options', {}))
+    else:
+        arrivals = PoissonArrivals(scenario.pop('rates', [0.1] * 4), scenario.pop('hourly_profile', None), seed=seed)
+    result = TrafficSimulation(arrivals, **scenario).run(hours)
+    result['name'] = name
+    return result
+
+
+def run_parallel(scenarios, processes=None):
+    """Run scenarios across processes; results come back in scenario order"""
+    scenarios = list(scenarios)
+    if processes == 1 or len(scenarios) <= 1:
+        return [run_scenario(scenario) for scenario in scenarios]
+    with multiprocessing.Pool(processes=processes) as pool:
+        return pool.map(run_scenario, scenarios)
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Run the traffic controller against simulated or recorded demand")
+    parser.add_argument('--hours', type=float, default=24.0, help="Simulated hours per run")
+    parser.add_argument('--runs', type=int, default=1, help="Independent runs (different seeds)")
+    parser.add_argument('--processes', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--rates', type=float, nargs='+', default=[0.08, 0.05, 0.08, 0.05],
+                        help="Arrival rate per approach in vehicles/second")
+    parser.add_argument('--replay-hours', type=float, default=None,
+                        help="Replay the last N hours of TrafficData instead of synthetic arrivals")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    base = {'hours': args.hours}
+    if args.replay_hours:
+        from django.utils import timezone
+        end = timezone.now()
+        replay = ReplayArrivals.from_traffic_data(end - timedelta(hours=args.replay_hours), end)
+        if not replay.bucket_rates.any():
+            print("No recorded traffic in that window.")
+            return
+        # Each run rebuilds the replay from the bucket counts with the same options
+        base['replay'] = replay.samples()
+        base['replay_options'] = {'dwell_seconds': replay.dwell_seconds, 'bucket_seconds': replay.bucket_seconds}
+    else:
+        base['rates'] = args.rates
+
+    scenarios = [dict(base, name=f"run-{i}", seed=args.seed + i) for i in range(args.runs)]
+    wall_start = time.perf_counter()
+    results = run_parallel(scenarios, processes=args.processes)
+    wall_seconds = time.perf_counter() - wall_start
+
+    for result in results:
+        print(json.dumps(result))
+    total_hours = sum(result['simulated_hours'] for result in results)
+    print(f"Simulated {total_hours:.0f} hours in {wall_seconds:.1f}s ({total_hours * 60.0 / wall_seconds:.0f} simulated hours per minute)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+import redis
+from redis.retry import Retry
+from redis.backoff import NoBackoff
+from django.conf import settings
+
+# Invalidations travel on the same control channel the detection worker already listens to
+CONTROL_CHANNEL = 'control_channel_detection_worker'
+INVALIDATE_PREFIX = 'cache_invalidate:'
+
+# Typed reload messages for the detection worker, also on the control channel
+RELOAD_ALL = 'reload_config'
+AREA_CHANGED = 'area_changed'
+SOURCE_CHANGED = 'source_changed'
+
+
+def reload_message(kind, signal_id=None):
+    """Encode a reload request; `signal_id` limits it to one approach"""
+    return json.dumps({'type': kind, 'signal_id': signal_id})
+
+
+def parse_signal_id(value):
+    """Signal id from an int or an 'A'-'D' letter as the dashboard sends them, None if invalid"""
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    if isinstance(value, str) and value in ('A', 'B', 'C', 'D'):
+        return ord(value) - 65
+    return None
+
+
+def parse_reload_message(message):
+    """(kind, signal_id) for a reload message, None for anything else on the channel.
+    The bare 'reload_config' string older publishers send is a full reload."""
+    if message == RELOAD_ALL:
+        return RELOAD_ALL, None
+    if not message.startswith('{'):
+        return None
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or data.get('type') not in (RELOAD_ALL, AREA_CHANGED, SOURCE_CHANGED):
+        return None
+    if data.get('signal_id') is None:
+        return data['type'], None
+    signal_id = parse_signal_id(data['signal_id'])
+    if signal_id is None:
+        return None
+    return data['type'], signal_id
+
+
+def publish_reload(redis_client, kind, signal_id=None):
+    """Ask the detection worker to reload part of its configuration"""
+    try:
+        redis_client.publish(CONTROL_CHANNEL, reload_message(kind, signal_id))
+    except redis.exceptions.RedisError as e:
+        print(f"StateCache: Could not publish {kind} for signal {signal_id}: {e}")
+
+
+# Cached namespaces
+SIGNAL_STATES = 'signal_states'
+DETECTION_AREAS = 'detection_areas'
+DETECTION_ZONES = 'detection_zones'
+VIDEO_SOURCES = 'video_sources'
+
+# remaining_time counts down every control tick, so signal states only live briefly;
+# areas, zones and sources change only through save_area/save_zones/upload_video and are invalidated there
+DEFAULT_TTLS = {
+    SIGNAL_STATES: 0.5,
+    DETECTION_AREAS: 300.0,
+    DETECTION_ZONES: 300.0,
+    VIDEO_SOURCES: 300.0,
+}
+
+
+class VersionedReadThroughCache:
+    """Process-local LRU in front of Redis, keyed by a per-namespace version that writers bump.
+
+    Local entries are re-checked against the namespace version every
+    `version_check_interval` seconds, so a lost invalidation message only keeps
+    a stale copy that long rather than for the whole TTL.
+    """
+
+    def __init__(self, redis_client, max_entries=256, redis_ttl=600, redis_retry_after=5.0,
+                 version_check_interval=5.0):
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.redis_ttl = redis_ttl
+        self.version_check_interval = version_check_interval
+        # After a Redis error, go straight to the loader for a while instead of
+        # paying the connection timeout on every miss
+        self.redis_retry_after = redis_retry_after
+        self.redis_down_until = 0.0
+        self.local = OrderedDict()  # (namespace, key) -> (version, loaded_at, value, checked_at)
+        self.generations = {}  # namespace -> local drop count, to spot drops during a load
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _version_key(self, namespace):
+        return f"traffic_cache:version:{namespace}"
+
+    def _value_key(self, namespace, key, version):
+        return f"traffic_cache:{namespace}:{key}:v{version}"
+
+    def _get_version(self, namespace):
+        """Current version from Redis, or None when Redis is unavailable"""
+        if time.time() < self.redis_down_until:
+            return None
+        try:
+            version = self.redis.get(self._version_key(namespace))
+            return int(version) if version is not None else 0
+        except redis.exceptions.RedisError:
+            self.redis_down_until = time.time() + self.redis_retry_after
+            return None
+
+    def get(self, namespace, loader, key='all', ttl=None):
+        """Return the cached value, loading it through Redis and then `loader` on a miss"""
+        if ttl is None:
+            ttl = DEFAULT_TTLS.get(namespace, 60.0)
+        now = time.time()
+
+        with self.lock:
+            entry = self.local.get((namespace, key))
+            if entry is not None and now - entry[1] >= ttl:
+                entry = None
+        if entry is not None and entry[0] is not None and now - entry[3] >= self.version_check_interval:
+            current = self._get_version(namespace)
+            if current is not None and current != entry[0]:
+                entry = None  # a version bump whose invalidation message never arrived
+            elif current is not None:
+                entry = (entry[0], entry[1], entry[2], now)
+                with self.lock:
+                    if (namespace, key) in self.local:
+                        self.local[(namespace, key)] = entry
+        with self.lock:
+            if entry is not None:
+                self.local.move_to_end((namespace, key))
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            generation = self.generations.get(namespace, 0)
+
+        version = self._get_version(namespace)
+        value = None
+        if version is not None:
+            try:
+                raw = self.redis.get(self._value_key(namespace, key, version))
+                if raw is not None:
+                    value = json.loads(raw)
+            except (redis.exceptions.RedisError, ValueError):
+                value = None
+
+        if value is None:
+            value = loader()
+            if version is not None and self._get_version(namespace) not in (None, version):
+                # Invalidated while loading: the value may predate the write, so don't keep it
+                return value
+            if version is not None:
+                try:
+                    # The shared copy expires with the namespace's TTL: namespaces like SIGNAL_STATES
+                    # go stale without their version being bumped
+                    self.redis.set(self._value_key(namespace, key, version), json.dumps(value),
+                                   px=int(min(ttl, self.redis_ttl) * 1000))
+                except redis.exceptions.RedisError:
+                    pass
+
+        with self.lock:
+            if self.generations.get(namespace, 0) != generation:
+                return value  # dropped locally while loading
+            self.local[(namespace, key)] = (version, time.time(), value, time.time())
+            self.local.move_to_end((namespace, key))
+            while len(self.local) > self.max_entries:
+                self.local.popitem(last=False)
+        return value
+
+    def drop_local(self, namespace):
+        """Forget this process's entries for a namespace"""
+        with self.lock:
+            self.generations[namespace] = self.generations.get(namespace, 0) + 1
+            for cache_key in [k for k in self.local if k[0] == namespace]:
+                del self.local[cache_key]
+
+    def invalidate(self, namespace):
+        """Bump the namespace version and tell every process to drop its local copy"""
+        self.drop_local(namespace)
+        try:
+            self.redis.incr(self._version_key(namespace))
+            self.redis.publish(CONTROL_CHANNEL, f"{INVALIDATE_PREFIX}{namespace}")
+        except redis.exceptions.RedisError as e:
+            print(f"StateCache: Could not publish invalidation for {namespace}: {e}")
+
+    def handle_control_message(self, message):
+        """Apply an invalidation received on the control channel; returns True if it was one"""
+        if message.startswith(INVALIDATE_PREFIX):
+            self.drop_local(message[len(INVALIDATE_PREFIX):])
+            return True
+        return False
+
+
+# Global instance per process
+state_cache = None
+
+def get_state_cache():
+    """Get or create the global read-through cache instance"""
+    global state_cache
+    if state_cache is None:
+        state_cache = VersionedReadThroughCache(redis.StrictRedis(
+            host=getattr(settings, 'REDIS_HOST', 'localhost'),
+            port=getattr(settings, 'REDIS_PORT', 6379),
+            db=getattr(settings, 'REDIS_DB', 0),
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5,
+            retry=Retry(NoBackoff(), 0)
+        ))
+    return state_cache
@@ -0,0 +1,172 @@
+import json
+import time
+import threading
+import redis
+
+DASHBOARD_CHANNEL = 'dashboard_updates'
+SCHEMA_VERSION = 1
+SNAPSHOT_KEY = 'dashboard_snapshot:{source}'
+
+# Sources with their own sequence numbers
+SOURCE_CONTROL = 'control'
+SOURCE_DETECTION = 'detection'
+
+
+def serialize_signal_state(signal):
+    """Live state of a TrafficSignal as sent to the dashboard"""
+    return {
+        'signal_id': signal.signal_id,
+        'current_state': signal.current_state,
+        'remaining_time': round(signal.remaining_time, 1),
+        'vehicle_count': signal.vehicle_count,
+        'traffic_weight': signal.traffic_weight,
+        'avg_confidence': signal.avg_confidence,
+        'congestion_level': signal.congestion_level,
+        'congestion_score': signal.congestion_score,
+        'has_emergency_vehicle': signal.has_emergency_vehicle,
+        'source_health': signal.source_health,
+        'vehicle_type_counts': signal.vehicle_type_counts,
+        'zone_counts': getattr(signal, 'zone_counts', {}),
+    }
+
+
+def _dumps(message):
+    return json.dumps(message, separators=(',', ':'))
+
+
+class StatePublisher:
+    """Publishes versioned snapshots and per-signal deltas of live state on dashboard_updates.
+
+    Every message carries the source name, a per-process epoch and a sequence number,
+    so subscribers can detect gaps. The latest full state of the source is also kept
+    in a Redis key for subscribers that need to resync.
+    """
+
+    def __init__(self, source, redis_client):
+        self.source = source
+        self.redis = redis_client
+        self.epoch = int(time.time() * 1000)
+        self.seq = 0
+        self.signals = {}  # signal_id -> last published state
+        self.system_overview = {}
+        self.lock = threading.Lock()
+
+    def _envelope(self, message_type, seq):
+        return {
+            'type': message_type,
+            'v': SCHEMA_VERSION,
+            'source': self.source,
+            'epoch': self.epoch,
+            'seq': seq,
+            'ts': round(time.time(), 3),
+        }
+
+    def _snapshot_message(self, seq):
+        message = self._envelope('signal_update', seq)
+        message['signals'] = [self.signals[signal_id] for signal_id in sorted(self.signals)]
+        if self.system_overview:
+            message['system_overview'] = self.system_overview
+        return message
+
+    def _send(self, message, snapshot):
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(SNAPSHOT_KEY.format(source=self.source), _dumps(snapshot))
+            pipe.publish(DASHBOARD_CHANNEL, _dumps(message))
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            print(f"StatePublisher[{self.source}]: Failed to publish: {e}")
+
+    def publish_snapshot(self, signal_states, system_overview=None):
+        """Publish the full state of every signal (and optionally the system overview)"""
+        with self.lock:
+            self.signals = {state['signal_id']: dict(state) for state in signal_states}
+            if system_overview is not None:
+                self.system_overview = dict(system_overview)
+            self.seq += 1
+            message = self._snapshot_message(self.seq)
+            self._send(message, message)
+
+    def publish_delta(self, signal_id, changes):
+        """Publish only the fields of one signal that changed since the last publish"""
+        with self.lock:
+            current = self.signals.setdefault(signal_id, {'signal_id': signal_id})
+            changed = {key: value for key, value in changes.items() if current.get(key) != value}
+            if not changed:
+                return False
+            current.update(changed)
+
+            self.seq += 1
+            message = self._envelope('signal_delta', self.seq)
+            message['signal_id'] = signal_id
+            message['changes'] = changed
+            # The stored snapshot carries the delta's sequence number so a resync lines up with it
+            self._send(message, self._snapshot_message(self.seq))
+            return True
+
+
+class LiveStateAssembler:
+    """Merges snapshots and deltas from all publishers into the dashboard's view of live state"""
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client
+        self.signals = {}
+        self.system_overview = {}
+        self.positions = {}  # source -> (epoch, seq)
+        self.resyncs = 0
+
+    def apply(self, message):
+        """Apply one decoded dashboard_updates message; returns True if state changed"""
+        message_type = message.get('type')
+        source = message.get('source')
+
+        if source is not None and 'seq' in message:
+            epoch, seq = message.get('epoch'), message['seq']
+            last = self.positions.get(source)
+            if last is None or last[0] != epoch:
+                # First message from this publisher (or it restarted): a delta alone is not enough
+                if message_type == 'signal_delta':
+                    self.resync(source)
+            elif seq <= last[1]:
+                return False  # Duplicate or late message
+            elif seq != last[1] + 1 and message_type == 'signal_delta':
+                # Missed at least one delta: reload the source's full state first
+                self.resync(source)
+            self.positions[source] = (epoch, seq)
+
+        if message_type == 'signal_update':
+            for state in message.get('signals', []):
+                self.signals.setdefault(state['signal_id'], {}).update(state)
+            if 'system_overview' in message:
+                self.system_overview = message['system_overview']
+        elif message_type == 'signal_delta':
+            self.signals.setdefault(message['signal_id'], {'signal_id': message['signal_id']}).update(message.get('changes', {}))
+        elif message_type == 'system_overview':
+            self.system_overview = message.get('system_overview', {})
+        else:
+            return False
+        return True
+
+    def resync(self, source):
+        """Replace a source's state with the snapshot it keeps in Redis"""
+        if self.redis is None:
+            return False
+        try:
+            raw = self.redis.get(SNAPSHOT_KEY.format(source=source))
+        except redis.exceptions.RedisError as e:
+            print(f"LiveStateAssembler: Resync of {source} failed: {e}")
+            return False
+        if raw is None:
+            return False
+        snapshot = json.loads(raw)
+        for state in snapshot.get('signals', []):
+            self.signals.setdefault(state['signal_id'], {}).update(state)
+        if 'system_overview' in snapshot:
+            self.system_overview = snapshot['system_overview']
+        self.resyncs += 1
+        print(f"LiveStateAssembler: Resynced {source} at seq {snapshot.get('seq')}")
+        return True
+
+    def signals_list(self):
+        """Copies of the merged signal states, safe to hand to another thread"""
+        return [dict(self.signals[signal_id]) for signal_id in sorted(self.signals)]
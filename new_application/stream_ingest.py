@@ -0,0 +1,224 @@
+import time
+import random
+import threading
+from collections import deque
+import cv2
+
+from .latency import FrameStamp
+
+STREAM_SCHEMES = ('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://')
+
+# Source states
+CONNECTING = 'CONNECTING'
+STREAMING = 'STREAMING'
+RECONNECTING = 'RECONNECTING'
+STOPPED = 'STOPPED'
+
+
+def is_stream_url(path):
+    return bool(path) and path.strip().lower().startswith(STREAM_SCHEMES)
+
+
+def open_stream(url, timeout_ms=5000):
+    """cv2.VideoCapture for a network stream, with open/read timeouts where OpenCV supports them"""
+    try:
+        return cv2.VideoCapture(url, cv2.CAP_FFMPEG, [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms
+        ])
+    except (AttributeError, TypeError, cv2.error):
+        return cv2.VideoCapture(url)
+
+
+class LiveSource:
+    """A live RTSP/HTTP camera read on its own thread.
+
+    Opening and reconnecting happen on the reader thread, so callers never block
+    on the network. Frames are timestamped as they arrive and held in a small
+    jitter buffer; `read()` returns the oldest buffered frame that is not older
+    than `max_latency`. A source that delivers nothing for `stall_timeout`
+    seconds is torn down and reconnected with exponential backoff. `health()`
+    scores the source from 0 (no usable video) to 1.
+
+    Exposes the parts of the cv2.VideoCapture interface the detection loop uses.
+    """
+
+    def __init__(self, url, capture_factory=open_stream, clock=time.time, buffer_size=8, max_latency=1.0,
+                 stall_timeout=5.0, backoff_initial=0.5, backoff_max=30.0, health_window=60.0):
+        self.url = url
+        self.capture_factory = capture_factory
+        self.clock = clock
+        self.max_latency = max_latency
+        self.stall_timeout = stall_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.health_window = health_window
+        self.buffer = deque(maxlen=buffer_size)  # (FrameStamp, frame)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.cap = None
+        self.state = CONNECTING
+        self.seq = 0
+        self.last_frame_time = None
+        self.last_captured_at = None
+        self.last_stamp = None  # FrameStamp of the frame last returned by read()
+        self.frame_size = (0, 0)
+        self.nominal_fps = 0.0
+        self.fps = 0.0  # EWMA of the measured arrival rate
+        self.backoff = backoff_initial
+        self.reconnects = deque()  # times of recent reconnects
+        self.stalls = 0
+        self.dropped = 0
+        self.last_error = None
+        self.reader_thread = threading.Thread(target=self._run, daemon=True)
+        self.reader_thread.start()
+
+    def _connect(self):
+        try:
+            cap = self.capture_factory(self.url)
+        except Exception as e:
+            cap, self.last_error = None, f"open failed: {e}"
+        if cap is None or not cap.isOpened() or self.stop_event.is_set():
+            if cap is not None:
+                cap.release()
+                self.last_error = self.last_error if self.stop_event.is_set() else 'open failed'
+            return False
+        with self.lock:
+            self.cap = cap
+            self.nominal_fps = float(cap.get(cv2.CAP_PROP_FPS) or 0.0)
+            self.state = STREAMING
+            # The stall clock starts at connect, so a source that never sends a frame is caught too
+            self.last_frame_time = self.clock()
+        print(f"LiveSource: Connected to {self.url}")
+        return True
+
+    def _disconnect(self, reason):
+        with self.lock:
+            cap, self.cap = self.cap, None
+            if self.state != STOPPED:
+                self.state = RECONNECTING
+            self.last_error = reason
+            self.reconnects.append(self.clock())
+        if cap is not None:
+            cap.release()
+        print(f"LiveSource: {self.url} disconnected ({reason}); retrying in {self.backoff:.1f}s")
+
+    def _wait_backoff(self):
+        # Jitter keeps many cameras behind one failed link from reconnecting in lockstep
+        self.stop_event.wait(self.backoff * random.uniform(0.8, 1.2))
+        self.backoff = min(self.backoff * 2.0, self.backoff_max)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            cap = self.cap
+            if cap is None:
+                if not self._connect():
+                    with self.lock:
+                        if self.state != STOPPED:
+                            self.state = RECONNECTING
+                    self._wait_backoff()
+                continue
+
+            ok, frame = cap.read()
+            if self.stop_event.is_set():
+                break
+            if cap is not self.cap:
+                self._wait_backoff()  # torn down by the stall check while this read was blocked
+                continue
+            if not ok or frame is None:
+                self._disconnect('read failed')
+                self._wait_backoff()
+                continue
+
+            now = self.clock()
+            with self.lock:
+                if self.last_frame_time is not None and now > self.last_frame_time and self.seq > 0:
+                    self.fps += 0.1 * (1.0 / (now - self.last_frame_time) - self.fps)
+                self.seq += 1
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.dropped += 1
+                self.buffer.append((FrameStamp(self.seq, time.monotonic(), now), frame))
+                self.last_frame_time = now
+                self.frame_size = (frame.shape[1], frame.shape[0])
+                self.backoff = self.backoff_initial
+
+        with self.lock:
+            cap, self.cap = self.cap, None
+        if cap is not None:
+            cap.release()
+
+    def check_stall(self):
+        """Tear down a connection that has stopped delivering frames; the reader reconnects it"""
+        with self.lock:
+            stalled = self.cap is not None and self.last_frame_time is not None and \
+                self.clock() - self.last_frame_time > self.stall_timeout
+            if stalled:
+                self.stalls += 1
+        if stalled:
+            self._disconnect(f"no frames for {self.stall_timeout:.0f}s")
+        return stalled
+
+    def read(self):
+        """(ok, frame) like cv2.VideoCapture.read; never blocks"""
+        self.check_stall()
+        with self.lock:
+            now = self.clock()
+            while self.buffer and now - self.buffer[0][0].wall > self.max_latency:
+                self.buffer.popleft()
+                self.dropped += 1
+            if not self.buffer:
+                return False, None
+            self.last_stamp, frame = self.buffer.popleft()
+            self.last_captured_at = self.last_stamp.wall
+            return True, frame
+
+    def health(self):
+        """0..1 score from frame freshness, connection stability and delivered frame rate"""
+        with self.lock:
+            now = self.clock()
+            while self.reconnects and now - self.reconnects[0] > self.health_window:
+                self.reconnects.popleft()
+            if self.state != STREAMING or self.seq == 0 or self.last_frame_time is None:
+                return 0.0
+            age = now - self.last_frame_time
+            if age >= self.stall_timeout:
+                return 0.0
+            freshness = 1.0 - age / self.stall_timeout
+            stability = 1.0 / (1.0 + len(self.reconnects))
+            rate = min(self.fps / self.nominal_fps, 1.0) if self.nominal_fps > 0 else 1.0
+            return round(0.4 * freshness + 0.3 * stability + 0.3 * rate, 3)
+
+    def stats(self):
+        health = self.health()
+        with self.lock:
+            return {
+                'url': self.url, 'state': self.state, 'health': health,
+                'frames': self.seq, 'fps': round(self.fps, 1), 'nominal_fps': self.nominal_fps,
+                'reconnects_recent': len(self.reconnects), 'stalls': self.stalls,
+                'dropped': self.dropped, 'last_error': self.last_error,
+            }
+
+    # cv2.VideoCapture compatibility
+    def isOpened(self):
+        return not self.stop_event.is_set()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frame_size[0]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frame_size[1]
+        if prop == cv2.CAP_PROP_FPS:
+            return self.nominal_fps
+        return 0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        """Stop the reader thread and close the connection"""
+        with self.lock:
+            self.state = STOPPED
+        self.stop_event.set()
+        cap = self.cap
+        if cap is not None:
+            cap.release()  # unblocks a read in progress
+        self.reader_thread.join(timeout=5.0)
@@ -1,3 +1,1196 @@
-from django.test import TestCase
+import io
+import os
+import gzip
+import json
+import queue
+import time
+import tempfile
+import threading
+import contextlib
+from unittest import mock
+from datetime import datetime, timedelta, timezone as dt_timezone
+import numpy as np
+import cv2
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.db import connection, OperationalError
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from .models import TrafficSignal, TrafficData, TrafficLog, CongestionEvent, JunctionSignals, JunctionLink, VideoSource, DetectionZone, DetectionArea
+from .models import TrafficDataRollup, SystemSettings
+from . import analytics_thread
+from .simulation import TrafficSimulation, PoissonArrivals, ReplayArrivals
+from .signal_store import SimulatedSignal, DatabaseSignalStore
+from .controller_registry import ControllerRegistry
+from .forecasting import ArrivalForecaster, plan_cycle
+from .corridor import CorridorCoordinator, align_cycle
+from .phase_selection import PhaseSelector, ORDER_CYCLIC
+from .preemption import EmergencyEventBus, CLEARING, ALL_RED, SERVING, IDLE
+from .emergency_confirmation import EmergencyConfirmer, DEPARTING
+from .kpi import KPIEngine
+from .video_ingest import VideoIngestPipeline, QUEUED, READY, FAILED
+from .detection_worker import DetectionWorker
+from .stream_ingest import LiveSource, STREAMING, RECONNECTING
+from .latency import FrameStamp, LatencyTracker, pack_frame, unpack_frame
+from .wire_format import detection_details, read_detection_details
+from .timeseries import TrafficTimeSeriesStore
+from .event_log import EventLog, read_events, log_files
+from .congestion import CongestionEngine, congestion_score
+from .calibration import compute_homography, lane_meters
+from .worker_runner import WorkerSupervisor, resolve_signal_ids, worker_name
+from .state_publisher import StatePublisher, LiveStateAssembler
+from .db_utils import BatchWriter, run_with_db_retry, refresh_worker_connection
+from .state_cache import parse_reload_message, reload_message, AREA_CHANGED, SOURCE_CHANGED, RELOAD_ALL
+from .state_cache import VersionedReadThroughCache, SIGNAL_STATES, DETECTION_AREAS, DEFAULT_TTLS
+from .signal_store import InMemorySignalStore
+from .simulation import VirtualClock
+from .traffic_control_worker import TrafficControlWorker
+from .timing_engine import NetworkTimingEngine
+from .zones import ZoneMask, ZONE_QUEUE_TAIL
+from .EnhancedTrafficSignal import EnhancedTrafficSignal
+
+
+@override_settings(ANALYTICS_COMMIT_LAG_SECONDS=0)
+class AnalyticsQueryCountTests(TestCase):
+    """The dashboard analytics must not issue per-row or per-signal queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.signals = [TrafficSignal.objects.create(signal_id=i) for i in range(4)]
+        for signal in cls.signals:
+            TrafficData.objects.bulk_create([
+                TrafficData(signal=signal, vehicle_count=n, traffic_weight=n * 1.5, green_time=15)
+                for n in range(1, 26)
+            ])
+            CongestionEvent.objects.bulk_create([
+                CongestionEvent(signal=signal, severity=level, score=score, color='red', cause='test')
+                for level, score in [('LOW', 1.0), ('HIGH', 12.0)]
+            ])
+        # The HIGH events are the latest; make that unambiguous rather than rely on auto_now_add order
+        CongestionEvent.objects.filter(severity='LOW').update(timestamp=timezone.now() - timedelta(minutes=5))
+
+    def test_historical_trends_single_query(self):
+        with self.assertNumQueries(1):
+            trends = analytics_thread.get_historical_traffic_trends(duration_minutes=60)
+        self.assertEqual([len(counts) for counts in trends['vehicle_counts']], [25] * 4)
+
+    def test_distribution_single_query(self):
+        with self.assertNumQueries(1):
+            distribution = analytics_thread.get_current_traffic_distribution_smoothed(window_seconds=30)
+        self.assertEqual(distribution, [13] * 4)
+
+    def test_signal_metadata_single_query(self):
+        with self.assertNumQueries(1):
+            analytics_thread.get_current_signal_metadata()
+
+    def test_congestion_data_single_query(self):
+        with self.assertNumQueries(1):
+            congestion = analytics_thread.get_current_congestion_data()
+        self.assertEqual(sorted(congestion), [0, 1, 2, 3])
+        for entry in congestion.values():
+            self.assertEqual((entry['level'], entry['score']), ('HIGH', 12.0))
+
+    def test_dashboard_endpoint_query_count_is_constant(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('dashboard_analytics_api'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_dashboard_endpoint_negotiates_compression_and_compact_schema(self):
+        plain = self.client.get(reverse('dashboard_analytics_api'))
+        gzipped = self.client.get(reverse('dashboard_analytics_api'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertLess(len(gzipped.content), len(plain.content))
+        self.assertEqual(json.loads(gzip.decompress(gzipped.content)), json.loads(plain.content))
+
+        compact = json.loads(self.client.get(reverse('dashboard_analytics_api'), {'compact': '1'}).content)
+        self.assertEqual(compact['v'], 1)
+        self.assertEqual(len(compact['dt']), len(json.loads(plain.content)['timestamps']))
+        self.assertEqual(compact['congestion']['signal_ids'], [0, 1, 2, 3])
+        # Detection log rows use class-indexed counts and still read back as the verbose form
+        details = detection_details(3, 4.5, {'car': 2, 'bus': 1}, 0.8765)
+        self.assertEqual(details['c'], [0, 0, 1, 2, 0, 0])
+        self.assertEqual(read_detection_details(details)['vehicle_type_counts']['bus'], 1)
+
+    def test_since_cursor_returns_only_new_points_and_changed_values(self):
+        url = reverse('dashboard_analytics_api')
+        first = json.loads(self.client.get(url, {'since': ''}).content)
+        self.assertTrue(first['reset'])
+        self.assertEqual([len(counts) for counts in first['vehicle_counts']], [25] * 4)
+
+        idle = json.loads(self.client.get(url, {'since': first['cursor']}).content)
+        self.assertFalse(idle['reset'])
+        self.assertEqual(idle['timestamps'], [])
+        self.assertEqual(idle['changed'], {'vehicle_distribution': {}, 'avg_confidences': {}, 'congestion_data': {}})
+
+        TrafficData.objects.create(signal=self.signals[2], vehicle_count=40, traffic_weight=60.0, green_time=20)
+        TrafficSignal.objects.filter(signal_id=1).update(avg_confidence=0.9)
+        delta = json.loads(self.client.get(url, {'since': idle['cursor']}).content)
+        self.assertEqual(delta['vehicle_counts'], [[], [], [40], []])
+        self.assertEqual(delta['changed']['avg_confidences'], {'1': 0.9})
+
+    def test_since_snapshot_reads_closed_minutes_from_rollups(self):
+        TrafficTimeSeriesStore().rollup_raw_to_minutes(now=timezone.now() + timedelta(minutes=5))
+        first = json.loads(self.client.get(reverse('dashboard_analytics_api'), {'since': ''}).content)
+        self.assertEqual(first['vehicle_counts'], [[13.0]] * 4)
+        self.assertIsNotNone(first['rolled_up_until'])
+        # The cursor covers the rolled-up rows, so they are not sent again as raw points
+        delta = json.loads(self.client.get(reverse('dashboard_analytics_api'), {'since': first['cursor']}).content)
+        self.assertEqual(delta['timestamps'], [])
+
+    @override_settings(ANALYTICS_COMMIT_LAG_SECONDS=10)
+    def test_since_cursor_waits_for_rows_to_settle(self):
+        url = reverse('dashboard_analytics_api')
+        start = timezone.now()
+        with mock.patch('django.utils.timezone.now', return_value=start + timedelta(seconds=11)):
+            cursor = json.loads(self.client.get(url, {'since': ''}).content)['cursor']
+        # Sampled before the cursor's poll but committed after it, e.g. by a second detection process
+        TrafficData.objects.create(signal=self.signals[3], vehicle_count=40, traffic_weight=60.0, green_time=20,
+                                   timestamp=start + timedelta(seconds=5))
+        with mock.patch('django.utils.timezone.now', return_value=start + timedelta(seconds=12)):
+            early = json.loads(self.client.get(url, {'since': cursor}).content)
+        self.assertEqual(early['vehicle_counts'], [[], [], [], []])
+        with mock.patch('django.utils.timezone.now', return_value=start + timedelta(seconds=16)):
+            settled = json.loads(self.client.get(url, {'since': early['cursor']}).content)
+        self.assertEqual(settled['vehicle_counts'], [[], [], [], [40]])
+
+
+class TrafficSimulationTests(TestCase):
+    """The simulator drives the real controller without touching the database"""
+
+    def run_simulation(self, hours=6, seed=7):
+        arrivals = PoissonArrivals([0.08, 0.05, 0.08, 0.05], seed=seed)
+        return TrafficSimulation(arrivals).run(hours)
+
+    def test_day_runs_without_queries(self):
+        with self.assertNumQueries(0):
+            result = self.run_simulation(hours=24)
+        self.assertGreater(result['phase_changes'], 0)
+        self.assertGreater(result['vehicles_served'], 0.9 * result['vehicles_arrived'])
+
+    def test_seeded_runs_are_deterministic(self):
+        first, second = self.run_simulation(), self.run_simulation()
+        for key in ('vehicles_arrived', 'vehicles_served', 'avg_delay_seconds', 'phase_changes'):
+            self.assertEqual(first[key], second[key])
+
+    def test_replay_rebuilds_from_its_bucket_counts(self):
+        replay = ReplayArrivals([(0, 0, 4), (30, 0, 6), (70, 1, 3)], dwell_seconds=20.0, bucket_seconds=60)
+        rebuilt = ReplayArrivals(replay.samples(), dwell_seconds=replay.dwell_seconds, bucket_seconds=replay.bucket_seconds)
+        np.testing.assert_allclose(rebuilt.bucket_rates, replay.bucket_rates)
+        self.assertEqual(replay.bucket_rates[0, 0], 0.25)
+
+
+class NetworkTimingEngineTests(SimpleTestCase):
+    """The vectorized engine must time approaches exactly like EnhancedTrafficSignal"""
+
+    def test_matches_per_signal_logic_with_history(self):
+        rng = np.random.default_rng(3)
+        engine = NetworkTimingEngine(capacity=2)
+        references = {i: EnhancedTrafficSignal(i) for i in range(40)}
+        signals = [SimulatedSignal(i) for i in range(40)]
+        for step in range(30):
+            when = datetime(2025, 1, 6, step % 24, 30)
+            for signal in signals:
+                signal.vehicle_count = int(rng.integers(0, 4))
+                signal.traffic_weight = round(float(rng.uniform(0, 12)), 2) if signal.vehicle_count else 0
+            expected = [
+                references[s.signal_id].calculate_adaptive_green_time(s.vehicle_count, s.traffic_weight, when)
+                for s in signals
+            ]
+            self.assertEqual(engine.compute(signals, when).tolist(), expected)
+
+    def test_trend_boost_applies_across_calls(self):
+        engine = NetworkTimingEngine()
+        signal = SimulatedSignal(0, vehicle_count=2, traffic_weight=2.0)
+        noon = datetime(2025, 1, 6, 12)
+        for _ in range(3):
+            self.assertEqual(engine.green_time(signal, noon), 16)
+        signal.traffic_weight = 4.0
+        self.assertEqual(engine.green_time(signal, noon), 25)  # 10 + 12 * 1.3
+
+
+class ControllerRegistryTests(TestCase):
+    """Per-signal traffic history is kept in memory and seeded from TrafficData"""
+
+    def test_rolling_statistics(self):
+        registry = ControllerRegistry(sample_interval=1.0)
+        for t, count in enumerate([0, 2, 4, 3, 5, 5, 1]):
+            registry.update(0, 1000.0 + t * 10, count, count * 1.5)
+        stats = registry.stats()[0]
+        self.assertEqual(stats['samples'], 7)
+        self.assertEqual(stats['arrival_rate_per_min'], 6.0)  # 2 + 2 + 2 vehicles appeared in 60s
+        self.assertEqual(stats['count_p50'], 3.0)
+        # Rising traffic shows up in the short EWMA before the baseline
+        self.assertGreater(stats['ewma_weight'], stats['baseline_weight'])
+
+    def test_warm_load_from_traffic_data(self):
+        signal = TrafficSignal.objects.create(signal_id=0)
+        TrafficData.objects.bulk_create([
+            TrafficData(signal=signal, vehicle_count=2, traffic_weight=2.0,
+                        timestamp=timezone.now() - timedelta(seconds=300 - i * 5))
+            for i in range(40)
+        ])
+        registry = ControllerRegistry()
+        self.assertEqual(registry.warm_load(DatabaseSignalStore().recent_traffic(time.time() - 600)), 40)
+        self.assertAlmostEqual(registry.trend_baselines([0])[0], 2.0)
+
+        # A surge against the warm-loaded baseline gets the trend boost with no queries
+        engine = NetworkTimingEngine()
+        surge = SimulatedSignal(0, vehicle_count=4, traffic_weight=4.0)
+        with self.assertNumQueries(0):
+            green = engine.green_time(surge, datetime(2025, 1, 6, 12), trend_baseline=registry.trend_baselines([0])[0])
+        self.assertEqual(green, 25)
+
+
+class ForecastPlanningTests(SimpleTestCase):
+    """Arrival forecasts and the cycle plan built from them"""
+
+    def test_forecaster_follows_a_ramp(self):
+        forecaster = ArrivalForecaster(step_seconds=30, min_steps=5)
+        totals = {0: 0.0, 1: 0.0}
+        for step in range(40):
+            totals[0] += 30 * 0.1  # steady 0.1 veh/s
+            totals[1] += 30 * (0.01 + 0.002 * step)  # growing demand
+            forecaster.observe(dict(totals), 30.0 * step)
+        self.assertTrue(forecaster.ready([0, 1]))
+        steady, growing = forecaster.forecast_rates([0, 1], horizon_seconds=60)
+        self.assertAlmostEqual(steady, 0.1, places=3)
+        self.assertAlmostEqual(growing, 0.01 + 0.002 * 40, delta=0.01)
+
+    def test_cycle_plan_serves_queue_and_forecast_arrivals(self):
+        green = plan_cycle(
+            queues=[4, 0, 20, 0], rates=[0.1, 0.0, 0.1, 0.6],
+            min_green=[5] * 4, max_green=[45] * 4, lost_time=[5] * 4, saturation_flow=0.5
+        )[0].tolist()
+        # 4 / 0.4 = 10s; empty approach gets min green; (20 + 0.1 * 25) / 0.4 = 56.25 -> max;
+        # demand above saturation -> max
+        self.assertEqual(green, [10, 5, 45, 45])
+
+
+class CorridorCoordinatorTests(TestCase):
+    """Linked junctions share a cycle and are offset by the measured travel time"""
+
+    def test_offsets_follow_measured_travel_time(self):
+        junctions = [JunctionSignals.objects.create(junction_name=f"J{i}") for i in range(3)]
+        signals = {}
+        for j, junction in enumerate(junctions):
+            for k in range(2):
+                signals[(j, k)] = TrafficSignal.objects.create(signal_id=10 * j + k, junction=junction)
+        JunctionLink.objects.create(from_junction=junctions[0], to_junction=junctions[1], free_flow_travel_time=30,
+                                    from_signal=signals[(0, 0)], to_signal=signals[(1, 0)])
+        JunctionLink.objects.create(from_junction=junctions[1], to_junction=junctions[2], free_flow_travel_time=20)
+
+        # Platoons leave J0 (queue drops) and reach J1 24s later (queue grows)
+        now = time.time()
+        rows = []
+        for t in range(0, 600, 2):
+            release = (t // 2) % 17 == 0
+            arriving = ((t - 24) // 2) % 17 == 0
+            stamp = datetime.fromtimestamp(now - 600 + t, tz=dt_timezone.utc)
+            rows.append(TrafficData(signal=signals[(0, 0)], vehicle_count=0 if release else 6, timestamp=stamp))
+            rows.append(TrafficData(signal=signals[(1, 0)], vehicle_count=6 if arriving else 0, timestamp=stamp))
+        TrafficData.objects.bulk_create(rows)
+
+        plan = CorridorCoordinator(window_seconds=700).replan(now=now)
+        self.assertEqual(JunctionLink.objects.get(from_junction=junctions[0]).measured_travel_time, 24.0)
+        cycle = plan[junctions[0].id]['cycle_length']
+        self.assertTrue(all(p['cycle_length'] == cycle for p in plan.values()))
+        offsets = [plan[j.id]['offset'] for j in junctions]
+        self.assertAlmostEqual((offsets[1] - offsets[0]) % cycle, 24.0)
+        self.assertAlmostEqual((offsets[2] - offsets[1]) % cycle, 20.0)
+        self.assertEqual(JunctionSignals.objects.get(id=junctions[2].id).cycle_length, cycle)
+
+    def test_align_cycle_corrects_late_start(self):
+        green = align_cycle([20, 20], [10, 10], [45, 45], [5, 5], cycle_length=60.0, offset=0.0, start_time=6.0)
+        self.assertEqual(green.tolist(), [22, 22])  # 60 - 6 late - 10 lost, split evenly
+
+
+class PhaseSelectorTests(SimpleTestCase):
+    """Empty approaches are skipped without starving anyone"""
+
+    def signals(self, counts):
+        return {i: SimulatedSignal(i, vehicle_count=c, traffic_weight=1.5 * c) for i, c in enumerate(counts)}
+
+    def test_skips_empty_and_orders_by_pressure(self):
+        selector = PhaseSelector()
+        self.assertEqual(selector.select_next(self.signals([5, 0, 3, 9]), 0, now=0.0), 3)
+        self.assertEqual(PhaseSelector(order=ORDER_CYCLIC).select_next(self.signals([5, 0, 3, 9]), 0, now=0.0), 2)
+        # Only the active approach has traffic: it is served again
+        self.assertEqual(selector.select_next(self.signals([5, 0, 0, 0]), 0, now=0.0), 0)
+
+    def test_max_red_and_max_skip(self):
+        selector = PhaseSelector(max_red=120, max_skip=300)
+        for signal_id in range(4):
+            selector.mark_green_end(signal_id, 0.0)
+        selector.mark_green_end(3, 100.0)
+        # Approach 1 has waited past max red, so it beats the heavier approach 3
+        self.assertEqual(selector.select_next(self.signals([0, 1, 0, 9]), 0, now=130.0), 1)
+        selector.mark_green_end(1, 145.0)
+        # Approach 2 is empty but has been skipped for max_skip seconds
+        self.assertEqual(selector.select_next(self.signals([0, 0, 0, 9]), 0, now=310.0), 2)
+
+
+class EmergencyPreemptionTests(SimpleTestCase):
+    """Emergency events drive the preemption state machine without database polling"""
+
+    def setUp(self):
+        self.clock = VirtualClock(datetime(2025, 1, 6, 12).timestamp())
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.worker = TrafficControlWorker(store=InMemorySignalStore(keep_events=True), clock=self.clock, live_outputs=False)
+        self.worker.verbose = False
+        self.worker.emergency_mode_active = True
+        self.bus = EmergencyEventBus()
+        self.bus.subscribe(self.worker.preemption.submit)
+        self.signals = self.worker.store.signals
+
+    def advance(self, seconds):
+        self.clock.advance(seconds)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.worker.tick(seconds)
+
+    def test_preempts_and_resumes_interrupted_green(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.worker.run_initial_detection_for_signal(0)
+        self.signals[0].remaining_time = 30
+        self.advance(1.0)
+
+        self.bus.publish(2, True, detected_at=self.clock(), emergency_count=1)
+        self.assertTrue(self.worker.preemption.wake.is_set())
+        self.advance(0.1)
+        self.assertEqual(self.worker.preemption.state, CLEARING)
+        self.assertEqual(self.signals[0].current_state, 'YELLOW')
+
+        self.advance(3.0)
+        self.assertEqual(self.worker.preemption.state, ALL_RED)
+        self.advance(2.0)
+        self.assertEqual(self.worker.preemption.state, SERVING)
+        self.assertEqual(self.signals[2].current_state, 'GREEN')
+        stats = self.worker.preemption.stats()
+        self.assertEqual(stats['reaction_latency']['last_ms'], 100.0)
+        self.assertEqual(stats['green_latency']['last_ms'], 5100.0)
+
+        # The vehicle leaves; Signal A gets back the green it lost
+        self.bus.publish(2, False)
+        self.advance(6.0)
+        self.assertEqual(self.worker.preemption.state, IDLE)
+        for _ in range(10):
+            self.advance(2.0)
+        self.assertEqual(self.worker.current_system_signal, 0)
+        self.assertEqual(self.signals[0].current_state, 'GREEN')
+        self.assertGreater(self.signals[0].remaining_time, 20)
+
+
+class EmergencyConfirmationTests(SimpleTestCase):
+    def frame(self, *centers):
+        return [{'class': 'emergency_vehicles', 'center': center, 'confidence': 0.8} for center in centers]
+
+    def test_single_frame_flicker_is_not_confirmed(self):
+        confirmer = EmergencyConfirmer(confirm_frames=3, window_frames=5)
+        for t in range(20):
+            state = confirmer.update(self.frame((100, 100)) if t % 3 == 0 else [], float(t))
+            self.assertFalse(state['confirmed'])
+
+    def test_n_of_m_confirms_and_releases(self):
+        confirmer = EmergencyConfirmer(confirm_frames=3, window_frames=5, release_frames=2)
+        frames = [self.frame((100, 100 + 10 * t)) if t != 1 else [] for t in range(4)]
+        states = [confirmer.update(frame, float(t)) for t, frame in enumerate(frames)]
+        self.assertEqual([s['confirmed'] for s in states], [False, False, False, True])
+        self.assertEqual(states[-1]['first_detected_at'], 0.0)
+        self.assertTrue(confirmer.update([], 4.0)['confirmed'])
+        state = confirmer.update([], 5.0)
+        self.assertFalse(state['confirmed'])
+        self.assertTrue(state['changed'])
+
+    def test_departing_track_does_not_vote(self):
+        signal = SimulatedSignal(0, emergency_confirm_frames=2, emergency_window_frames=4,
+                                 emergency_approach_direction='down')
+        confirmer = EmergencyConfirmer()
+        confirmer.configure(signal)
+        for t in range(6):
+            state = confirmer.update(self.frame((300, 400 - 30 * t)), float(t))
+        self.assertEqual(state['direction'], DEPARTING)
+        self.assertFalse(state['confirmed'])
+
+        confirmer.reset()
+        for t in range(3):
+            state = confirmer.update(self.frame((300, 100 + 30 * t)), float(t))
+        self.assertTrue(state['confirmed'])
+
+
+class KPIEngineTests(SimpleTestCase):
+    def test_cycle_kpis_from_phase_changes_and_counts(self):
+        kpis = KPIEngine(tau=1e9)
+        approach = SimulatedSignal(0)
+        for now, count in [(0.0, 0), (10.0, 4)]:
+            approach.vehicle_count = count
+            kpis.observe_counts([approach], now)
+        kpis.phase_change(0, 'GREEN', 10.0)
+        for now in (20.0, 30.0):
+            approach.vehicle_count = 0
+            kpis.observe_counts([approach], now)
+        kpis.phase_change(0, 'YELLOW', 30.0)
+        kpis.phase_change(0, 'RED', 33.0)
+        kpis.phase_change(0, 'GREEN', 70.0)
+        kpis.emergency_served(0, 2.5)
+
+        summary = kpis.summary()
+        self.assertEqual(summary['avg_delay_seconds'], 10.0)  # 40 vehicle-seconds over 4 arrivals
+        self.assertEqual(summary['system_efficiency'], 50.0)  # 10 of 20 green seconds with nobody waiting
+        self.assertEqual(summary['throughput_per_green_second'], 0.2)
+        self.assertEqual(summary['cycle_time'], 60.0)
+        self.assertEqual(summary['emergency_response']['avg_seconds'], 2.5)
+
+    def test_simulation_publishes_kpis(self):
+        metrics = TrafficSimulation(PoissonArrivals([0.1, 0.08, 0.05, 0.03], seed=1)).run(0.5)
+        self.assertGreater(metrics['kpis']['cycle_time'], 0)
+        self.assertGreater(metrics['kpis']['system_efficiency'], 0)
+
+
+class VideoIngestTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        TrafficSignal.objects.create(signal_id=0)
+
+    def write_video(self, name, size=(64, 48), frames=10):
+        path = os.path.join(self.tmp.name, name)
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 10.0, size)
+        for i in range(frames):
+            writer.write(np.full((size[1], size[0], 3), i * 20, dtype=np.uint8))
+        writer.release()
+        return path
+
+    def run_job(self, pipeline, path):
+        job = pipeline.submit(0, path)  # not started: the job runs here, not on the worker thread
+        with contextlib.redirect_stdout(io.StringIO()):
+            return pipeline.process(job['job_id'])
+
+    def test_oversized_video_is_transcoded_and_activated(self):
+        pipeline = VideoIngestPipeline(max_width=32, max_height=32)
+        job = self.run_job(pipeline, self.write_video('big.mp4'))
+        self.assertEqual(job['state'], READY, job['error'])
+        self.assertTrue(job['transcoded'])
+        self.assertEqual((job['probe']['width'], job['probe']['height']), (32, 24))
+        source = VideoSource.objects.get(signal__signal_id=0)
+        self.assertEqual(source.video_path, job['video_path'])
+        self.assertEqual(source.width, 32)
+
+    def test_corrupt_upload_fails_without_touching_the_source(self):
+        path = os.path.join(self.tmp.name, 'broken.mp4')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(4096))
+        pipeline = VideoIngestPipeline()
+        job = self.run_job(pipeline, path)
+        self.assertEqual(job['state'], FAILED)
+        self.assertFalse(VideoSource.objects.exists())
+
+    def test_queued_jobs_are_never_evicted(self):
+        pipeline = VideoIngestPipeline(keep_jobs=2)
+        queued = [pipeline.submit(0, self.write_video(f'{i}.mp4', size=(32, 24)))['job_id'] for i in range(3)]
+        self.assertEqual(list(pipeline.jobs), queued)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for job_id in queued:
+                self.assertEqual(pipeline.process(job_id)['state'], READY)
+            # Once finished, the oldest jobs make room again
+            latest = pipeline.submit(0, self.write_video('3.mp4', size=(32, 24)))['job_id']
+        self.assertEqual(list(pipeline.jobs), queued[2:] + [latest])
+
+    def test_job_status_is_shared_between_processes(self):
+        shared = FakeRedis()
+        uploader = VideoIngestPipeline(redis_client=shared, job_ttl=60)
+        poller = VideoIngestPipeline(redis_client=shared)
+        job = uploader.submit(0, self.write_video('small.mp4', size=(32, 24)))
+        self.assertEqual(poller.status(job['job_id'])['state'], QUEUED)
+        with contextlib.redirect_stdout(io.StringIO()):
+            uploader.process(job['job_id'])
+        self.assertEqual(poller.status(job['job_id']), uploader.status(job['job_id']))
+        self.assertEqual(poller.status(job['job_id'])['state'], READY)
+        self.assertIsNone(poller.status('unknown'))
+
+        # Job states expire from Redis after job_ttl
+        _, expires_at = shared.values['video_ingest_job:' + job['job_id']]
+        self.assertAlmostEqual(expires_at - time.time(), 60, delta=5)
+
+
+class TargetedReloadTests(SimpleTestCase):
+    def setUp(self):
+        # The reload path only needs the queue and per-signal state, not YOLO or captures
+        self.worker = DetectionWorker.__new__(DetectionWorker)
+        self.worker.pending_reloads = queue.Queue()
+        self.worker.signal_ids = [0, 1, 2, 3]
+        self.worker.emergency_confirmers = [EmergencyConfirmer() for _ in range(4)]
+        self.worker.frame_counters = [7] * 4
+
+    def enqueue(self, *messages):
+        for message in messages:
+            self.worker.pending_reloads.put(parse_reload_message(message))
+
+    def test_only_the_changed_signal_is_reloaded(self):
+        self.assertIsNone(parse_reload_message('cache_invalidate:video_sources'))
+        self.enqueue(reload_message(AREA_CHANGED, 1), reload_message(AREA_CHANGED, 1), reload_message(SOURCE_CHANGED, 2))
+        with mock.patch.object(DetectionWorker, 'load_detection_areas') as load_areas, \
+                mock.patch.object(DetectionWorker, 'reinitialize_video_capture') as reopen, \
+                mock.patch.object(DetectionWorker, 'reload_config_from_db') as reload_all, \
+                contextlib.redirect_stdout(io.StringIO()):
+            self.worker.apply_pending_reloads()
+        load_areas.assert_called_once_with([1])
+        reopen.assert_called_once_with(2)
+        reload_all.assert_not_called()
+        self.assertEqual(self.worker.frame_counters, [7, 7, 0, 7])
+
+    def test_malformed_messages_do_not_stop_the_listener(self):
+        self.assertIsNone(parse_reload_message(json.dumps({'type': AREA_CHANGED, 'signal_id': 'E'})))
+        self.assertIsNone(parse_reload_message(json.dumps({'type': AREA_CHANGED, 'signal_id': [1]})))
+        self.assertEqual(parse_reload_message(json.dumps({'type': AREA_CHANGED, 'signal_id': 'B'})), (AREA_CHANGED, 1))
+
+        self.worker.CONTROL_CHANNEL = 'control'
+        self.worker.redis_control_pubsub = mock.Mock()
+        self.worker.redis_control_pubsub.listen.return_value = [
+            {'type': 'subscribe', 'data': 1},
+            {'type': 'message', 'data': json.dumps({'type': AREA_CHANGED, 'signal_id': [1]}).encode('utf-8')},
+            {'type': 'message', 'data': b'\xff{'},
+            {'type': 'message', 'data': reload_message(SOURCE_CHANGED, 2).encode('utf-8')},
+        ]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.worker._redis_control_listener_thread_func()
+        self.assertEqual(self.worker.pending_reloads.get_nowait(), (SOURCE_CHANGED, 2))
+        self.assertTrue(self.worker.pending_reloads.empty())
+
+    def test_legacy_reload_config_reloads_everything_once(self):
+        self.assertEqual(parse_reload_message('reload_config'), (RELOAD_ALL, None))
+        self.enqueue('reload_config', reload_message(SOURCE_CHANGED, 0))
+        with mock.patch.object(DetectionWorker, 'reinitialize_video_capture') as reopen, \
+                mock.patch.object(DetectionWorker, 'reload_config_from_db') as reload_all:
+            self.worker.apply_pending_reloads()
+        reload_all.assert_called_once_with()
+        reopen.assert_not_called()
+
+
+class FakeStreamServer:
+    """Stand-in for an RTSP server: can drop the connection or stop sending frames"""
+
+    def __init__(self):
+        self.up = True
+        self.stalled = False
+        self.connections = 0
+
+    def connect(self, url):
+        self.connections += 1
+        return FakeCapture(self) if self.up else None
+
+
+class FakeCapture:
+    def __init__(self, server):
+        self.server = server
+        self.released = False
+
+    def isOpened(self):
+        return not self.released
+
+    def get(self, prop):
+        return 50.0 if prop == cv2.CAP_PROP_FPS else 0
+
+    def read(self):
+        time.sleep(0.01)
+        while self.server.stalled and not self.released:
+            time.sleep(0.01)
+        if self.released or not self.server.up:
+            return False, None
+        return True, np.zeros((48, 64, 3), dtype=np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+class FakeRedis:
+    """In-memory stand-in for the few Redis commands the caches and publishers use"""
+
+    def __init__(self):
+        self.values = {}  # key -> (value, expires_at or None)
+        self.published = []
+
+    def get(self, key):
+        value, expires_at = self.values.get(key, (None, None))
+        if expires_at is not None and time.time() >= expires_at:
+            del self.values[key]
+            return None
+        return value
+
+    def set(self, key, value, ex=None, px=None):
+        ttl = ex if ex is not None else (px / 1000.0 if px is not None else None)
+        self.values[key] = (value.encode('utf-8') if isinstance(value, str) else value,
+                            time.time() + ttl if ttl is not None else None)
+        return True
+
+    def incr(self, key):
+        value = int(self.get(key) or 0) + 1
+        self.values[key] = (str(value).encode('utf-8'), None)
+        return value
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 0
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+
+class LiveSourceTests(SimpleTestCase):
+    def wait_for(self, condition, timeout=3.0):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def make_source(self, server, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            source = LiveSource('rtsp://camera/1', capture_factory=server.connect, backoff_initial=0.05, **kwargs)
+        self.addCleanup(source.release)
+        return source
+
+    def test_reconnects_after_drop_and_recovers_health(self):
+        server = FakeStreamServer()
+        with contextlib.redirect_stdout(io.StringIO()):
+            source = self.make_source(server)
+            self.wait_for(lambda: source.seq > 5)
+            ok, frame = source.read()
+            self.assertTrue(ok)
+            self.assertEqual(source.get(cv2.CAP_PROP_FRAME_WIDTH), 64)
+            self.assertIsNotNone(source.last_captured_at)
+
+            server.up = False
+            self.wait_for(lambda: source.state == RECONNECTING)
+            self.assertEqual(source.health(), 0.0)
+            server.up = True
+            self.wait_for(lambda: source.state == STREAMING and source.health() > 0)
+        self.assertGreaterEqual(server.connections, 2)
+        self.assertLess(source.health(), 1.0)  # the recent reconnect still counts against it
+
+    def test_stalled_stream_is_torn_down(self):
+        server = FakeStreamServer()
+        with contextlib.redirect_stdout(io.StringIO()):
+            source = self.make_source(server, stall_timeout=0.2)
+            self.wait_for(lambda: source.seq > 0)
+            server.stalled = True
+            time.sleep(0.3)
+            self.assertEqual(source.health(), 0.0)
+            source.read()  # the consumer's stall check releases the hung capture
+            server.stalled = False
+            self.wait_for(lambda: source.stalls == 1 and server.connections >= 2 and source.health() > 0)
+
+    def test_controller_falls_back_to_fixed_timing_for_unhealthy_source(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            worker = TrafficControlWorker(store=InMemorySignalStore(), clock=VirtualClock(0.0), live_outputs=False)
+            signal = worker.store.signals[1]
+            signal.vehicle_count, signal.traffic_weight = 30, 60.0
+            self.assertGreater(worker.adaptive_green_time(signal), signal.default_green_time)
+            signal.source_health = 0.2
+            self.assertEqual(worker.adaptive_green_time(signal), signal.default_green_time)
+            signal.vehicle_count = 0
+        self.assertTrue(worker.phase_selector.has_demand(signal))
+
+
+class LatencyTracingTests(SimpleTestCase):
+    def test_frame_stamp_round_trips_through_published_frame(self):
+        stamp = FrameStamp(42, 1234.5, 1700000000.25)
+        decoded, jpeg = unpack_frame(pack_frame(stamp, b'\xff\xd8jpeg'))
+        self.assertEqual((decoded.seq, decoded.mono, decoded.wall), (42, 1234.5, 1700000000.25))
+        self.assertEqual(jpeg, b'\xff\xd8jpeg')
+        # Frames from a publisher without stamps still decode
+        self.assertEqual(unpack_frame(b'\xff\xd8jpeg'), (None, b'\xff\xd8jpeg'))
+
+    def test_tracker_reports_percentiles_per_hop(self):
+        tracker = LatencyTracker('detection')
+        for ms in range(1, 101):
+            tracker.record('inference', ms / 1000.0)
+        tracker.since_capture('capture_to_publish', FrameStamp(1, time.monotonic() - 0.03, time.time()))
+        stats = tracker.stats()
+        self.assertEqual(stats['inference']['count'], 100)
+        self.assertEqual(stats['inference']['p50_ms'], 50.0)
+        self.assertEqual(stats['inference']['p99_ms'], 100.0)
+        self.assertEqual(stats['capture_to_publish']['p50_ms'], 50.0)
+
+
+class EventLogTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def test_rotates_and_reads_events_back_in_order(self):
+        log = EventLog('detection', directory=self.directory, max_bytes=1000, max_files=2, flush_size=5)
+        for i in range(40):
+            log.write('DETECTION_UPDATE', i % 4, {'n': i}, timestamp=1000.0 + i)
+        log.close()
+        files = log_files(self.directory)
+        self.assertEqual(len(files), 3)  # two rotated files kept, plus the active one
+        events = list(read_events(self.directory, signal_id=2))
+        self.assertTrue(events)
+        self.assertEqual([e['details']['n'] for e in events], sorted(e['details']['n'] for e in events))
+        self.assertTrue(all(e['signal'] == 2 for e in events))
+
+        out = io.StringIO()
+        call_command('query_events', '--dir', self.directory, '--count', stdout=out)
+        self.assertIn('DETECTION_UPDATE', out.getvalue())
+
+    def test_query_decodes_detection_updates(self):
+        log = EventLog('detection', directory=self.directory)
+        log.write('DETECTION_UPDATE', 0, detection_details(3, 4.5, {'car': 2, 'bus': 1}, 0.8), timestamp=1000.0)
+        log.close()
+        out = io.StringIO()
+        call_command('query_events', '--dir', self.directory, stdout=out)
+        self.assertIn('"vehicle_count":3', out.getvalue())
+        self.assertIn('"bus":1', out.getvalue())
+
+    def test_only_audit_events_reach_the_database(self):
+        signal = TrafficSignal.objects.create(signal_id=0)
+        store = DatabaseSignalStore(EventLog('control', directory=self.directory, flush_size=1))
+        with store.atomic():
+            store.log_event(signal, 'STATE_CHANGE', {'old_state': 'RED', 'new_state': 'GREEN'})
+            store.log_event(signal, 'CONGESTION_ALERT', {'level': 'HIGH'})
+            self.assertEqual(TrafficLog.objects.count(), 0)  # written once, at the end of the block
+        self.assertEqual(list(TrafficLog.objects.values_list('event_type', flat=True)), ['STATE_CHANGE'])
+        self.assertEqual([e['type'] for e in read_events(self.directory)], ['STATE_CHANGE', 'CONGESTION_ALERT'])
+
+    def test_lone_event_is_flushed_without_another_write(self):
+        log = EventLog('control', directory=self.directory, flush_size=100, flush_interval=0.2)
+        self.addCleanup(log.close)
+        log.write('CONGESTION_ALERT', 0, {'level': 'HIGH'})
+        deadline = time.time() + 3.0
+        while not list(read_events(self.directory)) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual([e['type'] for e in read_events(self.directory)], ['CONGESTION_ALERT'])
+        self.assertEqual(log.pending, [])
+
+
+class CongestionEngineTests(TestCase):
+    def feed(self, engine, weight, start, seconds, step=1.0):
+        results = []
+        t = start
+        while t < start + seconds:
+            results.append(engine.update(0, int(weight), weight, 1000, t))
+            t += step
+        return results, t
+
+    def test_levels_change_with_hysteresis_and_hold(self):
+        engine = CongestionEngine(tau=2.0, exit_ratio=0.75, hold_seconds=3.0)
+        results, t = self.feed(engine, 0.0, 0.0, 5)
+        self.assertTrue(all(r['level'] == 'LOW' and r['transition'] is None for r in results))
+
+        # Score ~10.5: HIGH once it has held for 3 s, reported by exactly one transition
+        results, t = self.feed(engine, 15.0, t, 15)
+        transitions = [r['transition'] for r in results if r['transition']]
+        self.assertEqual(results[-1]['level'], 'HIGH')
+        self.assertEqual([tr['previous'] for tr in transitions], ['LOW'])
+
+        # Score ~7 is below HIGH's entry (8) but above its exit (6): stays HIGH
+        results, t = self.feed(engine, 10.0, t, 20)
+        self.assertTrue(all(r['level'] == 'HIGH' and r['transition'] is None for r in results))
+
+        results, t = self.feed(engine, 0.0, t, 30)
+        self.assertEqual(results[-1]['level'], 'LOW')
+
+    def test_events_only_on_transitions_and_resolved_when_cleared(self):
+        signal = TrafficSignal.objects.create(signal_id=0)
+        worker = DetectionWorker.__new__(DetectionWorker)
+        worker.congestion = CongestionEngine(tau=1.0, hold_seconds=2.0)
+        t = 0.0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for weight, seconds in [(30.0, 10), (0.0, 20)]:
+                for _ in range(seconds):
+                    congestion = worker.congestion.update(0, int(weight), weight, 1000, t)
+                    if congestion['transition']:
+                        worker.record_congestion_transition(signal, congestion)
+                    t += 1.0
+        events = list(CongestionEvent.objects.order_by('timestamp', 'id').values_list('severity', 'resolution_time'))
+        self.assertEqual([severity for severity, _ in events], ['SEVERE'])
+        self.assertIsNotNone(events[0][1])
+        self.assertEqual(analytics_thread.get_current_congestion_data()[0]['level'], 'LOW')
+
+    def test_restart_resumes_open_event(self):
+        signal = TrafficSignal.objects.create(signal_id=0, congestion_level='HIGH', congestion_score=12.0)
+        stale = CongestionEvent.objects.create(signal=signal, severity='SEVERE', score=25.0, cause='earlier run')
+        current = CongestionEvent.objects.create(signal=signal, severity='HIGH', score=12.0, cause='before restart')
+        worker = DetectionWorker.__new__(DetectionWorker)
+        worker.signal_ids = [0]
+        worker.congestion = CongestionEngine(tau=1.0, hold_seconds=2.0)
+        worker.restore_congestion_state()
+        self.assertIsNotNone(CongestionEvent.objects.get(id=stale.id).resolution_time)
+
+        # Traffic cleared while the worker was down: the resumed event is resolved on the transition
+        t = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for second in range(20):
+                congestion = worker.congestion.update(0, 0, 0.0, 1000, t + second)
+                if congestion['transition']:
+                    worker.record_congestion_transition(signal, congestion)
+        self.assertEqual(congestion['level'], 'LOW')
+        self.assertIsNotNone(CongestionEvent.objects.get(id=current.id).resolution_time)
+        self.assertEqual(analytics_thread.get_current_congestion_data()[0]['level'], 'LOW')
+
+
+class DetectionZoneTests(TestCase):
+    def test_overlapping_zones_counted_in_one_pass(self):
+        zones = [
+            {'name': 'lane1', 'zone_type': 'LANE', 'points': [[0, 0], [50, 0], [50, 100], [0, 100]]},
+            {'name': 'lane2', 'zone_type': 'LANE', 'points': [[50, 0], [100, 0], [100, 100], [50, 100]]},
+            {'name': 'stop', 'zone_type': 'STOP_LINE', 'points': [[0, 80], [100, 80], [50, 99]]},
+            {'name': 'tail', 'zone_type': ZONE_QUEUE_TAIL, 'points': [[0, 0], [100, 0], [100, 10], [0, 10]]},
+        ]
+        mask = ZoneMask(zones, 100, 100)
+        detections = [
+            {'class': 'car', 'center': (20, 85)},
+            {'class': 'bus', 'center': (70, 50)},
+            {'class': 'bike', 'center': (10, 5)},
+            {'class': 'car', 'center': (500, 500)},
+        ]
+        counts = mask.count(detections, {'car': 1.0, 'bus': 2.5, 'bike': 0.5})
+        self.assertEqual({name: zone['count'] for name, zone in counts.items()},
+                         {'lane1': 2, 'lane2': 1, 'stop': 1, 'tail': 1})
+        self.assertEqual(counts['lane2']['weight'], 2.5)
+
+        engine = NetworkTimingEngine()
+        queued = SimulatedSignal(0, vehicle_count=1, traffic_weight=0.5, zone_counts=counts)
+        self.assertEqual(engine.green_time(queued, record=False), queued.max_green_time)
+
+    def test_save_zones_replaces_signal_zones(self):
+        signal = TrafficSignal.objects.create(signal_id=0)
+        VideoSource.objects.create(signal=signal, video_path='', width=1280, height=720)
+        url = reverse('save_zones')
+        zones = [{'name': 'lane1', 'points': [[0, 0], [320, 0], [320, 360]]},
+                 {'name': 'tail', 'type': 'QUEUE_TAIL', 'points': [[0, 0], [640, 0], [640, 40], [0, 40]]}]
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = self.client.post(url, json.dumps({'signal_id': 'A', 'zones': zones}), content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(DetectionZone.objects.values_list('name', 'position')), [('lane1', 0), ('tail', 1)])
+            self.assertEqual(DetectionZone.objects.get(name='lane1').polygon, [[0, 0], [640, 0], [640, 720]])
+
+            bad = self.client.post(url, json.dumps({'signal_id': 0, 'zones': [zones[0], zones[0]]}), content_type='application/json')
+            self.assertEqual(bad.status_code, 400)
+            for points in ([[0, 0], [320, 0], 'x'], [[0, 0], [320], [320, 360]], [[0, 0], [320, 0], ['320', 360]]):
+                bad = self.client.post(url, json.dumps({'signal_id': 0, 'zones': [{'name': 'lane1', 'points': points}]}),
+                                       content_type='application/json')
+                self.assertEqual(bad.status_code, 400)
+            self.assertEqual(DetectionZone.objects.count(), 2)
+
+
+class GroundCalibrationTests(TestCase):
+    # A 7 m wide (two-lane), 40 m long stretch of road seen by two differently placed cameras
+    GROUND = [[0, 0], [7, 0], [7, 40], [0, 40]]
+
+    def test_calibrated_scores_do_not_depend_on_camera_angle(self):
+        near = [[100, 700], [1100, 700], [800, 200], [400, 200]]
+        far = [[500, 400], [700, 400], [660, 300], [540, 300]]
+        scores = []
+        for image_points in (near, far):
+            homography = compute_homography(image_points, self.GROUND)
+            self.assertAlmostEqual(lane_meters(homography, image_points, 3.5), 80.0, places=1)
+            scores.append(congestion_score(8, 10.0, 0, lane_meters(homography, image_points, 3.5)))
+        self.assertAlmostEqual(scores[0], scores[1], places=2)
+
+    def test_save_calibration_updates_area_lane_meters(self):
+        signal = TrafficSignal.objects.create(signal_id=0)
+        VideoSource.objects.create(signal=signal, video_path='', width=640, height=360)
+        DetectionArea.objects.create(signal=signal, area_points=[[100, 300], [540, 300], [400, 100], [240, 100]])
+        url = reverse('save_calibration')
+        body = {'signal_id': 'A', 'image_points': [[100, 300], [540, 300], [400, 100], [240, 100]], 'ground_points': self.GROUND}
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = self.client.post(url, json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertAlmostEqual(DetectionArea.objects.get(signal=signal).lane_meters, 80.0, places=1)
+
+            collinear = dict(body, image_points=[[0, 0], [1, 1], [2, 2], [3, 3]])
+            self.assertEqual(self.client.post(url, json.dumps(collinear), content_type='application/json').status_code, 400)
+            self.client.post(url, json.dumps({'signal_id': 0, 'clear': True}), content_type='application/json')
+        self.assertEqual(DetectionArea.objects.get(signal=signal).lane_meters, 0.0)
+
+
+class WorkerRunnerTests(TestCase):
+    class CrashingWorker:
+        def __init__(self):
+            self.running = False
+            self.runs = 0
+            self.loop_thread = None
+
+        def loop(self):
+            self.runs += 1  # dies straight away
+
+        def supervised_threads(self):
+            return {'loop_thread': self.loop}
+
+    def test_dead_threads_restarted_until_budget_used(self):
+        worker = self.CrashingWorker()
+        worker.running = True
+        worker.loop_thread = threading.Thread(target=worker.loop)
+        worker.loop_thread.start()
+        supervisor = WorkerSupervisor(worker, 'test', max_restarts=2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(2):
+                worker.loop_thread.join()
+                self.assertTrue(supervisor.check_threads())
+            worker.loop_thread.join()
+            self.assertFalse(supervisor.check_threads())
+        self.assertEqual(worker.runs, 3)
+
+    def test_signals_resolved_from_letters_and_junctions(self):
+        junction = JunctionSignals.objects.create(junction_name='North')
+        for signal_id in (2, 3):
+            TrafficSignal.objects.create(signal_id=signal_id, junction=junction)
+        self.assertIsNone(resolve_signal_ids())
+        self.assertEqual(resolve_signal_ids(['A,b', '1'], [junction.id]), [0, 1, 2, 3])
+        self.assertEqual(worker_name('control', [3, 2]), 'control-2-3')
+        with contextlib.redirect_stdout(io.StringIO()):
+            worker = TrafficControlWorker(store=InMemorySignalStore(signal_ids=[2, 3]), clock=VirtualClock(0.0),
+                                          live_outputs=False, signal_ids=[2, 3])
+        self.assertEqual(sorted(worker.store.all()), [2, 3])
+        self.assertEqual(worker.current_system_signal, 2)
+
+
+class StateCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.redis = FakeRedis()
+        self.value = 30.0
+        self.loads = 0
+
+    def loader(self):
+        self.loads += 1
+        return {'remaining_time': self.value}
+
+    def cache(self):
+        return VersionedReadThroughCache(self.redis)
+
+    def test_hits_local_then_shared_copy(self):
+        first, second = self.cache(), self.cache()
+        self.assertEqual(first.get(SIGNAL_STATES, self.loader), {'remaining_time': 30.0})
+        self.assertEqual(first.get(SIGNAL_STATES, self.loader), {'remaining_time': 30.0})
+        self.assertEqual(second.get(SIGNAL_STATES, self.loader), {'remaining_time': 30.0})
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(first.hits, 1)
+
+    def test_invalidate_bumps_version(self):
+        writer, reader = self.cache(), self.cache()
+        reader.get(DETECTION_AREAS, self.loader)
+        self.value = 25.0
+        writer.invalidate(DETECTION_AREAS)
+        reader.handle_control_message(self.redis.published[-1][1])
+        self.assertEqual(reader.get(DETECTION_AREAS, self.loader), {'remaining_time': 25.0})
+        self.assertEqual(self.loads, 2)
+
+    def test_shared_copy_expires_with_namespace_ttl(self):
+        cache = self.cache()
+        cache.get(SIGNAL_STATES, self.loader)
+        self.value = 25.0
+        self.now += DEFAULT_TTLS[SIGNAL_STATES] + 0.1
+        # Neither the local nor the Redis copy outlives the 0.5 s TTL, without any invalidation
+        self.assertEqual(cache.get(SIGNAL_STATES, self.loader), {'remaining_time': 25.0})
+        self.assertEqual(self.cache().get(SIGNAL_STATES, self.loader), {'remaining_time': 25.0})
+        # Long-lived namespaces keep their shared copy
+        cache.get(DETECTION_AREAS, self.loader)
+        self.value = 20.0
+        self.now += 10.0
+        self.assertEqual(self.cache().get(DETECTION_AREAS, self.loader), {'remaining_time': 25.0})
+
+    def test_lost_invalidation_only_lasts_one_version_check(self):
+        writer, reader = self.cache(), self.cache()
+        reader.get(DETECTION_AREAS, self.loader)
+        self.value = 25.0
+        writer.invalidate(DETECTION_AREAS)  # the reader never sees the message
+        self.now += 1.0
+        self.assertEqual(reader.get(DETECTION_AREAS, self.loader), {'remaining_time': 30.0})
+        self.now += reader.version_check_interval
+        self.assertEqual(reader.get(DETECTION_AREAS, self.loader), {'remaining_time': 25.0})
+
+    def test_value_invalidated_while_loading_is_not_kept(self):
+        writer, reader = self.cache(), self.cache()
+
+        def racing_loader():
+            value = self.loader()
+            self.value = 25.0
+            writer.invalidate(DETECTION_AREAS)
+            reader.handle_control_message(self.redis.published[-1][1])
+            return value
+
+        self.assertEqual(reader.get(DETECTION_AREAS, racing_loader), {'remaining_time': 30.0})
+        self.assertEqual(reader.get(DETECTION_AREAS, self.loader), {'remaining_time': 25.0})
+        self.assertEqual(self.loads, 2)
+
+
+class TimeSeriesRollupTests(TestCase):
+    BASE = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.signals = [TrafficSignal.objects.create(signal_id=i) for i in range(2)]
+        self.store = TrafficTimeSeriesStore()
+
+    def add(self, signal_idx, seconds, vehicle_count=1):
+        TrafficData.objects.create(signal=self.signals[signal_idx], vehicle_count=vehicle_count, traffic_weight=1.0,
+                                   green_time=15, timestamp=self.BASE + timedelta(seconds=seconds))
+
+    def rollup(self, signal_idx, bucket, resolution=TrafficDataRollup.RESOLUTION_1MIN):
+        return TrafficDataRollup.objects.get(signal=self.signals[signal_idx], resolution=resolution,
+                                             bucket_start=self.BASE + timedelta(seconds=bucket))
+
+    def test_late_rows_reach_rolled_up_minutes(self):
+        self.add(0, 10)
+        self.add(1, 70)  # moves the watermark past signal 0's minute
+        self.store.rollup_raw_to_minutes(now=self.BASE + timedelta(minutes=5))
+        self.add(0, 20, vehicle_count=3)  # flushed long after its minute closed
+        self.store.rollup_raw_to_minutes(now=self.BASE + timedelta(minutes=6))
+        bucket = self.rollup(0, 0)
+        self.assertEqual((bucket.samples, bucket.vehicle_count_sum, bucket.vehicle_count_max), (2, 4, 3))
+
+    def test_quarter_hours_built_from_minutes(self):
+        for minute in range(30):
+            self.add(0, minute * 60 + 5, vehicle_count=minute)
+        now = self.BASE + timedelta(minutes=40)
+        self.assertEqual(self.store.rollup_raw_to_minutes(now=now), 30)
+        self.assertEqual(self.store.rollup_minutes_to_quarter_hours(now=now), 2)
+        first, second = self.rollup(0, 0, TrafficDataRollup.RESOLUTION_15MIN), self.rollup(0, 900, TrafficDataRollup.RESOLUTION_15MIN)
+        self.assertEqual((first.samples, first.vehicle_count_sum, first.vehicle_count_max), (15, sum(range(15)), 14))
+        self.assertEqual((second.samples, second.vehicle_count_sum, second.vehicle_count_max), (15, sum(range(15, 30)), 29))
+
+    def test_purge_waits_for_settled_rollups(self):
+        SystemSettings.objects.update_or_create(id=1, defaults={'raw_data_retention_hours': 1})
+        now = self.BASE + timedelta(hours=3)
+        self.add(0, 0)
+        self.add(0, 3600 + 55 * 60)
+        # Nothing rolled up yet: old raw rows are kept whatever their age
+        self.assertNotIn('raw', self.store.purge_expired(now=now))
+        self.assertEqual(TrafficData.objects.count(), 2)
+
+        self.store.rollup_raw_to_minutes(now=now)
+        self.assertEqual(self.store.purge_expired(now=now)['raw'], 1)
+        # The newer row is past retention too, but its minute is still inside the rollup lookback
+        self.assertEqual(list(TrafficData.objects.values_list('vehicle_count', flat=True)), [1])
+        self.assertEqual(self.rollup(0, 0).samples, 1)
+
+
+class StatePublisherTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.publisher = StatePublisher('control', self.redis)
+        self.assembler = LiveStateAssembler(self.redis)
+
+    def sent(self):
+        """Messages published since the last call, decoded"""
+        messages = [json.loads(message) for _, message in self.redis.published]
+        self.redis.published = []
+        return messages
+
+    def test_skipped_delta_resyncs_from_snapshot(self):
+        self.publisher.publish_snapshot([{'signal_id': 0, 'current_state': 'RED', 'remaining_time': 0.0}])
+        for remaining in (9.0, 8.0, 7.0):
+            self.publisher.publish_delta(0, {'remaining_time': remaining})
+        snapshot, first, lost, third = self.sent()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for message in (snapshot, first, third):
+                self.assertTrue(self.assembler.apply(message))
+        self.assertEqual(self.assembler.resyncs, 1)
+        self.assertEqual(self.assembler.signals[0]['remaining_time'], 7.0)
+
+    def test_duplicate_and_late_messages_dropped(self):
+        self.publisher.publish_snapshot([{'signal_id': 0, 'remaining_time': 10.0}])
+        self.publisher.publish_delta(0, {'remaining_time': 9.0})
+        self.publisher.publish_delta(0, {'remaining_time': 8.0})
+        snapshot, first, second = self.sent()
+        for message in (snapshot, first, second):
+            self.assertTrue(self.assembler.apply(message))
+        self.assertFalse(self.assembler.apply(second))
+        self.assertFalse(self.assembler.apply(first))
+        self.assertEqual(self.assembler.signals[0]['remaining_time'], 8.0)
+        self.assertEqual(self.assembler.resyncs, 0)
+
+    def test_new_epoch_resyncs(self):
+        self.publisher.publish_snapshot([{'signal_id': 0, 'current_state': 'GREEN', 'remaining_time': 10.0}])
+        self.assembler.apply(self.sent()[0])
+
+        # The worker restarted: its first delta is not enough to rebuild the state
+        restarted = StatePublisher('control', self.redis)
+        restarted.epoch = self.publisher.epoch + 1
+        restarted.publish_snapshot([{'signal_id': 0, 'current_state': 'RED', 'remaining_time': 0.0}])
+        restarted.publish_delta(0, {'remaining_time': 2.0})
+        _, delta = self.sent()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(self.assembler.apply(delta))
+        self.assertEqual(self.assembler.resyncs, 1)
+        self.assertEqual(self.assembler.signals[0], {'signal_id': 0, 'current_state': 'RED', 'remaining_time': 2.0})
+
+
+class DatabaseUtilsTests(TestCase):
+    def setUp(self):
+        self.signal = TrafficSignal.objects.create(signal_id=0)
+
+    def log(self):
+        return TrafficLog(signal=self.signal, event_type='DETECTION_UPDATE', details={})
+
+    def test_batch_writer_flushes_on_size(self):
+        writer = BatchWriter('test', flush_size=3, flush_interval=3600)
+        writer.add(self.log())
+        writer.add(self.log())
+        self.assertEqual((writer.pending_count(), TrafficLog.objects.count()), (2, 0))
+        writer.add(self.log())
+        self.assertEqual((writer.pending_count(), TrafficLog.objects.count()), (0, 3))
+
+    def test_batch_writer_flushes_on_interval(self):
+        writer = BatchWriter('test', flush_size=100, flush_interval=1.0)
+        writer.add(self.log())
+        self.assertEqual(TrafficLog.objects.count(), 0)
+        writer.last_flush_time = time.time() - 2.0
+        writer.add(self.log())
+        self.assertEqual((writer.pending_count(), TrafficLog.objects.count()), (0, 2))
+
+    def test_batch_writer_keeps_rows_when_flush_fails(self):
+        writer = BatchWriter('test', flush_size=100, flush_interval=3600)
+        writer.add(self.log())
+        writer.add(self.log())
+        with mock.patch.object(TrafficLog.objects, 'bulk_create', side_effect=OperationalError('database is locked')), \
+                contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(writer.flush(), 0)
+        self.assertEqual((writer.pending_count(), TrafficLog.objects.count()), (2, 0))
+
+        # The next flush writes the kept rows, ahead of anything queued since
+        writer.add(self.log())
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual((writer.pending_count(), TrafficLog.objects.count()), (0, 3))
+
+    def test_run_with_db_retry(self):
+        query = mock.Mock(side_effect=[OperationalError('database is locked'), OperationalError('database is locked'), 'rows'])
+        with mock.patch('new_application.db_utils.time.sleep') as sleep, contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(run_with_db_retry('test', query), 'rows')
+            self.assertEqual(sleep.call_count, 2)
+
+            # Other errors, or locks past the last attempt, are raised
+            query = mock.Mock(side_effect=OperationalError('no such table: missing'))
+            with self.assertRaises(OperationalError):
+                run_with_db_retry('test', query)
+            self.assertEqual(query.call_count, 1)
+            query = mock.Mock(side_effect=OperationalError('database is locked'))
+            with self.assertRaises(OperationalError):
+                run_with_db_retry('test', query, max_retries=2)
+            self.assertEqual(query.call_count, 2)
+
+    def test_refresh_worker_connection_closes_old_connections(self):
+        with mock.patch('new_application.db_utils.close_old_connections') as close_old_connections:
+            refresh_worker_connection()
+        close_old_connections.assert_called_once_with()
+
+    def test_sqlite_connection_uses_wal_and_busy_timeout(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('TRAFFIC_DB_ENGINE selects a server database')
+        # The test database lives in memory, which has no WAL; open the settings on a file instead
+        with tempfile.TemporaryDirectory() as tmp:
+            wrapper = SQLiteDatabaseWrapper(dict(connection.settings_dict, NAME=os.path.join(tmp, 'wal.sqlite3')), alias='wal_check')
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], 20000)
+            finally:
+                wrapper.close()
@@ -0,0 +1,249 @@
+import threading
+import datetime
+from django.utils import timezone
+from django.db import transaction, OperationalError
+from django.db.models import Sum, Max, Count, Min
+from django.db.models.functions import TruncMinute
+
+from .models import TrafficData, TrafficDataRollup, TrafficLog, CongestionEvent, SignalTimingLog, SystemSettings
+from .db_utils import BatchWriter, refresh_worker_connection, release_worker_connection
+
+# Per-class count columns shared by TrafficData and its rollups
+CLASS_COUNT_FIELDS = ['auto_count', 'bike_count', 'bus_count', 'car_count', 'emergency_vehicles_count', 'truck_count']
+
+
+def floor_to_resolution(ts, resolution):
+    """Floor an aware datetime to the start of its bucket (resolution in seconds)"""
+    epoch = int(ts.timestamp())
+    return datetime.datetime.fromtimestamp(epoch - (epoch % resolution), tz=datetime.timezone.utc)
+
+
+class TrafficTimeSeriesStore:
+    """Append-only storage for per-frame TrafficData with downsampling (raw -> 1 min -> 15 min) and retention"""
+
+    def __init__(self, flush_size=50, flush_interval=2.0, maintenance_interval=60.0, rollup_grace_seconds=30,
+                 rollup_lookback_seconds=900):
+        self.maintenance_interval = maintenance_interval
+        # Buckets are only rolled up once they closed this long ago, so buffered rows have landed
+        self.rollup_grace_seconds = rollup_grace_seconds
+        # Buckets this recent are re-aggregated on every pass, so rows that land late (a flush held
+        # up by lock retries, a slower detection process) still reach the rollups
+        self.rollup_lookback_seconds = rollup_lookback_seconds
+
+        self.writer = BatchWriter('traffic_data', flush_size=flush_size, flush_interval=flush_interval)
+
+        self.running = False
+        self.maintenance_thread = None
+        self.stop_event = threading.Event()
+
+    # ------------------------------------------------------------------ writes
+    def append(self, signal, vehicle_count, traffic_weight, green_time, vehicle_type_counts, timestamp=None,
+               capture_time=None):
+        """Buffer one raw sample; rows are written in batches with their original timestamp"""
+        row = TrafficData(
+            signal=signal,
+            timestamp=timestamp or timezone.now(),
+            capture_time=capture_time,
+            vehicle_count=vehicle_count,
+            traffic_weight=traffic_weight,
+            green_time=green_time,
+            auto_count=vehicle_type_counts.get('auto', 0),
+            bike_count=vehicle_type_counts.get('bike', 0),
+            bus_count=vehicle_type_counts.get('bus', 0),
+            car_count=vehicle_type_counts.get('car', 0),
+            emergency_vehicles_count=vehicle_type_counts.get('emergency_vehicles', 0),
+            truck_count=vehicle_type_counts.get('truck', 0),
+        )
+        self.writer.add(row)
+
+    def flush(self):
+        """Write all buffered rows in a single bulk insert"""
+        return self.writer.flush()
+
+    # ------------------------------------------------------------ downsampling
+    def _rollup_watermark(self, resolution):
+        """Start of the next bucket that still needs rolling up for this resolution"""
+        last_bucket = TrafficDataRollup.objects.filter(resolution=resolution).aggregate(
+            last=Max('bucket_start'))['last']
+        if last_bucket is not None:
+            return last_bucket + datetime.timedelta(seconds=resolution)
+        return None
+
+    def _rollup_start(self, resolution):
+        """First bucket of the next pass: the lookback window before the watermark, None if nothing rolled up yet"""
+        watermark = self._rollup_watermark(resolution)
+        if watermark is None:
+            return None
+        return floor_to_resolution(watermark - datetime.timedelta(seconds=self.rollup_lookback_seconds), resolution)
+
+    def rollup_raw_to_minutes(self, now=None):
+        """Aggregate closed minutes of raw TrafficData into 1 minute rollups"""
+        now = now or timezone.now()
+        resolution = TrafficDataRollup.RESOLUTION_1MIN
+        end = floor_to_resolution(now - datetime.timedelta(seconds=self.rollup_grace_seconds), resolution)
+
+        start = self._rollup_start(resolution)
+        if start is None:
+            first = TrafficData.objects.aggregate(first=Min('timestamp'))['first']
+            if first is None:
+                return 0
+            start = floor_to_resolution(first, resolution)
+        if start >= end:
+            return 0
+
+        buckets = TrafficData.objects.filter(
+            timestamp__gte=start, timestamp__lt=end
+        ).annotate(
+            bucket=TruncMinute('timestamp', tzinfo=datetime.timezone.utc)
+        ).values('signal_id', 'bucket').annotate(
+            samples=Count('id'),
+            vehicle_count_sum=Sum('vehicle_count'),
+            vehicle_count_max=Max('vehicle_count'),
+            traffic_weight_sum=Sum('traffic_weight'),
+            green_time_sum=Sum('green_time'),
+            green_time_samples=Count('green_time'),
+            **{f'{field}_sum': Sum(field) for field in CLASS_COUNT_FIELDS}
+        ).order_by()
+
+        rollups = [self._build_rollup(resolution, entry['signal_id'], entry['bucket'], entry) for entry in buckets]
+        return self._save_rollups(rollups)
+
+    def rollup_minutes_to_quarter_hours(self, now=None):
+        """Re-aggregate closed 15 minute windows of 1 minute rollups"""
+        now = now or timezone.now()
+        resolution = TrafficDataRollup.RESOLUTION_15MIN
+        source_resolution = TrafficDataRollup.RESOLUTION_1MIN
+        end = floor_to_resolution(now - datetime.timedelta(seconds=self.rollup_grace_seconds + source_resolution), resolution)
+
+        start = self._rollup_start(resolution)
+        if start is None:
+            first = TrafficDataRollup.objects.filter(resolution=source_resolution).aggregate(
+                first=Min('bucket_start'))['first']
+            if first is None:
+                return 0
+            start = floor_to_resolution(first, resolution)
+        if start >= end:
+            return 0
+
+        merged = {}
+        minute_rows = TrafficDataRollup.objects.filter(
+            resolution=source_resolution, bucket_start__gte=start, bucket_start__lt=end
+        ).values()
+        for row in minute_rows:
+            key = (row['signal_id'], floor_to_resolution(row['bucket_start'], resolution))
+            totals = merged.setdefault(key, {'vehicle_count_max': 0})
+            for field in self._sum_fields():
+                totals[field] = totals.get(field, 0) + (row[field] or 0)
+            totals['vehicle_count_max'] = max(totals['vehicle_count_max'], row['vehicle_count_max'])
+
+        rollups = [self._build_rollup(resolution, signal_id, bucket, totals)
+                   for (signal_id, bucket), totals in merged.items()]
+        return self._save_rollups(rollups)
+
+    def _sum_fields(self):
+        return ['samples', 'vehicle_count_sum', 'traffic_weight_sum', 'green_time_sum', 'green_time_samples'] + \
+               [f'{field}_sum' for field in CLASS_COUNT_FIELDS]
+
+    def _build_rollup(self, resolution, signal_id, bucket_start, totals):
+        values = {field: totals.get(field) or 0 for field in self._sum_fields()}
+        return TrafficDataRollup(
+            signal_id=signal_id,
+            resolution=resolution,
+            bucket_start=bucket_start,
+            partition_day=bucket_start.date(),
+            vehicle_count_max=totals.get('vehicle_count_max') or 0,
+            **values
+        )
+
+    def _save_rollups(self, rollups):
+        """Insert new buckets and overwrite re-aggregated ones"""
+        if not rollups:
+            return 0
+        with transaction.atomic():
+            TrafficDataRollup.objects.bulk_create(
+                rollups, batch_size=500, update_conflicts=True,
+                unique_fields=['signal', 'resolution', 'bucket_start'],
+                update_fields=self._sum_fields() + ['vehicle_count_max', 'partition_day']
+            )
+        return len(rollups)
+
+    # --------------------------------------------------------------- retention
+    def purge_expired(self, now=None):
+        """Drop raw rows, rollup partitions and logs that are past their retention window"""
+        now = now or timezone.now()
+        settings, _ = SystemSettings.objects.get_or_create(id=1)
+        deleted = {}
+
+        # Raw rows are only removed once their 1 minute rollup is final (past the lookback)
+        raw_cutoff = now - datetime.timedelta(hours=settings.raw_data_retention_hours)
+        minute_settled = self._rollup_start(TrafficDataRollup.RESOLUTION_1MIN)
+        if minute_settled is not None:
+            raw_cutoff = min(raw_cutoff, minute_settled)
+            deleted['raw'] = TrafficData.objects.filter(timestamp__lt=raw_cutoff).delete()[0]
+
+        # Same for 1 minute partitions and the 15 minute rollups built from them
+        minute_cutoff_day = (now - datetime.timedelta(days=settings.rollup_1min_retention_days)).date()
+        quarter_settled = self._rollup_start(TrafficDataRollup.RESOLUTION_15MIN)
+        if quarter_settled is not None:
+            minute_cutoff_day = min(minute_cutoff_day, quarter_settled.date())
+            deleted['1min'] = TrafficDataRollup.objects.filter(
+                resolution=TrafficDataRollup.RESOLUTION_1MIN, partition_day__lt=minute_cutoff_day
+            ).delete()[0]
+
+        retention_cutoff = now - datetime.timedelta(days=settings.log_retention_days)
+        deleted['15min'] = TrafficDataRollup.objects.filter(
+            resolution=TrafficDataRollup.RESOLUTION_15MIN, partition_day__lt=retention_cutoff.date()
+        ).delete()[0]
+        deleted['logs'] = TrafficLog.objects.filter(timestamp__lt=retention_cutoff).delete()[0]
+        deleted['congestion_events'] = CongestionEvent.objects.filter(timestamp__lt=retention_cutoff).delete()[0]
+        deleted['timing_logs'] = SignalTimingLog.objects.filter(timestamp__lt=retention_cutoff).delete()[0]
+        return deleted
+
+    def run_maintenance(self, now=None):
+        """One pass of flush, downsampling and retention"""
+        self.flush()
+        minutes = self.rollup_raw_to_minutes(now)
+        quarters = self.rollup_minutes_to_quarter_hours(now)
+        deleted = self.purge_expired(now)
+        if minutes or quarters or any(deleted.values()):
+            print(f"TimeSeriesStore: Rolled up {minutes} minute and {quarters} quarter-hour buckets. Purged: {deleted}")
+
+    def _maintenance_loop(self):
+        while not self.stop_event.wait(self.maintenance_interval):
+            try:
+                refresh_worker_connection()
+                self.run_maintenance()
+            except OperationalError as e:
+                print(f"TimeSeriesStore: Maintenance skipped, database busy: {e}")
+            except Exception as e:
+                print(f"TimeSeriesStore: Error during maintenance: {type(e).__name__} - {e}")
+        release_worker_connection()
+
+    def start(self):
+        """Start the background downsampling/retention thread"""
+        if not self.running:
+            self.running = True
+            self.stop_event.clear()
+            self.maintenance_thread = threading.Thread(target=self._maintenance_loop, daemon=True)
+            self.maintenance_thread.start()
+            print("TimeSeriesStore: Maintenance thread started")
+
+    def stop(self):
+        """Stop the maintenance thread and write out anything still buffered"""
+        self.running = False
+        self.stop_event.set()
+        if self.maintenance_thread:
+            self.maintenance_thread.join(timeout=5.0)
+        self.flush()
+        print("TimeSeriesStore: Stopped")
+
+
+# Global instance shared by the detection worker
+timeseries_store = None
+
+def get_timeseries_store():
+    """Get or create the global time-series store instance"""
+    global timeseries_store
+    if timeseries_store is None:
+        timeseries_store = TrafficTimeSeriesStore()
+    return timeseries_store
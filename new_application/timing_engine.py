@@ -0,0 +1,150 @@
+import threading
+from datetime import datetime
+import numpy as np
+
+from .zones import queue_spillback
+
+# Same shape as EnhancedTrafficSignal.calculate_adaptive_green_time
+DENSITY_SECONDS_PER_WEIGHT = 3.0
+PEAK_FACTOR = 1.2
+NIGHT_FACTOR = 0.8
+TREND_RATIO = 1.5
+TREND_FACTOR = 1.3
+MIN_TREND_SAMPLES = 3
+
+
+def time_of_day_factor(time_of_day):
+    """Peak/off-peak multiplier used by the adaptive green time"""
+    if not time_of_day:
+        return 1.0
+    hour = time_of_day.hour if isinstance(time_of_day, datetime) else datetime.now().hour
+    if 7 <= hour <= 9 or 17 <= hour <= 19:  # Peak hours
+        return PEAK_FACTOR
+    if 22 <= hour or hour <= 6:  # Late night
+        return NIGHT_FACTOR
+    return 1.0
+
+
+class NetworkTimingEngine:
+    """Adaptive green times for every approach in the network, computed in one NumPy pass.
+
+    Each approach (keyed by signal_id) gets a row in flat arrays holding its timing
+    limits and a ring buffer of the traffic weights it was last timed with. The
+    history persists across calls, so the trend boost of the per-signal
+    EnhancedTrafficSignal logic actually applies.
+    """
+
+    def __init__(self, history_length=10, capacity=16):
+        self.history_length = history_length
+        self.index = {}  # signal_id -> row
+        self.lock = threading.Lock()
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """Create (or grow) the per-approach arrays, keeping existing rows"""
+        size = len(self.index)
+        arrays = {
+            'min_green': np.full(capacity, 10.0),
+            'max_green': np.full(capacity, 45.0),
+            'default_green': np.full(capacity, 15.0),
+            'history': np.zeros((capacity, self.history_length)),
+            'history_count': np.zeros(capacity, dtype=np.int64),
+            'history_pos': np.zeros(capacity, dtype=np.int64),
+        }
+        for name, array in arrays.items():
+            if size:
+                array[:size] = getattr(self, name)[:size]
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def _rows(self, signals):
+        """Row of every signal, registering new approaches and refreshing timing limits"""
+        rows = np.empty(len(signals), dtype=np.int64)
+        for i, signal in enumerate(signals):
+            row = self.index.get(signal.signal_id)
+            if row is None:
+                if len(self.index) == self.capacity:
+                    self._allocate(self.capacity * 2)
+                row = self.index[signal.signal_id] = len(self.index)
+            rows[i] = row
+        self.min_green[rows] = [s.min_green_time for s in signals]
+        self.max_green[rows] = [s.max_green_time for s in signals]
+        self.default_green[rows] = [s.default_green_time for s in signals]
+        return rows
+
+    def compute(self, signals, time_of_day=None, record=True, trend_baselines=None):
+        """Green time (seconds) for each signal, from its current vehicle_count/traffic_weight.
+
+        With record=True each timed approach adds its weight to its history, as
+        happens once per phase when a signal is about to turn green. Use
+        record=False to preview timings without affecting the trend.
+        `trend_baselines` optionally gives a per-signal reference weight (NaN for
+        none) that replaces the per-phase history in the trend check.
+        """
+        signals = list(signals)
+        if not signals:
+            return np.zeros(0, dtype=np.int64)
+
+        with self.lock:
+            rows = self._rows(signals)
+            counts = np.array([s.vehicle_count for s in signals], dtype=float)
+            weights = np.array([s.traffic_weight for s in signals], dtype=float)
+            min_green = self.min_green[rows]
+            max_green = self.max_green[rows]
+
+            density_time = np.minimum(weights * DENSITY_SECONDS_PER_WEIGHT, max_green - min_green)
+
+            factor = np.full(len(rows), time_of_day_factor(time_of_day))
+            history_count = self.history_count[rows]
+            history_mean = self.history[rows].sum(axis=1) / np.maximum(history_count, 1)
+            has_trend = history_count >= MIN_TREND_SAMPLES
+            if trend_baselines is not None:
+                baselines = np.asarray(trend_baselines, dtype=float)
+                known = ~np.isnan(baselines)
+                history_mean = np.where(known, baselines, history_mean)
+                has_trend |= known
+            trending = has_trend & (weights > history_mean * TREND_RATIO)
+            factor[trending] *= TREND_FACTOR
+
+            green = np.clip(np.floor(min_green + density_time * factor), min_green, max_green)
+
+            # A queue reaching back into a queue-tail zone gets the longest green allowed
+            spillback = np.array([queue_spillback(getattr(s, 'zone_counts', None)) for s in signals], dtype=bool)
+            green[spillback] = max_green[spillback]
+
+            # No traffic: default green, and the empty reading is not part of the trend
+            idle = (counts == 0) | (weights == 0)
+            green[idle] = self.default_green[rows[idle]]
+
+            if record:
+                active_rows = rows[~idle]
+                positions = self.history_pos[active_rows]
+                self.history[active_rows, positions] = weights[~idle]
+                self.history_pos[active_rows] = (positions + 1) % self.history_length
+                self.history_count[active_rows] = np.minimum(self.history_count[active_rows] + 1, self.history_length)
+
+            return green.astype(np.int64)
+
+    def green_time(self, signal, time_of_day=None, record=True, trend_baseline=None):
+        """Green time for a single signal"""
+        baselines = None if trend_baseline is None else [trend_baseline]
+        return int(self.compute([signal], time_of_day, record, baselines)[0])
+
+    def plan(self, signals, time_of_day=None, trend_baselines=None):
+        """Preview green times for a set of signals as {signal_id: seconds}"""
+        signals = list(signals)
+        green = self.compute(signals, time_of_day, record=False, trend_baselines=trend_baselines)
+        return dict(zip((s.signal_id for s in signals), green.tolist()))
+
+    def reset(self, signal_id=None):
+        """Forget traffic history for one approach, or for all of them"""
+        with self.lock:
+            if signal_id is None:
+                rows = slice(None)
+            elif signal_id in self.index:
+                rows = self.index[signal_id]
+            else:
+                return
+            self.history[rows] = 0.0
+            self.history_count[rows] = 0
+            self.history_pos[rows] = 0
@@ -2,6 +2,7 @@ import os
 import time
 import threading
 from datetime import datetime
+import redis
 
 
 # Configure Django environment
@@ -13,70 +14,210 @@ if __name__ == "__main__" :
 else:
     pass
 
-from .models import TrafficSignal, TrafficLog, SignalTimingLog, CongestionEvent, SystemSettings
-from .EnhancedTrafficSignal import EnhancedTrafficSignal
+from django.conf import settings
+from .db_utils import refresh_worker_connection, release_worker_connection
+from .state_cache import get_state_cache, SIGNAL_STATES
+from .state_publisher import StatePublisher, serialize_signal_state, SOURCE_CONTROL
+from .signal_store import DatabaseSignalStore
+from .timing_engine import NetworkTimingEngine
+from .controller_registry import ControllerRegistry
+from .forecasting import ArrivalForecaster, arrival_series, plan_cycle
+from .corridor import get_corridor_coordinator, align_cycle
+from .phase_selection import PhaseSelector
+from .preemption import PreemptionController, get_emergency_bus, IDLE
+from .kpi import KPIEngine
+from .latency import LatencyTracker
+from .event_log import get_event_log
+from .worker_runner import worker_name
+
+# Setup Redis connection (singleton) for publishing live state
+redis_client = redis.StrictRedis(
+    host=getattr(settings, 'REDIS_HOST', 'localhost'),
+    port=getattr(settings, 'REDIS_PORT', 6379),
+    db=getattr(settings, 'REDIS_DB', 0),
+    decode_responses=False
+)
+
+# Fields owned by the control thread; saving only these keeps it from overwriting
+# the detection fields the detection thread writes concurrently
+STATE_FIELDS = ['current_state', 'remaining_time', 'last_update_time']
 
 class TrafficControlWorker:
     """Background worker for traffic signal control and state transitions"""
     
-    def __init__(self):
+    def __init__(self, store=None, clock=None, live_outputs=True, signal_ids=None):
         self.running = False
         self.control_thread = None
+        # Signals cycled by this worker; a worker per junction runs one phase ring each
+        self.signal_ids = sorted(signal_ids) if signal_ids is not None else list(range(4))
+        self.name = worker_name('control', signal_ids)
+
+        # Where signal state lives and what time it is. The live worker uses the database
+        # and wall-clock time; the simulator passes an in-memory store and a virtual clock.
+        self.store = store or DatabaseSignalStore(
+            event_log=get_event_log(self.name), signal_ids=signal_ids
+        )
+        self.clock = clock or time.time
+        # Per-tick status line; off in simulation
+        self.verbose = True
         
-        # Global state for emergency mode
+        # Global state for emergency mode; while active, emergency detections preempt the cycle
         self.emergency_mode_active = False
-        self.interrupted_signal_idx = None
-        self.interrupted_signal_remaining = None
-        self._emergency_force_red = False
+        self.preemption = PreemptionController(STATE_FIELDS, clock=self.clock)
+        self.emergency_bus = get_emergency_bus() if live_outputs else None
         
         # Current system state
-        self.current_system_signal = 0
-        self.last_system_update_time = time.time()
+        self.current_system_signal = self.signal_ids[0]
+        self.last_system_update_time = self.clock()
+
+        # Set whenever a signal event is logged; readers of cached signal state are
+        # invalidated once per tick rather than once per write
+        self.state_changed = False
+        self.state_cache = get_state_cache() if live_outputs else None
+
+        # Live state is pushed to the dashboard: a snapshot on every phase change and
+        # at least once per snapshot_interval for the remaining_time countdown
+        self.publisher = StatePublisher(worker_name(SOURCE_CONTROL, signal_ids), redis_client) if live_outputs else None
+        self.snapshot_interval = 1.0
+        self.last_snapshot_time = 0.0
+        self.latest_signals = {}
+
+        # Adaptive green times for all approaches; keeps each approach's traffic history
+        # between phases so trend-aware timing works
+        self.timing_engine = NetworkTimingEngine()
+        # Rolling per-signal traffic history (EWMA, percentiles, arrival rate) from detection results
+        self.controllers = ControllerRegistry()
+        self.history_warmup_seconds = 600
+        # Arrival forecasts per approach; once trained, green times are planned for the whole cycle
+        self.forecaster = ArrivalForecaster()
+        self.saturation_flow = 0.5  # vehicles/second an approach discharges on green
+        # Green-wave plan (common cycle length and offset) shared with neighbouring junctions
+        self.corridor = get_corridor_coordinator() if live_outputs else None
+        if self.corridor is not None:
+            self.corridor.rate_provider = self.forecast_arrival_rates
+        # Which approach goes next: skips empty approaches, orders by pressure, enforces max red
+        self.phase_selector = PhaseSelector()
+        self.next_signal_idx = None
+        # Delay, green utilization, cycle length etc. from phase changes and detection counts
+        self.kpis = KPIEngine()
+        # Capture-to-decision latency of the detection results read each tick
+        self.latency = LatencyTracker(self.name)
+        self.seen_frame_seqs = {}
         
         # Load system settings
-        self.settings, _ = SystemSettings.objects.get_or_create(id=1)
+        self.settings = self.store.load_settings()
         
         # Initialize signals
         self.initialize_signals()
+        self.warm_load_history()
     
     def initialize_signals(self):
         """Initialize all traffic signals in the database"""
         try:
-            for i in range(4):
-                signal, created = TrafficSignal.objects.get_or_create(
-                    signal_id=i,
-                    defaults={
-                        'current_state': 'RED',
-                        'min_green_time': 10,
-                        'max_green_time': 45,
-                        'default_green_time': 15,
-                        'yellow_time': 3,
-                        'all_red_time': 2,
-                        'vehicle_type_counts': {
-                            'auto': 0, 'bike': 0, 'bus': 0, 
-                            'car': 0, 'emergency_vehicles': 0, 'truck': 0
-                        }
-                    }
-                )
-                
-                if created:
-                    print(f"Created new signal {chr(65+i)}")
-            
+            self.store.initialize_signals(self.signal_ids)
             print("Traffic signals initialized")
             
         except Exception as e:
             print(f"Error initializing system: {type(e)} - {e}")
     
+    def warm_load_history(self):
+        """Seed the per-signal histories from recently recorded traffic data"""
+        try:
+            loaded = self.controllers.warm_load(self.store.recent_traffic(self.clock() - self.history_warmup_seconds))
+            if loaded:
+                print(f"Traffic history warm-loaded with {loaded} samples")
+                self.forecaster.fit(*arrival_series(self.controllers.histories, self.forecaster.step_seconds))
+        except Exception as e:
+            print(f"Error warm-loading traffic history: {e}")
+
+    def adaptive_green_time(self, signal):
+        """Green time for a signal about to turn green: forecast-based cycle plan, else adaptive timing"""
+        if not self.phase_selector.source_ok(signal):
+            # Detection counts from a stalled or flapping camera are not trusted: fixed timing
+            print(f"Signal {chr(65 + signal.signal_id)}: video source health {signal.source_health:.2f}, "
+                  f"using fixed green {signal.default_green_time}s")
+            return signal.default_green_time
+        baseline = self.controllers.trend_baselines([signal.signal_id])[0]
+        green_time = self.timing_engine.green_time(signal, datetime.fromtimestamp(self.clock()), trend_baseline=baseline)
+        signals = self.latest_signals or self.store.all()
+        cycle_plan = self.plan_cycle(signals, signal.signal_id)
+        return cycle_plan.get(signal.signal_id, green_time) if cycle_plan else green_time
+
+    def forecast_arrival_rates(self, horizon=60.0):
+        """Forecast arrival rate (vehicles/second) of every trained approach"""
+        # Runs on the corridor replan thread too, while the control loop adds histories
+        with self.controllers.lock:
+            known_ids = sorted(self.controllers.histories)
+        signal_ids = [signal_id for signal_id in known_ids if self.forecaster.ready([signal_id])]
+        return dict(zip(signal_ids, self.forecaster.forecast_rates(signal_ids, horizon).tolist()))
+
+    def coordination_plan(self, signals):
+        """The corridor plan for the junction these signals belong to, if it is coordinated"""
+        junction_ids = {getattr(s, 'junction_id', None) for s in signals}
+        if self.corridor is None or len(junction_ids) != 1:
+            return None
+        return self.corridor.plan_for(junction_ids.pop())
+
+    def plan_cycle(self, signals, first_signal_id):
+        """Green times for one full cycle starting at `first_signal_id`.
+
+        Uses current queues and forecast arrivals once the forecaster has been trained
+        for every approach. On a coordinated junction the cycle is then fitted to the
+        corridor cycle length and nudged towards its offset. Empty when neither applies.
+        """
+        signal_ids = sorted(signals)
+        if not signal_ids:
+            return {}
+        start = signal_ids.index(first_signal_id) if first_signal_id in signal_ids else 0
+        order = [signals[signal_id] for signal_id in signal_ids[start:] + signal_ids[:start]]
+        lost_time = [s.yellow_time + s.all_red_time for s in order]
+        coordination = self.coordination_plan(order)
+
+        if self.forecaster.ready(signal_ids):
+            # The horizon is the cycle the adaptive timing would run
+            horizon = sum(s.default_green_time for s in order) + sum(lost_time)
+            rates = self.forecaster.forecast_rates([s.signal_id for s in order], horizon)
+            green = plan_cycle(
+                [s.vehicle_count for s in order], rates,
+                [s.min_green_time for s in order], [s.max_green_time for s in order],
+                lost_time, self.saturation_flow
+            )[0]
+        elif coordination:
+            green = [coordination['splits'].get(s.signal_id, s.default_green_time) for s in order]
+        else:
+            return {}
+
+        if coordination:
+            # Only the cycle that starts with the coordinated phase is shifted towards the offset
+            aligned = order[0].signal_id == coordination['coordinated_signal']
+            active = signals.get(self.current_system_signal)
+            green_start = self.clock()
+            if active is not None and active.signal_id != order[0].signal_id:
+                green_start += max(active.remaining_time, 0.0)
+            green = align_cycle(
+                green, [s.min_green_time for s in order], [s.max_green_time for s in order], lost_time,
+                coordination['cycle_length'],
+                offset=coordination['offset'] if aligned else None,
+                start_time=green_start if aligned else None
+            )
+        return {s.signal_id: int(g) for s, g in zip(order, green)}
+
+    def choose_next_signal(self, all_signals):
+        """Signal to turn green after the active one; coordinated junctions keep their fixed order"""
+        skip = self.coordination_plan(all_signals.values()) is None
+        return self.phase_selector.select_next(all_signals, self.current_system_signal, self.clock(), skip=skip)
+
     def run_traffic_control_loop(self):
         """Main loop for handling signal transitions and adaptive timing"""
         print("Starting traffic control loop...")
         
-        # Initial setup for signal A
-        self.run_initial_detection_for_signal(0)
+        # Initial setup for the first controlled signal (A unless pinned)
+        self.run_initial_detection_for_signal(self.signal_ids[0])
         
         while self.running:
             try:
-                current_time = time.time()
+                refresh_worker_connection()
+                current_time = self.clock()
                 elapsed = current_time - self.last_system_update_time
                 self.last_system_update_time = current_time
                 
@@ -85,44 +226,108 @@ class TrafficControlWorker:
                     elapsed = 1.0
                     print(f"Warning: Large time gap detected ({elapsed:.1f}s)")
                 
-                # Handle signal transitions
-                self.handle_signal_transitions(elapsed)
+                self.tick(elapsed)
                 
-                # Sleep based on control interval setting
-                time.sleep(self.settings.control_interval)
+                # Sleep based on control interval setting; an emergency event cuts the wait short
+                self.preemption.wake.wait(self.settings.control_interval)
+                self.preemption.wake.clear()
                 
             except Exception as e:
                 print(f"Error in traffic control loop: {e}")
                 time.sleep(1.0)  # Wait longer on error
+
+        release_worker_connection()
+
+    def tick(self, elapsed):
+        """Advance the controller by `elapsed` seconds and publish any state change"""
+        # The tick's countdown, state changes and log rows are committed together
+        # instead of one commit per write
+        with self.store.atomic():
+            self.handle_signal_transitions(elapsed)
+
+        if self.publisher is None:
+            self.state_changed = False
+        elif self.state_changed:
+            self.state_changed = False
+            self.state_cache.invalidate(SIGNAL_STATES)
+            self.publish_state(reload=True)
+        elif self.clock() - self.last_snapshot_time >= self.snapshot_interval:
+            self.publish_state()
+        if self.publisher is not None:
+            self.latency.publish(redis_client)
+
+    def trace_detection_latency(self, signals):
+        """Record how long ago each newly seen detection result's frame was captured.
+
+        This hop crosses processes through the database, so it is measured on wall
+        time rather than the monotonic clock the detection worker's own hops use.
+        """
+        now = time.time()
+        for signal in signals:
+            seq = getattr(signal, 'last_frame_seq', None)
+            captured = getattr(signal, 'last_capture_time', None)
+            if not seq or captured is None or self.seen_frame_seqs.get(signal.signal_id) == seq:
+                continue
+            self.seen_frame_seqs[signal.signal_id] = seq
+            self.latency.record('capture_to_decision', now - captured.timestamp())
     
+    def get_system_overview(self, signals):
+        """System-wide figures published alongside the signal states"""
+        kpis = self.kpis.summary()
+        return {
+            'total_vehicles': sum(s.vehicle_count for s in signals),
+            'system_efficiency': kpis['system_efficiency'],
+            'cycle_time': kpis['cycle_time'],
+            'kpis': kpis,
+            'active_signal': self.current_system_signal,
+            'emergency_mode_active': self.emergency_mode_active,
+            'preemption': self.preemption.stats(),
+            # Cycle plan from the active signal on (adaptive preview until forecasts are trained)
+            'planned_green_times': self.plan_cycle({s.signal_id: s for s in signals}, self.current_system_signal) or
+                self.timing_engine.plan(
+                    signals, datetime.fromtimestamp(self.clock()),
+                    trend_baselines=self.controllers.trend_baselines([s.signal_id for s in signals])
+                )
+        }
+
+    def publish_state(self, reload=False):
+        """Publish a snapshot of all signals; reload re-reads rows changed outside this tick's objects"""
+        try:
+            if reload or not self.latest_signals:
+                self.latest_signals = self.store.all()
+            signals = [self.latest_signals[signal_id] for signal_id in sorted(self.latest_signals)]
+            self.publisher.publish_snapshot(
+                [serialize_signal_state(s) for s in signals],
+                self.get_system_overview(signals)
+            )
+            self.last_snapshot_time = self.clock()
+        except Exception as e:
+            print(f"Error publishing signal state: {e}")
+
+    def log_event(self, signal, event_type, details):
+        """Record a signal event and mark the live state as changed"""
+        self.store.log_event(signal, event_type, details)
+        self.state_changed = True
+        new_state = details.get('new_state') or details.get('to_state')
+        if new_state:
+            self.kpis.phase_change(signal.signal_id, new_state, self.clock())
+
     def run_initial_detection_for_signal(self, signal_idx):
         """Run initial detection for a signal and set it to GREEN"""
         try:
-            signal = TrafficSignal.objects.get(signal_id=signal_idx)
-            
-            # Create logic signal instance
-            logic_signal = EnhancedTrafficSignal(signal.signal_id)
-            logic_signal.min_green_time = signal.min_green_time
-            logic_signal.max_green_time = signal.max_green_time
-            logic_signal.yellow_time = signal.yellow_time
-            logic_signal.all_red_time = signal.all_red_time
-            logic_signal.default_green_time = signal.default_green_time
+            signal = self.store.get(signal_idx)
             
             # Calculate green time based on current vehicle data
-            green_time = logic_signal.calculate_adaptive_green_time(
-                signal.vehicle_count, 
-                signal.traffic_weight, 
-                datetime.now()
-            )
+            green_time = self.adaptive_green_time(signal)
             
             # Update signal state
             signal.current_state = 'GREEN'
             signal.remaining_time = green_time
             signal.calculated_green_time = green_time
-            signal.save()
+            self.store.save(signal, STATE_FIELDS + ['calculated_green_time'])
             
             # Log the state change
-            TrafficLog.objects.create(
+            self.log_event(
                 signal=signal,
                 event_type='STATE_CHANGE',
                 details={
@@ -134,7 +339,7 @@ class TrafficControlWorker:
             )
             
             # Log timing change
-            SignalTimingLog.objects.create(
+            self.store.log_timing(
                 signal=signal,
                 green_time=green_time,
                 yellow_time=signal.yellow_time,
@@ -150,27 +355,19 @@ class TrafficControlWorker:
     def run_detection_for_next_signal(self, signal_idx):
         """Run detection for next signal during yellow phase"""
         try:
-            signal = TrafficSignal.objects.get(signal_id=signal_idx)
+            signal = self.store.get(signal_idx)
             
-            # Create logic signal instance
-            logic_signal = EnhancedTrafficSignal(signal.signal_id)
-            logic_signal.min_green_time = signal.min_green_time
-            logic_signal.max_green_time = signal.max_green_time
-            logic_signal.yellow_time = signal.yellow_time
-            logic_signal.all_red_time = signal.all_red_time
-            logic_signal.default_green_time = signal.default_green_time
-            
-            # Calculate green time based on current vehicle data
-            green_time = logic_signal.calculate_adaptive_green_time(
-                signal.vehicle_count,
-                signal.traffic_weight,
-                datetime.now()
-            )
+            # Calculate green time based on current vehicle data; an approach served
+            # with nobody waiting (fairness limit) only gets its minimum green
+            if self.phase_selector.has_demand(signal):
+                green_time = self.adaptive_green_time(signal)
+            else:
+                green_time = signal.min_green_time
             
             # Set pending green time
             signal.pending_green_time = green_time
             signal.calculated_green_time = green_time
-            signal.save()
+            self.store.save(signal, ['pending_green_time', 'calculated_green_time', 'last_update_time'])
             
             print(f"[Detection during Yellow] Signal {chr(65+signal_idx)}: Green={green_time}s")
             
@@ -181,7 +378,13 @@ class TrafficControlWorker:
             """Handle signal state transitions"""
             try:
                 # Fetch all signals to determine the next one and ensure consistency
-                all_signals = {s.signal_id: s for s in TrafficSignal.objects.all()}
+                all_signals = self.store.all()
+                self.latest_signals = all_signals
+                self.controllers.observe(all_signals.values(), self.clock())
+                self.kpis.observe_counts(all_signals.values(), self.clock())
+                self.trace_detection_latency(all_signals.values())
+                if self.clock() - (self.forecaster.last_step_time or 0.0) >= self.forecaster.step_seconds:
+                    self.forecaster.observe(self.controllers.arrival_totals(), self.clock())
                 active_signal = all_signals.get(self.current_system_signal)
 
                 if not active_signal:
@@ -192,15 +395,20 @@ class TrafficControlWorker:
                 # Update remaining time for the active signal
                 if active_signal.remaining_time > 0:
                     active_signal.remaining_time = max(0, active_signal.remaining_time - elapsed)
-                    active_signal.save()
+                    self.store.save(active_signal, ['remaining_time'])
 
                 # DEBUG PRINT: Always show current state and time
-                print(f"Traffic Control: Signal {chr(65 + active_signal.signal_id)} is {active_signal.current_state}, Time Left: {active_signal.remaining_time:.1f}s")
+                if self.verbose:
+                    print(f"Traffic Control: Signal {chr(65 + active_signal.signal_id)} is {active_signal.current_state}, Time Left: {active_signal.remaining_time:.1f}s")
 
-                # Emergency mode logic (prioritized)
+                # Emergency preemption (prioritized); it owns the transitions while it runs
+                self.preemption.drain()
                 if self.emergency_mode_active:
-                    self.handle_emergency_mode(active_signal)
-                    return # Exit if emergency mode is active, it handles its own transitions
+                    self.preemption.observe_rows(all_signals)
+                    if self.preemption.step(self, all_signals):
+                        return
+                elif self.preemption.state != IDLE:
+                    self.preemption.reset()
 
                 # Normal state transitions
                 if active_signal.remaining_time <= 0:
@@ -208,23 +416,31 @@ class TrafficControlWorker:
                         # Transition active signal to YELLOW
                         active_signal.current_state = 'YELLOW'
                         active_signal.remaining_time = active_signal.yellow_time
-                        active_signal.save()
-                        TrafficLog.objects.create(
+                        self.store.save(active_signal, STATE_FIELDS)
+                        self.log_event(
                             signal=active_signal, event_type='STATE_CHANGE',
                             details={'old_state': 'GREEN', 'new_state': 'YELLOW'}
                         )
                         print(f"🟡 Signal {chr(65 + active_signal.signal_id)} → YELLOW for {active_signal.yellow_time:.1f}s")
 
-                        # Run detection for the NEXT signal while current is YELLOW
-                        next_signal_idx = (self.current_system_signal + 1) % 4
-                        self.run_detection_for_next_signal(next_signal_idx)
+                        # Pick the NEXT signal and run detection for it while current is YELLOW
+                        self.phase_selector.mark_green_end(active_signal.signal_id, self.clock())
+                        resume = self.preemption.resume
+                        self.preemption.resume = None
+                        if resume is not None and resume[0] in all_signals:
+                            # An emergency cut this approach's green short: give back what was left
+                            self.next_signal_idx = resume[0]
+                            self.resume_after_preemption(all_signals[resume[0]], resume[1])
+                        else:
+                            self.next_signal_idx = self.choose_next_signal(all_signals)
+                            self.run_detection_for_next_signal(self.next_signal_idx)
 
                     elif active_signal.current_state == 'YELLOW':
                         # Transition active signal to RED
                         active_signal.current_state = 'RED'
                         active_signal.remaining_time = active_signal.all_red_time # Use all_red_time here
-                        active_signal.save()
-                        TrafficLog.objects.create(
+                        self.store.save(active_signal, STATE_FIELDS)
+                        self.log_event(
                             signal=active_signal, event_type='STATE_CHANGE',
                             details={'old_state': 'YELLOW', 'new_state': 'RED'}
                         )
@@ -235,8 +451,8 @@ class TrafficControlWorker:
                             if s_id != active_signal.signal_id and s.current_state != 'RED':
                                 s.current_state = 'RED'
                                 s.remaining_time = 0 # Or a short all_red_time if they just turned red
-                                s.save()
-                                TrafficLog.objects.create(
+                                self.store.save(s, STATE_FIELDS)
+                                self.log_event(
                                     signal=s, event_type='STATE_CHANGE',
                                     details={'old_state': s.current_state, 'new_state': 'RED', 'reason': 'all_red_sync'}
                                 )
@@ -247,8 +463,11 @@ class TrafficControlWorker:
                         # This is the point where the signal has completed its RED phase (or was already RED)
                         # and it's time to advance the cycle to the next signal.
 
-                        # Find the next signal in the cycle
-                        next_signal_idx = (self.current_system_signal + 1) % 4
+                        # The next signal was chosen when the active one turned YELLOW
+                        next_signal_idx = self.next_signal_idx
+                        if next_signal_idx not in all_signals:
+                            next_signal_idx = self.choose_next_signal(all_signals)
+                        self.next_signal_idx = None
                         next_signal = all_signals.get(next_signal_idx)
                         
                         if not next_signal: # Defensive check
@@ -261,13 +480,13 @@ class TrafficControlWorker:
                         next_signal.current_state = 'GREEN'
                         next_signal.remaining_time = green_time_for_next
                         next_signal.pending_green_time = 0 # Reset pending time
-                        next_signal.save()
+                        self.store.save(next_signal, STATE_FIELDS + ['pending_green_time'])
 
-                        TrafficLog.objects.create(
+                        self.log_event(
                             signal=next_signal, event_type='STATE_CHANGE',
                             details={'old_state': 'RED', 'new_state': 'GREEN', 'reason': 'cycle_advance', 'green_time': green_time_for_next}
                         )
-                        SignalTimingLog.objects.create(
+                        self.store.log_timing(
                             signal=next_signal,
                             green_time=green_time_for_next,
                             yellow_time=next_signal.yellow_time,
@@ -284,156 +503,12 @@ class TrafficControlWorker:
                 import traceback
                 traceback.print_exc()
     
-    def handle_emergency_mode(self, active_signal):
-        """Handle emergency mode logic"""
-        try:
-            emergency_detected = False
-            emergency_signal_idx = None
-            
-            # Check all signals for emergency vehicles
-            for i in range(4):
-                signal = TrafficSignal.objects.get(signal_id=i)
-                if signal.has_emergency_vehicle:
-                    emergency_detected = True
-                    emergency_signal_idx = i
-                    break
-            
-            if emergency_detected:
-                # Emergency in a different signal
-                if active_signal.current_state == 'GREEN' and self.current_system_signal != emergency_signal_idx:
-                    if self.interrupted_signal_idx is None and active_signal.remaining_time > 8.0:
-                        self.interrupted_signal_idx = self.current_system_signal
-                        self.interrupted_signal_remaining = active_signal.remaining_time
-                    else:
-                        self.interrupted_signal_idx = None
-                        self.interrupted_signal_remaining = None
-                    
-                    active_signal.current_state = 'YELLOW'
-                    active_signal.remaining_time = 3.0
-                    active_signal.save()
-                    self._emergency_force_red = True
-                    
-                    # Log emergency override
-                    TrafficLog.objects.create(
-                        signal=active_signal,
-                        event_type='EMERGENCY_OVERRIDE',
-                        details={
-                            'from_signal': chr(65+self.current_system_signal),
-                            'to_state': 'YELLOW',
-                            'reason': 'emergency_elsewhere'
-                        }
-                    )
-                    
-                    print(f"🚑 Emergency vehicle at Signal {chr(65+emergency_signal_idx)} - Forcing Signal {chr(65+self.current_system_signal)} to YELLOW for 3s")
-                    return
-                
-                elif active_signal.current_state == 'YELLOW' and self.current_system_signal != emergency_signal_idx:
-                    if self._emergency_force_red and active_signal.remaining_time <= 0:
-                        active_signal.current_state = 'RED'
-                        active_signal.remaining_time = 0
-                        active_signal.save()
-                        
-                        # Log emergency override
-                        TrafficLog.objects.create(
-                            signal=active_signal,
-                            event_type='EMERGENCY_OVERRIDE',
-                            details={
-                                'from_signal': chr(65+self.current_system_signal),
-                                'to_state': 'RED',
-                                'reason': 'emergency_yellow_to_red'
-                            }
-                        )
-                        
-                        # Switch to emergency signal
-                        self.current_system_signal = emergency_signal_idx
-                        emergency_signal = TrafficSignal.objects.get(signal_id=emergency_signal_idx)
-                        
-                        # Create logic signal for emergency
-                        logic_signal = EnhancedTrafficSignal(emergency_signal.signal_id)
-                        logic_signal.min_green_time = emergency_signal.min_green_time
-                        logic_signal.max_green_time = emergency_signal.max_green_time
-                        logic_signal.yellow_time = emergency_signal.yellow_time
-                        logic_signal.all_red_time = emergency_signal.all_red_time
-                        logic_signal.default_green_time = emergency_signal.default_green_time
-                        
-                        # Calculate extended green time for emergency
-                        emergency_count = emergency_signal.vehicle_type_counts.get('emergency_vehicles', 0)
-                        extended_time = min(emergency_count * 2 + 10, emergency_signal.max_green_time)
-                        
-                        emergency_signal.current_state = 'GREEN'
-                        emergency_signal.remaining_time = extended_time
-                        emergency_signal.save()
-                        
-                        # Log emergency activation
-                        TrafficLog.objects.create(
-                            signal=emergency_signal,
-                            event_type='STATE_CHANGE',
-                            details={
-                                'old_state': 'RED',
-                                'new_state': 'GREEN',
-                                'reason': 'emergency_force_green',
-                                'green_time': extended_time
-                            }
-                        )
-                        
-                        print(f"Signal {chr(65+emergency_signal_idx)}: Forced GREEN due to emergency. Remaining time: {extended_time:.1f}s")
-                        self._emergency_force_red = False
-                        return
-                
-                elif active_signal.current_state == 'GREEN' and self.current_system_signal == emergency_signal_idx:
-                    # Extend green time for emergency vehicle
-                    emergency_count = active_signal.vehicle_type_counts.get('emergency_vehicles', 0)
-                    if emergency_count > 0:
-                        extended_time = min(emergency_count * 2 + 10, active_signal.max_green_time)
-                        active_signal.remaining_time = max(active_signal.remaining_time, extended_time)
-                        active_signal.save()
-                        
-                        # Log emergency extension
-                        TrafficLog.objects.create(
-                            signal=active_signal,
-                            event_type='EMERGENCY_EXTEND',
-                            details={
-                                'signal_id': active_signal.signal_id,
-                                'extended_time': extended_time
-                            }
-                        )
-                        
-                        print(f"🚑 Emergency vehicle at current Signal {chr(65+self.current_system_signal)} - Extended green time to {active_signal.remaining_time:.1f}s")
-                        return
-            
-            # Resume interrupted signal if no emergency detected
-            if self.interrupted_signal_idx is not None:
-                if active_signal.current_state in ['YELLOW', 'RED'] and self.current_system_signal == emergency_signal_idx:
-                    resume_idx = self.interrupted_signal_idx
-                    resume_time = self.interrupted_signal_remaining
-                    
-                    self.interrupted_signal_idx = None
-                    self.interrupted_signal_remaining = None
-                    
-                    if resume_time is not None and resume_time > 8.0:
-                        resume_signal = TrafficSignal.objects.get(signal_id=resume_idx)
-                        resume_signal.current_state = 'GREEN'
-                        resume_signal.remaining_time = resume_time
-                        resume_signal.save()
-                        self.current_system_signal = resume_idx
-                        
-                        # Log resume
-                        TrafficLog.objects.create(
-                            signal=resume_signal,
-                            event_type='STATE_CHANGE',
-                            details={
-                                'old_state': 'RED',
-                                'new_state': 'GREEN',
-                                'reason': 'resume_after_emergency',
-                                'green_time': resume_time
-                            }
-                        )
-                        
-                        print(f"Resuming from interrupted Signal {chr(65+resume_idx)} after emergency (with {resume_time:.1f}s left).")
-                        return
-                        
-        except Exception as e:
-            print(f"Error in emergency mode handling: {e}")
+    def resume_after_preemption(self, signal, remaining):
+        """Queue the rest of a green that emergency preemption interrupted"""
+        signal.pending_green_time = int(round(remaining))
+        signal.calculated_green_time = signal.pending_green_time
+        self.store.save(signal, ['pending_green_time', 'calculated_green_time', 'last_update_time'])
+        print(f"Resuming Signal {chr(65 + signal.signal_id)} after emergency (with {remaining:.1f}s left).")
     
     def start(self):
         """Start the traffic control worker"""
@@ -441,15 +516,29 @@ class TrafficControlWorker:
             self.running = True
             self.control_thread = threading.Thread(target=self.run_traffic_control_loop, daemon=True)
             self.control_thread.start()
+            if self.emergency_bus is not None:
+                self.emergency_bus.subscribe(self.preemption.submit)
+            if self.corridor is not None:
+                self.corridor.start()
             print("Traffic control worker started")
     
+    def supervised_threads(self):
+        """Thread attributes and their targets, for restarting threads that died"""
+        return {'control_thread': self.run_traffic_control_loop}
+
     def stop(self):
         """Stop the traffic control worker"""
         self.running = False
+        self.preemption.wake.set()
+        if self.emergency_bus is not None:
+            self.emergency_bus.unsubscribe(self.preemption.submit)
         
         # Wait for thread to finish
         if self.control_thread:
             self.control_thread.join(timeout=5.0)
+        if self.corridor is not None:
+            self.corridor.stop()
+        self.store.close()
         
         print("Traffic control worker stopped")
     
@@ -491,6 +580,7 @@ def stop_traffic_control_worker():
         traffic_control_worker = None
 
 def main():
+    """Run the worker standalone; `manage.py run_control` adds supervision and junction pinning"""
     worker = TrafficControlWorker()
     worker.start()
     try:
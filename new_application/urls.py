@@ -8,10 +8,15 @@ urlpatterns = [
     path('video_feed/<int:signal_id>/', views.video_feed, name='video_feed'),
     path('api/emergency/', views.update_emergency_mode, name='update_emergency_mode'),
     path('api/upload_video/', views.upload_video, name = 'upload_video'),
+    path('api/upload_video/<str:job_id>/', views.upload_video_status, name='upload_video_status'),
+    path('api/latency/', views.get_latency, name='get_latency'),
     path('', views.dashboard_view, name='dashboard'),
     path('api/save_area/', views.save_area, name='save_area'),
     path('api/get_video_sources/', views.get_video, name='get_video'),
     path('api/get_area/', views.get_area, name="get_area"),
+    path('api/save_zones/', views.save_zones, name='save_zones'),
+    path('api/save_calibration/', views.save_calibration, name='save_calibration'),
+    path('api/get_zones/', views.get_zones, name='get_zones'),
     path('api/add_junction/', views.add_junction, name = "add_junction"),
     path('api/analytics/', views.get_dashboard_analytics_data, name='dashboard_analytics_api'),
     path('api/start_workers_api/', views.start_workers_api, name='start_workers_api'),
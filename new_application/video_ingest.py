@@ -0,0 +1,313 @@
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import hashlib
+import threading
+import subprocess
+from collections import OrderedDict
+import cv2
+import redis
+from redis.retry import Retry
+from redis.backoff import NoBackoff
+from django.conf import settings
+
+from .db_utils import refresh_worker_connection, run_with_db_retry
+from .state_cache import get_state_cache, publish_reload, VIDEO_SOURCES, SOURCE_CHANGED
+
+# Job states
+QUEUED = 'queued'
+PROBING = 'probing'
+TRANSCODING = 'transcoding'
+READY = 'ready'
+FAILED = 'failed'
+
+# Job status shared through Redis, so a status poll may land on any web process
+JOB_KEY = 'video_ingest_job:{job_id}'
+JOB_TTL = 24 * 3600
+
+# FourCCs OpenCV decodes cheaply everywhere; anything else is transcoded
+DECODE_FRIENDLY_CODECS = {'avc1', 'h264', 'x264', 'mp4v', 'mjpg'}
+
+
+class VideoIngestError(Exception):
+    """An uploaded file that is not a usable video"""
+
+
+def upload_dir():
+    path = os.path.join(settings.MEDIA_ROOT, 'uploaded_videos')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def stream_to_disk(uploaded_file, path):
+    """Write an upload to `path` chunk by chunk; returns (size, sha256).
+
+    The data goes to `path`.part first and is renamed into place when complete, so
+    a partial upload is never mistaken for a finished file.
+    """
+    part_path = path + '.part'
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(part_path, 'wb') as destination:
+            for chunk in uploaded_file.chunks():
+                destination.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return size, digest.hexdigest()
+
+
+def probe_video(path):
+    """Open a video and check that its first and last frames decode"""
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise VideoIngestError('File could not be opened as a video')
+        ok, frame = cap.read()
+        if not ok or frame is None:
+            raise VideoIngestError('First frame could not be decoded')
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        info = {
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or frame.shape[1],
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or frame.shape[0],
+            'fps': round(float(cap.get(cv2.CAP_PROP_FPS)), 2),
+            'frames': frames,
+            'codec': ''.join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip('\x00 ').lower(),
+        }
+        # A truncated upload usually still opens; its tail does not decode
+        if frames > 1:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frames - 1)
+            ok, frame = cap.read()
+            if not ok or frame is None:
+                raise VideoIngestError('Video is truncated: last frame could not be decoded')
+        return info
+    finally:
+        cap.release()
+
+
+def target_size(width, height, max_width, max_height):
+    """Size that fits within max_width x max_height keeping the aspect ratio, with even dimensions"""
+    scale = min(max_width / width, max_height / height, 1.0)
+    return max(int(width * scale) // 2 * 2, 2), max(int(height * scale) // 2 * 2, 2)
+
+
+def transcode_video(source, destination, width, height, fps):
+    """Re-encode to H.264 (ffmpeg) or MPEG-4 Part 2 (OpenCV fallback) at the given size"""
+    part_path = destination + '.part.mp4'
+    try:
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg:
+            subprocess.run([
+                ffmpeg, '-y', '-loglevel', 'error', '-i', source,
+                '-vf', f'scale={width}:{height}', '-c:v', 'libx264', '-preset', 'veryfast',
+                '-pix_fmt', 'yuv420p', '-an', part_path
+            ], check=True, timeout=3600)
+        else:
+            cap = cv2.VideoCapture(source)
+            writer = cv2.VideoWriter(part_path, cv2.VideoWriter_fourcc(*'mp4v'), fps or 25.0, (width, height))
+            try:
+                while True:
+                    ok, frame = cap.read()
+                    if not ok or frame is None:
+                        break
+                    if frame.shape[1] != width or frame.shape[0] != height:
+                        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                    writer.write(frame)
+            finally:
+                cap.release()
+                writer.release()
+        os.replace(part_path, destination)
+    except (subprocess.SubprocessError, OSError) as e:
+        raise VideoIngestError(f'Transcoding failed: {e}')
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+class VideoIngestPipeline:
+    """Probes, transcodes and activates uploaded videos on a background thread.
+
+    The upload view only streams the file to disk and submits a job; the detection
+    worker is told to reload its sources once the file is known to decode. The job
+    runs in the process that received the upload, and every state change is copied
+    to Redis (for `job_ttl` seconds) so the other web processes can report it.
+    """
+
+    def __init__(self, redis_client=None, max_width=1280, max_height=720, transcode=True, keep_jobs=200,
+                 job_ttl=JOB_TTL):
+        self.redis = redis_client
+        self.job_ttl = job_ttl
+        self.max_width = max_width
+        self.max_height = max_height
+        self.transcode = transcode
+        self.keep_jobs = keep_jobs
+        self.jobs = OrderedDict()  # job_id -> status dict
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.running = False
+        self.worker_thread = None
+
+    def submit(self, signal_id, path, size=0, sha256=None, expected_sha256=None):
+        """Queue a file that has been written to disk; returns the job status"""
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'signal_id': int(signal_id),
+            'state': QUEUED,
+            'source_path': path,
+            'video_path': None,
+            'size': size,
+            'sha256': sha256,
+            'probe': None,
+            'transcoded': False,
+            'error': None,
+            'created_at': time.time(),
+            'updated_at': time.time(),
+        }
+        with self.lock:
+            self.jobs[job['job_id']] = job
+            self._evict_finished()
+        self._store(job)
+        if expected_sha256 and sha256 and expected_sha256.lower() != sha256:
+            self._update(job, state=FAILED, error='Checksum mismatch: upload was corrupted in transit')
+            os.remove(path)
+            return dict(job)
+        self.queue.put(job['job_id'])
+        return dict(job)
+
+    def _evict_finished(self):
+        """Forget the oldest finished jobs beyond keep_jobs; queued and running jobs are always kept"""
+        excess = len(self.jobs) - self.keep_jobs
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self.jobs.items() if job['state'] in (READY, FAILED)]
+        for job_id in finished[:excess]:
+            del self.jobs[job_id]
+
+    def status(self, job_id):
+        """Job status from this process, or from Redis if another process runs the job"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job:
+                return dict(job)
+        if self.redis is None:
+            return None
+        try:
+            raw = self.redis.get(JOB_KEY.format(job_id=job_id))
+        except redis.exceptions.RedisError as e:
+            print(f"VideoIngest: Could not read job {job_id}: {e}")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    def _update(self, job, **fields):
+        with self.lock:
+            job.update(fields, updated_at=time.time())
+        self._store(job)
+
+    def _store(self, job):
+        if self.redis is None:
+            return
+        with self.lock:
+            data = json.dumps(job)
+        try:
+            self.redis.set(JOB_KEY.format(job_id=job['job_id']), data, ex=self.job_ttl)
+        except redis.exceptions.RedisError as e:
+            print(f"VideoIngest: Could not store job {job['job_id']}: {e}")
+
+    def process(self, job_id):
+        """Run one job to completion on the calling thread"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            print(f"VideoIngest: Job {job_id} is not known to this process")
+            return None
+        try:
+            self._update(job, state=PROBING)
+            info = probe_video(job['source_path'])
+            self._update(job, probe=info)
+
+            video_path = job['source_path']
+            width, height = target_size(info['width'], info['height'], self.max_width, self.max_height)
+            needs_transcode = (width, height) != (info['width'], info['height']) or \
+                info['codec'] not in DECODE_FRIENDLY_CODECS
+            if self.transcode and needs_transcode:
+                self._update(job, state=TRANSCODING)
+                video_path = os.path.splitext(job['source_path'])[0] + '_ingest.mp4'
+                transcode_video(job['source_path'], video_path, width, height, info['fps'])
+                info = probe_video(video_path)
+                os.remove(job['source_path'])
+                self._update(job, transcoded=True, probe=info)
+
+            self.activate(job['signal_id'], video_path, info)
+            self._update(job, state=READY, video_path=video_path)
+            print(f"VideoIngest: Signal {job['signal_id']} video ready at {video_path} "
+                  f"({info['width']}x{info['height']}, {info['codec']})")
+        except Exception as e:
+            self._update(job, state=FAILED, error=str(e))
+            print(f"VideoIngest: Job {job_id} for Signal {job['signal_id']} failed: {e}")
+        return self.status(job_id)
+
+    def activate(self, signal_id, video_path, info):
+        """Point the signal's VideoSource at the ingested file and tell the detection worker"""
+        from .models import TrafficSignal, VideoSource
+
+        def save():
+            signal = TrafficSignal.objects.get(signal_id=signal_id)
+            VideoSource.objects.update_or_create(signal=signal, defaults={
+                'video_path': video_path, 'is_active': True,
+                'width': info['width'], 'height': info['height'],
+            })
+
+        run_with_db_retry('video_ingest_activate', save)
+        get_state_cache().invalidate(VIDEO_SOURCES)
+        if self.redis is not None:
+            publish_reload(self.redis, SOURCE_CHANGED, signal_id)
+
+    def _run(self):
+        while self.running:
+            try:
+                job_id = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            refresh_worker_connection()
+            self.process(job_id)
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+            self.worker_thread = threading.Thread(target=self._run, daemon=True)
+            self.worker_thread.start()
+        print("VideoIngest: Worker thread started")
+
+    def stop(self):
+        self.running = False
+        if self.worker_thread:
+            self.worker_thread.join(timeout=5.0)
+
+
+# Global instance per process
+video_ingest = None
+
+def get_video_ingest():
+    """Get or create the global video ingest pipeline"""
+    global video_ingest
+    if video_ingest is None:
+        video_ingest = VideoIngestPipeline(redis.StrictRedis(
+            host=getattr(settings, 'REDIS_HOST', 'localhost'),
+            port=getattr(settings, 'REDIS_PORT', 6379),
+            db=getattr(settings, 'REDIS_DB', 0),
+            socket_connect_timeout=0.5,
+            retry=Retry(NoBackoff(), 0)
+        ))
+        video_ingest.start()
+    return video_ingest
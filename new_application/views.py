@@ -1,17 +1,27 @@
 from django.shortcuts import render
 from django.http import StreamingHttpResponse, JsonResponse
+from django.urls import reverse
 from django.views.decorators.http import require_GET, require_POST
 from .detection_worker import get_detection_worker, start_detection_worker, stop_detection_worker
 import time
 import threading
-from .models import TrafficSignal, VideoSource, DetectionArea, JunctionSignals
+from .models import TrafficSignal, VideoSource, DetectionArea, DetectionZone, JunctionSignals
 from .traffic_control_worker import get_traffic_control_worker, start_traffic_control_worker, stop_traffic_control_worker # Keep if used by other views
 from django.views.decorators.csrf import csrf_exempt
 import redis
 from django.conf import settings
 import os
 import json
+import math
 from .utils import scale_points, calculate_area_size
+from .state_cache import get_state_cache, publish_reload, CONTROL_CHANNEL, SIGNAL_STATES, DETECTION_AREAS, DETECTION_ZONES, VIDEO_SOURCES, AREA_CHANGED
+from .state_publisher import LiveStateAssembler, serialize_signal_state
+from .video_ingest import get_video_ingest, stream_to_disk, upload_dir
+from .latency import LatencyTracker, unpack_frame, load_published
+from .wire_format import encoded_response, wants_compact, compact_analytics
+from .analytics_cursor import get_analytics_since, get_analytics_cursors
+from .zones import ZONE_TYPE_CHOICES, ZONE_LANE, MAX_ZONES
+from .calibration import compute_homography, lane_meters, DEFAULT_LANE_WIDTH
 from django.db import transaction
 from django.db.utils import OperationalError
 
@@ -24,8 +34,10 @@ redis_client_for_pubsub = redis.StrictRedis(
 )
 
 # Global dictionary to store the latest frame received from Redis for each signal
-# {signal_id: frame_bytes}
+# {signal_id: (FrameStamp or None, jpeg_bytes)}
 latest_frames_cache = {}
+# Capture-to-delivery latency of the frames sent to MJPEG clients
+frame_latency = LatencyTracker('web')
 # Global dictionary to store the latest signal states and system data from Redis
 latest_dashboard_data_cache = {
     'signals': [], # List of signal dictionaries
@@ -38,6 +50,9 @@ latest_dashboard_data_cache = {
     }
 }
 
+# Merges the snapshots/deltas published by the workers (with gap detection and resync)
+live_state = LiveStateAssembler(redis_client_for_pubsub)
+
 # Lock to protect access to the cache from multiple threads
 frame_cache_lock = threading.Lock()
 dashboard_data_cache_lock = threading.Lock()
@@ -67,6 +82,7 @@ def _listen_for_all_redis_updates():
     # Subscribe to specific frame channels using integer signal IDs (0, 1, 2, 3)
     pubsub_instance.subscribe('frame_channel_0', 'frame_channel_1', 'frame_channel_2', 'frame_channel_3')
     pubsub_instance.subscribe('dashboard_updates') # For signal/system data
+    pubsub_instance.subscribe(CONTROL_CHANNEL) # For cache invalidations
 
     print("Django Views: Subscribed to specific frame channels and 'dashboard_updates'.")
 
@@ -82,7 +98,7 @@ def _listen_for_all_redis_updates():
                         # Extract signal_id (e.g., 'frame_channel_0' -> 0)
                         signal_id_int = int(channel_name.split('_')[-1])
                         with frame_cache_lock:
-                            latest_frames_cache[signal_id_int] = data_bytes
+                            latest_frames_cache[signal_id_int] = unpack_frame(data_bytes)
                     except (ValueError, IndexError, UnicodeDecodeError) as e:
                         print(f"Django Views ERROR: Failed to parse frame channel or data: {e}, Message: {message}")
                     except Exception as e:
@@ -92,16 +108,22 @@ def _listen_for_all_redis_updates():
                     try:
                         data = json.loads(data_bytes.decode('utf-8'))
                         with dashboard_data_cache_lock:
-                            # Update based on the type of dashboard update
-                            if data.get('type') == 'signal_update':
-                                latest_dashboard_data_cache['signals'] = data.get('signals', [])
-                            elif data.get('type') == 'system_overview':
-                                latest_dashboard_data_cache['system_overview'] = data.get('system_overview', {}) # Get the nested dictionary
+                            # Snapshots, deltas and overviews are merged per signal and per source
+                            if live_state.apply(data):
+                                latest_dashboard_data_cache['signals'] = live_state.signals_list()
+                                if live_state.system_overview:
+                                    latest_dashboard_data_cache['system_overview'] = dict(live_state.system_overview)
                     except (json.JSONDecodeError, UnicodeDecodeError) as e:
                         print(f"Django Views ERROR: Failed to decode or parse JSON from dashboard update message: {e}, Message: {message}")
                     except Exception as e:
                         print(f"Django Views ERROR: Unexpected error in Redis dashboard listener: {e}")
 
+                elif channel_name == CONTROL_CHANNEL:
+                    try:
+                        get_state_cache().handle_control_message(data_bytes.decode('utf-8'))
+                    except UnicodeDecodeError as e:
+                        print(f"Django Views ERROR: Failed to decode control message: {e}")
+
             elif message['type'] == 'subscribe':
                 print(f"Django Views: Redis {message['type']} confirmation for channel {message['channel'].decode('utf-8')}")
 
@@ -125,13 +147,20 @@ def video_feed(request, signal_id):
         return JsonResponse({"error": "Invalid signal ID"}, status=400)
 
     def generate_frames_from_cache():
+        last_seq = None
         while True:
             with frame_cache_lock:
-                frame_bytes = latest_frames_cache.get(signal_id)
+                stamp, frame_bytes = latest_frames_cache.get(signal_id, (None, None))
 
             if frame_bytes:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                headers = b'Content-Type: image/jpeg\r\n'
+                if stamp is not None:
+                    # Lets clients match the picture to detection results and measure its age
+                    headers += f'X-Frame-Seq: {stamp.seq}\r\nX-Capture-Time: {stamp.wall:.3f}\r\n'.encode()
+                    if stamp.seq != last_seq:
+                        last_seq = stamp.seq
+                        frame_latency.since_capture('capture_to_delivery', stamp)
+                yield (b'--frame\r\n' + headers + b'\r\n' + frame_bytes + b'\r\n')
             else:
                 pass 
             time.sleep(0.05)
@@ -151,22 +180,13 @@ def get_signal_states(request):
         # If cache is populated, return cached data
         return JsonResponse({'signals': cached_signals_data})
     else:
-        # Fallback to database if cache is empty (e.g., initial load or Redis issue)
-        signals = TrafficSignal.objects.all().order_by('signal_id')
-        data = [
-            {
-                'signal_id': s.signal_id,
-                'current_state': s.current_state,
-                'remaining_time': s.remaining_time,
-                'vehicle_count': s.vehicle_count,
-                'traffic_weight': s.traffic_weight,
-                'congestion_level': s.congestion_level,
-                'vehicle_type_counts': s.vehicle_type_counts,
-            }
-            for s in signals
-        ]
+        # Fallback to the read-through cache (and the database behind it) if nothing was pushed
+        data = get_state_cache().get(SIGNAL_STATES, _load_signal_states)
         return JsonResponse({'signals': data})
 
+def _load_signal_states():
+    return [serialize_signal_state(s) for s in TrafficSignal.objects.all().order_by('signal_id')]
+
 @csrf_exempt
 @require_GET
 def update_emergency_mode(request):
@@ -183,6 +203,7 @@ def dashboard_view(request):
 @csrf_exempt
 @require_POST
 def upload_video(request):
+    """Stream an uploaded video to disk and queue it for probing/transcoding; returns a job id"""
     if 'video_file' not in request.FILES:
         return JsonResponse({'error': 'No video_file provided'}, status=400)
     video_file = request.FILES['video_file']
@@ -198,43 +219,46 @@ def upload_video(request):
     except TrafficSignal.DoesNotExist:
         return JsonResponse({'error': f'TrafficSignal with ID {signal_id_int} does not exist'}, status=404)
 
-    # Define upload directory within MEDIA_ROOT
-    upload_dir = os.path.join(settings.MEDIA_ROOT, 'uploaded_videos')
-    os.makedirs(upload_dir, exist_ok=True) # Ensure directory exists
-
     # Create a unique filename (e.g., Signal0_timestamp.mp4)
     file_extension = os.path.splitext(video_file.name)[1]
-    unique_filename = f"Signal{signal_id_int}_{int(time.time())}{file_extension}"
-    file_path = os.path.join(upload_dir, unique_filename)
+    unique_filename = f"Signal{signal_obj.signal_id}_{int(time.time())}{file_extension}"
+    file_path = os.path.join(upload_dir(), unique_filename)
 
     try:
-        # Save the uploaded file to the server's file system
-        with open(file_path, 'wb+') as destination:
-            for chunk in video_file.chunks():
-                destination.write(chunk)
-
-        # Update the VideoSource model with the server-side path
-        VideoSource.objects.update_or_create(
-            signal=signal_obj, # Use the TrafficSignal object
-            defaults={
-                'video_path': file_path, # Store the server-side absolute path
-                'is_active': True # Assuming newly uploaded is active
-            }
+        size, sha256 = stream_to_disk(video_file, file_path)
+        # Probing, transcoding and activating the source happen in the background; the
+        # detection worker is told to reload once the file is known to decode
+        job = get_video_ingest().submit(
+            signal_obj.signal_id, file_path, size=size, sha256=sha256,
+            expected_sha256=request.POST.get('sha256')
         )
-        print(f"Uploaded video for Signal {signal_id_int} to {file_path}")
-        redis_client_for_pubsub.publish('control_channel_detection_worker', 'reload_config')
-
-        # Trigger detection worker to reload configuration
-        get_detection_worker().reload_config_from_db()
-
+        print(f"Uploaded video for Signal {signal_id_int} to {file_path} (job {job['job_id']})")
         return JsonResponse({
-            'message': f'File uploaded successfully for Signal {signal_id_int}',
-            'file_path': file_path # Return the server-side path for confirmation
-        })
+            'message': f'File uploaded for Signal {signal_id_int}; processing',
+            'job_id': job['job_id'],
+            'state': job['state'],
+            'error': job['error'],
+            'status_url': reverse('upload_video_status', args=[job['job_id']]),
+        }, status=400 if job['error'] else 202)
     except Exception as e:
         print(f"Error uploading video for Signal {signal_id_int}: {e}")
         return JsonResponse({'error': str(e)}, status=500)
 
+@require_GET
+def upload_video_status(request, job_id):
+    """State of a video ingest job: queued, probing, transcoding, ready or failed"""
+    job = get_video_ingest().status(job_id)
+    if job is None:
+        return JsonResponse({'error': f'Unknown job {job_id}'}, status=404)
+    return JsonResponse(job)
+
+@require_GET
+def get_latency(request):
+    """Per-hop latency histograms of the detection, control and web processes"""
+    latency = load_published(redis_client_for_pubsub)
+    latency['web'] = {'updated_at': time.time(), 'hops': frame_latency.stats()}
+    return JsonResponse(latency)
+
 @csrf_exempt
 @require_POST
 def save_area(request):
@@ -252,8 +276,8 @@ def save_area(request):
             return JsonResponse({'error': 'signal_id is required'}, status=400)
         if not area:
             return JsonResponse({'error': 'area is required'}, status=400)
-        if len(area) != 4:
-            return JsonResponse({'error': 'area must be a list of 4 points'}, status=400)
+        if len(area) < 3:
+            return JsonResponse({'error': 'area must be a polygon of at least 3 points'}, status=400)
         MAX_RETRIES = 5
         RETRY_DELAY_SECONDS = 0.1 # Start with a small delay
         for attempt in range(MAX_RETRIES):
@@ -273,6 +297,7 @@ def save_area(request):
                     detection_area = DetectionArea.objects.get(signal=signal)
                     detection_area.area_points = scaled_area
                     detection_area.area_size = calculate_area_size(scaled_area) # Ensure this is the correct field name
+                    detection_area.lane_meters = lane_meters(detection_area.homography, scaled_area, detection_area.lane_width)
 
                     detection_area.save() # The save operation is within the atomic block
 
@@ -287,9 +312,10 @@ def save_area(request):
                     RETRY_DELAY_SECONDS *= 1.5 # Exponential backoff
                 else:
                     raise e # Re-raise if not a lock error or max retries reached
-        # This sends a message to the detection worker to reload its configuration from the DB
-        redis_client_for_pubsub.publish('control_channel_detection_worker', 'reload_config')
-        print(f"Published 'reload_config' message for DetectionWorker after saving area for Signal {signal_id}.")
+        get_state_cache().invalidate(DETECTION_AREAS)
+        # Only this signal's area is reloaded; the other cameras keep running
+        publish_reload(redis_client_for_pubsub, AREA_CHANGED, int(signal_id))
+        print(f"Published '{AREA_CHANGED}' message for DetectionWorker after saving area for Signal {signal_id}.")
         return JsonResponse({'message': f'Area for signal {signal_id} saved successfully'})
     
     except json.JSONDecodeError:
@@ -304,30 +330,184 @@ def save_area(request):
         traceback.print_exc() # Print full traceback for debugging
         return JsonResponse({'error': f'An internal server error occurred while saving area: {e}'}, status=500)
 
+@csrf_exempt
+@require_POST
+def save_calibration(request):
+    """Store a camera's ground-plane homography from point pairs.
+
+    Expects `image_points` in canvas coordinates (like save_area) and the
+    matching `ground_points` in metres, at least 4 of each; `lane_width`
+    (metres) is optional. Posting `clear: true` removes the calibration.
+    """
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data in request body.'}, status=400)
+    signal_id = data.get('signal_id')
+    if isinstance(signal_id, str) and signal_id in ('A', 'B', 'C', 'D'):
+        signal_id = ord(signal_id) - 65
+    if signal_id is None:
+        return JsonResponse({'error': 'signal_id is required'}, status=400)
+    try:
+        lane_width = float(data.get('lane_width', DEFAULT_LANE_WIDTH))
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'lane_width must be a number of metres'}, status=400)
+    if lane_width <= 0:
+        return JsonResponse({'error': 'lane_width must be positive'}, status=400)
+
+    try:
+        with transaction.atomic():
+            signal = TrafficSignal.objects.get(signal_id=signal_id)
+            detection_area = DetectionArea.objects.select_for_update().get(signal=signal)
+            if data.get('clear'):
+                homography = None
+            else:
+                image_points = data.get('image_points') or []
+                ground_points = data.get('ground_points') or []
+                if len(image_points) < 4 or len(image_points) != len(ground_points):
+                    return JsonResponse({'error': 'image_points and ground_points must be matching lists of at least 4 points'}, status=400)
+                video_source = VideoSource.objects.get(signal=signal)
+                if video_source.width == 0 or video_source.height == 0:
+                    return JsonResponse({'error': f'Video dimensions for Signal {signal_id} are not yet available.'}, status=409)
+                homography = compute_homography(scale_points(image_points, video_source.width, video_source.height), ground_points)
+                if homography is None:
+                    return JsonResponse({'error': 'Points do not define a valid homography (are 3 of them collinear?)'}, status=400)
+            detection_area.homography = homography
+            detection_area.lane_width = lane_width
+            detection_area.lane_meters = lane_meters(homography, detection_area.area_points, lane_width) if homography else 0.0
+            detection_area.save(update_fields=['homography', 'lane_width', 'lane_meters'])
+    except TrafficSignal.DoesNotExist:
+        return JsonResponse({'error': f'Signal with ID {signal_id} not found.'}, status=404)
+    except DetectionArea.DoesNotExist:
+        return JsonResponse({'error': f'Signal {signal_id} has no detection area yet. Please save an area first.'}, status=404)
+    except VideoSource.DoesNotExist:
+        return JsonResponse({'error': f'Video source for Signal {signal_id} not found. Please upload a video first.'}, status=404)
+
+    publish_reload(redis_client_for_pubsub, AREA_CHANGED, int(signal_id))
+    print(f"Saved calibration for Signal {signal_id}: {detection_area.lane_meters} lane-metres in the detection area.")
+    return JsonResponse({
+        'message': f'Calibration for signal {signal_id} saved successfully',
+        'calibrated': homography is not None,
+        'lane_meters': detection_area.lane_meters,
+    })
+
+def is_point(point):
+    """True for an [x, y] pair of finite numbers"""
+    return (isinstance(point, (list, tuple)) and len(point) == 2 and
+            all(isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v) for v in point))
+
+def validate_zones(zones):
+    """Error message for an invalid list of zone definitions, None if it is valid"""
+    if not isinstance(zones, list):
+        return 'zones must be a list'
+    if len(zones) > MAX_ZONES:
+        return f'at most {MAX_ZONES} zones per signal'
+    zone_types = {choice for choice, _ in ZONE_TYPE_CHOICES}
+    names = set()
+    for zone in zones:
+        name = zone.get('name') if isinstance(zone, dict) else None
+        if not name or not isinstance(name, str):
+            return 'every zone needs a name'
+        if name in names:
+            return f"zone name '{name}' is used twice"
+        names.add(name)
+        if zone.get('type', ZONE_LANE) not in zone_types:
+            return f"zone '{name}' has an unknown type '{zone.get('type')}'"
+        points = zone.get('points')
+        if not isinstance(points, list) or len(points) < 3:
+            return f"zone '{name}' must be a polygon of at least 3 points"
+        for point in points:
+            if not is_point(point):
+                return f"zone '{name}' has an invalid point {point!r}: expected [x, y] numbers"
+    return None
+
+@csrf_exempt
+@require_POST
+def save_zones(request):
+    """Replace all detection zones of one signal; points are in canvas coordinates like save_area"""
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data in request body.'}, status=400)
+    signal_id = data.get('signal_id')
+    if isinstance(signal_id, str) and signal_id in ('A', 'B', 'C', 'D'):
+        signal_id = ord(signal_id) - 65
+    if signal_id is None:
+        return JsonResponse({'error': 'signal_id is required'}, status=400)
+    zones = data.get('zones')
+    error = validate_zones(zones)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+
+    try:
+        with transaction.atomic():
+            signal = TrafficSignal.objects.get(signal_id=signal_id)
+            video_source = VideoSource.objects.get(signal=signal)
+            if video_source.width == 0 or video_source.height == 0:
+                return JsonResponse({'error': f'Video dimensions for Signal {signal_id} are not yet available.'}, status=409)
+            DetectionZone.objects.filter(signal=signal).delete()
+            rows = []
+            for position, zone in enumerate(zones):
+                polygon = scale_points(zone['points'], video_source.width, video_source.height)
+                rows.append(DetectionZone(
+                    signal=signal, name=zone['name'], zone_type=zone.get('type', ZONE_LANE),
+                    polygon=polygon, area_size=calculate_area_size(polygon), position=position
+                ))
+            DetectionZone.objects.bulk_create(rows)
+            signal.zone_counts = {}
+            signal.save(update_fields=['zone_counts'])
+    except TrafficSignal.DoesNotExist:
+        return JsonResponse({'error': f'Signal with ID {signal_id} not found.'}, status=404)
+    except VideoSource.DoesNotExist:
+        return JsonResponse({'error': f'Video source for Signal {signal_id} not found. Please upload a video first.'}, status=404)
+
+    get_state_cache().invalidate(DETECTION_ZONES)
+    # The worker reloads the signal's area and zones together
+    publish_reload(redis_client_for_pubsub, AREA_CHANGED, int(signal_id))
+    print(f"Saved {len(zones)} detection zones for Signal {signal_id}.")
+    return JsonResponse({'message': f'{len(zones)} zones for signal {signal_id} saved successfully'})
+
+@require_GET
+def get_zones(request):
+    zones = get_state_cache().get(DETECTION_ZONES, _load_detection_zones)
+    return JsonResponse({'zones': zones})
+
+def _load_detection_zones():
+    zones = {letter: [] for letter in ['A', 'B', 'C', 'D']}
+    for zone in DetectionZone.objects.select_related('signal').filter(signal__signal_id__range=(0, 3)):
+        zones[chr(65 + zone.signal.signal_id)].append({
+            'name': zone.name, 'type': zone.zone_type, 'points': zone.polygon, 'area_size': zone.area_size
+        })
+    return zones
+
 @require_GET
 def get_video(request):
-    sources= {}
-    signal_letters = ['A', 'B', 'C', 'D'] # Assuming you have 4 signals
-    for i, letter in enumerate(signal_letters):
-        try:
-            signal = TrafficSignal.objects.get(signal_id=i)
-            video_source = VideoSource.objects.get(signal=signal)
-            abs_path = video_source.video_path
-            rel_path = abs_path.replace('\\', '/')
-            media_root = settings.MEDIA_ROOT.replace('\\', '/')
-            if rel_path.startswith(media_root):
-                rel_path = rel_path[len(media_root):]
-            if not rel_path.startswith('/'):
-                rel_path = '/' + rel_path
-            video_url = settings.MEDIA_URL.rstrip('/') + rel_path
-            sources[letter] = {'video_path': video_url}
-        except (TrafficSignal.DoesNotExist, VideoSource.DoesNotExist):
-            sources[letter] = {'video_path': ''}
+    sources = get_state_cache().get(VIDEO_SOURCES, _load_video_sources)
     return JsonResponse({'sources': sources})
 
+def _load_video_sources():
+    sources = {letter: {'video_path': ''} for letter in ['A', 'B', 'C', 'D']} # Assuming you have 4 signals
+    media_root = settings.MEDIA_ROOT.replace('\\', '/')
+    # One query for all signals instead of two .get() calls per signal
+    for video_source in VideoSource.objects.select_related('signal').filter(signal__signal_id__range=(0, 3)):
+        letter = chr(65 + video_source.signal.signal_id)
+        abs_path = video_source.video_path
+        rel_path = abs_path.replace('\\', '/')
+        if rel_path.startswith(media_root):
+            rel_path = rel_path[len(media_root):]
+        if not rel_path.startswith('/'):
+            rel_path = '/' + rel_path
+        video_url = settings.MEDIA_URL.rstrip('/') + rel_path
+        sources[letter] = {'video_path': video_url}
+    return sources
+
 # getting the loaded areas
 @require_GET
 def get_area(request):
+    areas = get_state_cache().get(DETECTION_AREAS, _load_detection_areas)
+    return JsonResponse({'area': areas})
+
+def _load_detection_areas():
     signal_letters = ['A', 'B', 'C', 'D']
     areas = {}
     for area in DetectionArea.objects.select_related('signal').all():
@@ -335,8 +515,7 @@ def get_area(request):
         if signal_id is not None and 0 <= signal_id < len(signal_letters):
             letter = signal_letters[signal_id]
             areas[letter] = area.area_points
-    
-    return JsonResponse({'area': areas})
+    return areas
 
 @csrf_exempt
 @require_POST
@@ -360,10 +539,19 @@ def json_serial(obj):
 
 def get_dashboard_analytics_data(request):
     try:
-        historical_data = analytics_thread.get_historical_traffic_trends(duration_minutes=60) 
+        # Polling clients pass the cursor from their last response and get only what changed
+        if 'since' in request.GET:
+            return encoded_response(request, get_analytics_since(request.GET['since'], get_analytics_cursors()))
+
+        compact = wants_compact(request)
+        historical_data = analytics_thread.get_historical_traffic_trends(duration_minutes=60, iso_timestamps=not compact)
         vehicle_distribution = analytics_thread.get_current_traffic_distribution_smoothed(window_seconds=30)
         avg_confidences = analytics_thread.get_current_signal_metadata()
         congestion_data = analytics_thread.get_current_congestion_data()
+        if compact:
+            return encoded_response(request, compact_analytics(
+                historical_data, vehicle_distribution, avg_confidences, congestion_data
+            ))
         response_data = {
             'timestamps': historical_data['timestamps'],
             'vehicle_counts': historical_data['vehicle_counts'],
@@ -373,7 +561,8 @@ def get_dashboard_analytics_data(request):
             'congestion_data': congestion_data,
         }
 
-        return JsonResponse(response_data, safe=False, json_dumps_params={'default': json_serial})
+        # Compressed when the client accepts gzip/br
+        return encoded_response(request, response_data, default=json_serial)
 
     except Exception as e:
         print(f"Error in get_dashboard_analytics_data view: {e}")
@@ -0,0 +1,154 @@
+import gzip
+import json
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+SCHEMA_VERSION = 1
+
+# Index order of the class-indexed count arrays; matches the detector's vehicle_classes
+VEHICLE_CLASSES = ('auto', 'bike', 'bus', 'car', 'emergency_vehicles', 'truck')
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+# Bodies smaller than this are sent uncompressed; the encoding overhead outweighs the saving
+MIN_COMPRESS_SIZE = 512
+
+
+def counts_to_array(counts):
+    """Vehicle type counts as a list indexed by VEHICLE_CLASSES"""
+    counts = counts or {}
+    return [counts.get(name, 0) for name in VEHICLE_CLASSES]
+
+
+def array_to_counts(array):
+    return {name: (array[i] if i < len(array) else 0) for i, name in enumerate(VEHICLE_CLASSES)}
+
+
+def detection_details(vehicle_count, traffic_weight, vehicle_type_counts, avg_confidence):
+    """Compact, versioned form of one detection result for DETECTION_UPDATE events"""
+    return {
+        'v': SCHEMA_VERSION,
+        'n': vehicle_count,
+        'w': round(traffic_weight, 2),
+        'q': round(avg_confidence, 3),
+        'c': counts_to_array(vehicle_type_counts),
+    }
+
+
+def read_detection_details(details):
+    """Detection result from a DETECTION_UPDATE event, in either the compact or the older verbose form"""
+    if details.get('v') is None:
+        return details
+    return {
+        'vehicle_count': details['n'],
+        'traffic_weight': details['w'],
+        'avg_confidence': details['q'],
+        'vehicle_type_counts': array_to_counts(details['c']),
+    }
+
+
+def compact_analytics(historical_data, vehicle_distribution, avg_confidences, congestion_data):
+    """Dashboard analytics with timestamps as second offsets from `t0` and per-signal arrays
+    instead of dicts; `historical_data` must hold datetimes, not ISO strings"""
+    timestamps = historical_data['timestamps']
+    t0 = timestamps[0].timestamp() if timestamps else None
+    signal_ids = sorted(congestion_data)
+    return {
+        'v': SCHEMA_VERSION,
+        't0': t0,
+        'dt': [round(ts.timestamp() - t0, 1) for ts in timestamps],
+        'vehicle_counts': historical_data['vehicle_counts'],
+        'green_times': historical_data['green_times'],
+        'vehicle_distribution': vehicle_distribution,
+        'avg_confidences': [round(c, 3) for c in avg_confidences],
+        'congestion': {
+            'signal_ids': signal_ids,
+            'level': [congestion_data[i]['level'] for i in signal_ids],
+            'score': [congestion_data[i]['score'] for i in signal_ids],
+            'color': [congestion_data[i]['color'] for i in signal_ids],
+        },
+    }
+
+
+def _accepted(header):
+    """{token: q} from an Accept or Accept-Encoding header"""
+    accepted = {}
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[token.strip().lower()] = q
+    return accepted
+
+
+def negotiate_format(accept):
+    """'msgpack' when the client asks for it and msgpack is installed, otherwise 'json'"""
+    accepted = _accepted(accept)
+    if MSGPACK_AVAILABLE and any(accepted.get(t, 0) > 0 for t in MSGPACK_TYPES):
+        return 'msgpack'
+    return 'json'
+
+
+def negotiate_encoding(accept_encoding):
+    """Best content encoding both sides support: 'br', 'gzip' or None"""
+    accepted = _accepted(accept_encoding)
+    if BROTLI_AVAILABLE and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def encode_body(data, data_format, default=None):
+    if data_format == 'msgpack':
+        return msgpack.packb(data, default=default, use_bin_type=True)
+    return json.dumps(data, default=default, separators=(',', ':')).encode('utf-8')
+
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def wants_compact(request):
+    """Whether to send the compact schema: msgpack clients and `?compact=1` requests get it,
+    plain JSON clients keep the verbose shape they already parse"""
+    return negotiate_format(request.headers.get('Accept')) == 'msgpack' or request.GET.get('compact') == '1'
+
+
+def encoded_response(request, data, default=None, status=200):
+    """Response in the format and content encoding the client negotiated (JSON by default)"""
+    data_format = negotiate_format(request.headers.get('Accept'))
+    body = encode_body(data, data_format, default)
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding')) if len(body) >= MIN_COMPRESS_SIZE else None
+    response = HttpResponse(
+        compress_body(body, encoding), status=status,
+        content_type=MSGPACK_TYPES[0] if data_format == 'msgpack' else 'application/json'
+    )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['X-Schema-Version'] = str(SCHEMA_VERSION)
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
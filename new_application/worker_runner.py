@@ -0,0 +1,104 @@
+import time
+import signal
+import threading
+
+from .models import TrafficSignal
+
+
+def worker_name(base, signal_ids=None):
+    """Name a worker publishes and logs under; workers pinned to some signals get their own"""
+    if signal_ids is None:
+        return base
+    return '-'.join([base] + [str(signal_id) for signal_id in sorted(signal_ids)])
+
+
+def parse_signal_ids(values):
+    """Signal ids from '--signals A,B' / '--signals 0 --signals 1' style values"""
+    signal_ids = set()
+    for value in values or []:
+        for part in str(value).split(','):
+            part = part.strip().upper()
+            if not part:
+                continue
+            if len(part) == 1 and 'A' <= part <= 'Z':
+                signal_ids.add(ord(part) - 65)
+            elif part.isdigit():
+                signal_ids.add(int(part))
+            else:
+                raise ValueError(f"Invalid signal '{part}': use a letter (A) or an id (0)")
+    return signal_ids
+
+
+def resolve_signal_ids(signals=None, junctions=None):
+    """Sorted signal ids named directly or through their junctions; None if neither was given"""
+    if not signals and not junctions:
+        return None
+    signal_ids = parse_signal_ids(signals)
+    if junctions:
+        junction_signals = TrafficSignal.objects.filter(junction_id__in=junctions).values_list('signal_id', flat=True)
+        signal_ids.update(junction_signals)
+    return sorted(signal_ids)
+
+
+class WorkerSupervisor:
+    """Runs a worker in the foreground of its own process.
+
+    The worker's threads (from `supervised_threads()`) are restarted if they die
+    while it is running. SIGTERM/SIGINT stop the worker through its `stop()`, which
+    drains buffered writes. If threads keep dying (more than `max_restarts` within
+    `restart_window` seconds) the worker is stopped and `run` returns False, so a
+    process manager can restart the whole process.
+    """
+
+    def __init__(self, worker, name, check_interval=2.0, max_restarts=5, restart_window=60.0):
+        self.worker = worker
+        self.name = name
+        self.check_interval = check_interval
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.restarts = []  # monotonic times of recent restarts
+        self.stopping = threading.Event()
+
+    def request_stop(self, signum=None, frame=None):
+        if self.stopping.is_set():
+            print(f"{self.name}: Already stopping, waiting for pending writes to drain...")
+        else:
+            print(f"{self.name}: Received {signal.Signals(signum).name if signum else 'stop'}, stopping...")
+        self.stopping.set()
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+
+    def check_threads(self):
+        """Restart dead worker threads; returns False once the restart budget is used up"""
+        if not self.worker.running:
+            return True
+        now = time.monotonic()
+        for attribute, target in self.worker.supervised_threads().items():
+            thread = getattr(self.worker, attribute, None)
+            if thread is None or thread.is_alive():
+                continue
+            self.restarts = [t for t in self.restarts if now - t < self.restart_window] + [now]
+            if len(self.restarts) > self.max_restarts:
+                print(f"{self.name}: {len(self.restarts)} thread restarts within {self.restart_window:.0f}s, giving up")
+                return False
+            print(f"⚠️ {self.name}: Thread {attribute} died, restarting it")
+            thread = threading.Thread(target=target, daemon=True, name=f"{self.name}-{attribute}")
+            setattr(self.worker, attribute, thread)
+            thread.start()
+        return True
+
+    def run(self):
+        """Start the worker and supervise it until stopped; returns False if it had to give up"""
+        self.install_signal_handlers()
+        self.worker.start()
+        print(f"✅ {self.name}: Running, threads checked every {self.check_interval:.0f}s")
+        healthy = True
+        while not self.stopping.wait(self.check_interval):
+            if not self.check_threads():
+                healthy = False
+                break
+        self.worker.stop()
+        print(f"{self.name}: Stopped{'' if healthy else ' after repeated thread crashes'}")
+        return healthy
@@ -0,0 +1,99 @@
+import numpy as np
+import cv2
+
+from .wire_format import VEHICLE_CLASSES
+
+ZONE_LANE = 'LANE'
+ZONE_STOP_LINE = 'STOP_LINE'
+ZONE_QUEUE_TAIL = 'QUEUE_TAIL'
+ZONE_OTHER = 'OTHER'
+ZONE_TYPE_CHOICES = [
+    (ZONE_LANE, 'Lane'),
+    (ZONE_STOP_LINE, 'Stop line'),
+    (ZONE_QUEUE_TAIL, 'Queue tail'),
+    (ZONE_OTHER, 'Other'),
+]
+
+# Zones of one approach share a label mask with one bit per zone
+MAX_ZONES = 32
+
+
+def mask_dtype(zone_count):
+    """Smallest unsigned type with a bit for every zone"""
+    if zone_count <= 8:
+        return np.uint8
+    if zone_count <= 16:
+        return np.uint16
+    return np.uint32
+
+
+def queue_spillback(zone_counts):
+    """True if any queue-tail zone of an approach is occupied"""
+    return any(zone.get('type') == ZONE_QUEUE_TAIL and zone.get('count', 0) > 0
+               for zone in (zone_counts or {}).values())
+
+
+class ZoneMask:
+    """Label mask of an approach's zones for one frame size.
+
+    Pixel values are bitmasks of the zones covering that pixel, so zones may
+    overlap (a stop-line zone inside a lane). Built once per zone set and frame
+    size; counting then costs one mask lookup per detection and a few matrix
+    products, however many zones there are.
+    """
+
+    def __init__(self, zones, width, height):
+        if len(zones) > MAX_ZONES:
+            raise ValueError(f"At most {MAX_ZONES} zones per approach, got {len(zones)}")
+        self.zones = zones  # [{'name', 'zone_type', 'points', optional 'lane_meters'}] in bit order
+        self.width = width
+        self.height = height
+        dtype = mask_dtype(len(zones))
+        self.labels = np.zeros((height, width), dtype=dtype)
+        layer = np.zeros((height, width), dtype=np.uint8)
+        for bit, zone in enumerate(zones):
+            layer[:] = 0
+            cv2.fillPoly(layer, [np.array(zone['points'], dtype=np.int32)], 1)
+            self.labels |= layer.astype(dtype) << dtype(bit)
+        self.bits = np.left_shift(np.ones(len(zones), dtype=dtype), np.arange(len(zones), dtype=dtype))
+
+    def labels_at(self, centers):
+        """Zone bitmask at each (x, y) centre; 0 outside the frame"""
+        points = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        xs = np.floor(points[:, 0]).astype(np.int64)
+        ys = np.floor(points[:, 1]).astype(np.int64)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        labels = np.zeros(len(points), dtype=self.labels.dtype)
+        labels[inside] = self.labels[ys[inside], xs[inside]]
+        return labels
+
+    def count(self, detections, class_weights):
+        """{zone name: type, count, weight, class-indexed counts and, if calibrated, vehicles per lane-metre}"""
+        class_counts = np.zeros((len(self.zones), len(VEHICLE_CLASSES)), dtype=np.int64)
+        weights = np.zeros(len(self.zones))
+        detections = [d for d in detections if d['class'] in VEHICLE_CLASSES]
+        if detections and self.zones:
+            membership = (self.labels_at([d['center'] for d in detections])[:, None] & self.bits) != 0
+            onehot = np.zeros((len(detections), len(VEHICLE_CLASSES)), dtype=np.int64)
+            onehot[np.arange(len(detections)), [VEHICLE_CLASSES.index(d['class']) for d in detections]] = 1
+            class_counts = membership.T.astype(np.int64) @ onehot
+            weights = class_counts @ np.array([class_weights.get(name, 1.0) for name in VEHICLE_CLASSES])
+        counts = {}
+        for i, zone in enumerate(self.zones):
+            counts[zone['name']] = {
+                'type': zone['zone_type'],
+                'count': int(class_counts[i].sum()),
+                'weight': round(float(weights[i]), 2),
+                'classes': class_counts[i].tolist(),
+            }
+            if zone.get('lane_meters'):
+                counts[zone['name']]['density'] = round(counts[zone['name']]['count'] / zone['lane_meters'], 4)
+        return counts
+
+    def draw(self, frame):
+        for zone in self.zones:
+            points = np.array(zone['points'], dtype=np.int32)
+            cv2.polylines(frame, [points], True, (255, 200, 0), 1)
+            cv2.putText(frame, zone['name'], (int(points[0][0]), int(points[0][1]) + 15),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 200, 0), 1)
+        return frame
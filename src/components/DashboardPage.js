@@ -1,9 +1,31 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import AreaSelectorVideo from "./dashboard/AreaSelectorVideo";
 import VideoSourceConfig from "./dashboard/VideoSourceConfig";
 import Settings from "./dashboard/Settings"; // Assuming you still use this
 import AnalyticsDashboard from "./dashboard/AnalyticsDashboard";
 
+// Longest series kept client-side while applying deltas (an hour of 1s polls)
+const MAX_ANALYTICS_POINTS = 3600;
+
+// Apply a since-cursor delta from /api/analytics/ to the analytics state
+const mergeAnalyticsDelta = (prev, delta) => {
+  const append = (series, points) => series.map((values, i) => [...(values || []), ...(points[i] || [])].slice(-MAX_ANALYTICS_POINTS));
+  const update = (values, changes) => {
+    const next = Array.isArray(values) ? [...values] : { ...values };
+    Object.entries(changes || {}).forEach(([idx, value]) => { next[idx] = value; });
+    return next;
+  };
+  return {
+    ...prev,
+    timestamps: [...prev.timestamps, ...delta.timestamps].slice(-MAX_ANALYTICS_POINTS),
+    vehicle_counts: append(prev.vehicle_counts, delta.vehicle_counts),
+    green_times: append(prev.green_times, delta.green_times),
+    vehicle_distribution: update(prev.vehicle_distribution, delta.changed.vehicle_distribution),
+    avg_confidences: update(prev.avg_confidences, delta.changed.avg_confidences),
+    congestion_data: update(prev.congestion_data, delta.changed.congestion_data),
+  };
+};
+
 const DashboardPage = ({ navigate }) => {
   const [signals, setSignals] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -39,6 +61,8 @@ const DashboardPage = ({ navigate }) => {
   });
   const [analyticsLoading, setAnalyticsLoading] = useState(false);
   const [analyticsError, setAnalyticsError] = useState(null);
+  // Cursor from the last analytics response; later polls only fetch what changed since
+  const analyticsCursor = useRef('');
 
   // --- NEW/MODIFIED FUNCTION: Fetch video source configurations from backend ---
   // This fetches ALL video paths and dimensions in one go
@@ -190,23 +214,28 @@ const DashboardPage = ({ navigate }) => {
   };
 
   const fetchAnalyticsData = useCallback(async () => {
-    setAnalyticsLoading(true);
+    const initial = analyticsCursor.current === '';
+    if (initial) setAnalyticsLoading(true);
     setAnalyticsError(null);
     try {
-      const response = await fetch('/api/analytics/');
+      const response = await fetch(`/api/analytics/?since=${encodeURIComponent(analyticsCursor.current)}`);
       if (!response.ok) throw new Error('Failed to fetch analytics data');
       const data = await response.json();
-      setAnalyticsData(data);
+      analyticsCursor.current = data.cursor;
+      setAnalyticsData(prev => (data.reset ? data : mergeAnalyticsDelta(prev, data)));
     } catch (error) {
       setAnalyticsError(error.message);
     } finally {
-      setAnalyticsLoading(false);
+      if (initial) setAnalyticsLoading(false);
     }
   }, []);
 
   useEffect(() => {
     if (showAnalytics) {
+      analyticsCursor.current = '';
       fetchAnalyticsData();
+      const interval = setInterval(fetchAnalyticsData, 1000);
+      return () => clearInterval(interval);
     }
   }, [showAnalytics, fetchAnalyticsData]);
 
@@ -40,6 +40,18 @@ const VideoSourceConfig = ({ onSave, onCancel, junctionId }) => {
     }
   };
 
+  const waitForIngest = async (statusUrl, signal) => {
+    for (;;) {
+      const response = await fetch(statusUrl);
+      const job = await response.json();
+      if (job.state === 'ready') return job;
+      if (job.state === 'failed' || !response.ok) {
+        throw new Error(job.error || `Processing failed for Signal ${signal}`);
+      }
+      await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleSave = async () => {
     const selectedFiles = Object.entries(videoFiles).filter(([_, file]) => file !== null);
     if (selectedFiles.length === 0) {
@@ -66,12 +78,12 @@ const VideoSourceConfig = ({ onSave, onCancel, junctionId }) => {
           method: 'POST',
           body: formData
         });
+        const job = await response.json();
         if (!response.ok) {
-          const errorData = await response.json();
-          throw new Error(errorData.error || `Upload failed for Signal ${signal}`);
+          throw new Error(job.error || `Upload failed for Signal ${signal}`);
         }
-        // Optionally, you could parse the response for a file path or URL
-        // For now, just use a local preview
+        // The server probes/transcodes in the background; wait until the source is live
+        await waitForIngest(job.status_url, signal);
         newSources[signal] = videoSources[signal];
       }
       setVideoSources(newSources);
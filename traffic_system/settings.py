@@ -95,12 +95,62 @@ WSGI_APPLICATION = 'traffic_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# The detection thread, the control thread and web requests all write concurrently.
+# Set TRAFFIC_DB_ENGINE=postgresql (or timescaledb) to use a server database; SQLite
+# remains the default and is tuned for concurrent access (WAL, busy timeout).
+
+DB_ENGINE = os.environ.get('TRAFFIC_DB_ENGINE', 'sqlite').lower()
+
+if DB_ENGINE in ('postgresql', 'postgres', 'timescaledb'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('TRAFFIC_DB_NAME', 'traffic_system'),
+            'USER': os.environ.get('TRAFFIC_DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('TRAFFIC_DB_PASSWORD', ''),
+            'HOST': os.environ.get('TRAFFIC_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('TRAFFIC_DB_PORT', '5432'),
+            # Persistent per-thread connections; each worker thread keeps its own
+            'CONN_MAX_AGE': int(os.environ.get('TRAFFIC_DB_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+
+    if os.environ.get('TRAFFIC_DB_PGBOUNCER', '0') == '1':
+        # Behind pgbouncer in transaction pooling mode: no server-side cursors and
+        # no long-lived client connections (pgbouncer does the pooling)
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+    elif os.environ.get('TRAFFIC_DB_POOL', '0') == '1':
+        # In-process psycopg 3 pool (needs psycopg[pool]); replaces persistent connections
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('TRAFFIC_DB_POOL_MIN', '2')),
+            'max_size': int(os.environ.get('TRAFFIC_DB_POOL_MAX', '10')),
+            'timeout': 10,
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # Wait for the write lock instead of failing with "database is locked"
+                'timeout': 20,
+                # Take the write lock at BEGIN so read-then-write transactions can't deadlock
+                'transaction_mode': 'IMMEDIATE',
+                # WAL lets readers (dashboard) run while a worker is writing
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA busy_timeout=20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA cache_size=-20000;'
+                ),
+            },
+        }
     }
-}
 
 
 # Password validation